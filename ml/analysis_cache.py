@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Analysis Cache
+Two-tier cache for text-analysis results: an in-process LRU in front of Redis
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from metrics import MetricsRegistry
+
+
+class AnalysisCache:
+    """Content-addressed cache of per-text analysis results
+
+    Keys are stable BLAKE2b digests of the analyzed content and the analyzer
+    version, so every process computes the same key for the same text.
+    Lookups go to the bounded local LRU first and only misses reach Redis,
+    batched into one MGET; writes to Redis are pipelined. Keys Redis did not
+    have are remembered for absent_ttl seconds, so a batch that looks its
+    keys up ahead of time (see get_many_async) does not pay for the same
+    misses again when it computes and stores them.
+    """
+
+    REDIS_PREFIX = 'analysis'
+
+    def __init__(self, redis_client=None, max_entries: int = 50000, ttl: int = 3600, absent_ttl: float = 10,
+                 logger: Optional[logging.Logger] = None, metrics: Optional[MetricsRegistry] = None):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.absent_ttl = absent_ttl
+        self.logger = logger or logging.getLogger('EmailPredictor')
+        metrics = metrics or MetricsRegistry()
+        self._hit_counter = metrics.cache_result('analysis', 'hit')
+        self._redis_hit_counter = metrics.cache_result('analysis', 'redis_hit')
+        self._miss_counter = metrics.cache_result('analysis', 'miss')
+        self._mget_timer = metrics.redis_call('analysis_mget')
+        self._write_timer = metrics.redis_call('analysis_write')
+
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self._absent: 'OrderedDict[str, float]' = OrderedDict()  # key -> monotonic expiry
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(version: str, *parts: str) -> str:
+        """Stable digest of an analyzer version and the content it analyzes"""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (version,) + parts:
+            encoded = (part or '').encode('utf-8', 'surrogatepass')
+            # Length prefixes keep ('ab', 'c') and ('a', 'bc') apart
+            digest.update(len(encoded).to_bytes(8, 'little'))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Return cached values for the keys found in either tier"""
+        found, remote, known_absent = self._lookup_local(keys)
+
+        values = None
+        if remote and self.redis:
+            try:
+                with self._mget_timer.time():
+                    values = self.redis.mget(self._redis_keys(remote))
+            except Exception as e:
+                self.logger.error(f"Error reading analysis cache from Redis: {e}")
+
+        return self._merge_remote(found, remote, values, known_absent)
+
+    async def get_many_async(self, keys: Iterable[str], client) -> Dict[str, Any]:
+        """get_many() with the Redis round trip awaited on a redis.asyncio client"""
+        found, remote, known_absent = self._lookup_local(keys)
+
+        values = None
+        if remote and client is not None:
+            try:
+                with self._mget_timer.time():
+                    values = await client.mget(self._redis_keys(remote))
+            except Exception as e:
+                self.logger.error(f"Error reading analysis cache from Redis: {e}")
+
+        return self._merge_remote(found, remote, values, known_absent)
+
+    def set(self, key: str, value: Any):
+        """Cache a value in both tiers"""
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, Any]):
+        """Cache several values, with one pipelined round trip to Redis"""
+        if not items:
+            return
+
+        with self._lock:
+            for key, value in items.items():
+                self._store(key, value)
+                self._absent.pop(key, None)
+
+        if self.redis:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, value in items.items():
+                    pipe.set(f"{self.REDIS_PREFIX}:{key}", json.dumps(value), ex=self.ttl)
+                with self._write_timer.time():
+                    pipe.execute()
+            except Exception as e:
+                self.logger.error(f"Error writing analysis cache to Redis: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Hit (local and Redis), miss and eviction counters"""
+        return {
+            'hits': self.hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+        }
+
+    def _lookup_local(self, keys: Iterable[str]):
+        """Local hits, the keys to ask Redis for, and how many keys are known to be absent"""
+        found: Dict[str, Any] = {}
+        remote: List[str] = []
+        known_absent = 0
+        now = time.monotonic()
+
+        with self._lock:
+            for key in keys:
+                if key in found:
+                    continue
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = value
+                    self.hits += 1
+                elif self._absent.get(key, 0) > now:
+                    known_absent += 1
+                else:
+                    remote.append(key)
+        return found, remote, known_absent
+
+    def _merge_remote(self, found: Dict[str, Any], remote: List[str], values: Optional[List],
+                      known_absent: int) -> Dict[str, Any]:
+        """Fold an MGET reply into found, recording hits, misses and absent keys"""
+        local_hits = len(found)
+        expires = time.monotonic() + self.absent_ttl
+        with self._lock:
+            for key, raw in zip(remote, values or ()):
+                if raw is not None:
+                    found[key] = json.loads(raw)
+                    self._store(key, found[key])
+                    self.hits += 1
+                    self.redis_hits += 1
+                elif self.absent_ttl:
+                    self._absent[key] = expires
+                    self._absent.move_to_end(key)
+            while len(self._absent) > self.max_entries:
+                self._absent.popitem(last=False)
+
+            misses = sum(1 for key in remote if key not in found) + known_absent
+            self.misses += misses
+
+        self._hit_counter.inc(local_hits)
+        self._redis_hit_counter.inc(len(found) - local_hits)
+        self._miss_counter.inc(misses)
+        return found
+
+    def _redis_keys(self, keys: List[str]) -> List[str]:
+        return [f"{self.REDIS_PREFIX}:{key}" for key in keys]
+
+    def _store(self, key: str, value: Any):
+        """Insert into the local LRU, evicting the least recently used entries"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
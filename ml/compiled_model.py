@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Compiled Models
+Exports fitted sklearn classifiers to flat NumPy arrays for low-latency scoring
+"""
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class CompiledModel:
+    """Pure-NumPy predict_proba for a fitted classifier
+
+    Forests and gradient boosting become one concatenated node table walked
+    level by level for all trees at once; logistic regression and MLPs become
+    weight matrices with the StandardScaler folded into the first layer, so
+    raw (unscaled) feature rows go straight in. Everything lives in plain
+    arrays, so a compiled model pickles and loads without sklearn.
+
+    Tree exports can also be compacted: max_depth turns the nodes at that
+    depth into leaves holding their subtree's mean value, and quantize
+    stores leaf values as uint16 steps between their minimum and maximum.
+    Both change predictions slightly; thresholds are always float32, which
+    does not (see _node_table).
+    """
+
+    # Rows scored per pass, bounding the (rows x trees) traversal state
+    CHUNK_ROWS = 4096
+
+    def __init__(self, arrays: Dict[str, Any]):
+        self.arrays = arrays
+        self.kind = arrays['kind']
+        # Boosting stores one value per node; this adds each tree into its output
+        tree_output = arrays.get('tree_output')
+        self._outputs = None if tree_output is None else np.eye(len(arrays['bias']))[tree_output]
+
+    @property
+    def node_count(self) -> int:
+        """Nodes across all trees, 0 for layer models"""
+        return len(self.arrays['feature']) if self.kind == 'trees' else 0
+
+    @classmethod
+    def compile(cls, model, scaler=None, max_depth: Optional[int] = None,
+                quantize: bool = False) -> Optional['CompiledModel']:
+        """Export a fitted model, or return None for unsupported estimators
+
+        max_depth and quantize only apply to tree models.
+        """
+        name = type(model).__name__
+        if name == 'RandomForestClassifier':
+            arrays = cls._compile_forest(model, max_depth, quantize)
+        elif name == 'GradientBoostingClassifier':
+            arrays = cls._compile_boosting(model, max_depth, quantize)
+        elif name == 'LogisticRegression':
+            arrays = cls._compile_linear(model, scaler)
+        elif name == 'MLPClassifier':
+            arrays = cls._compile_mlp(model, scaler)
+        else:
+            return None
+
+        # Tree models are never scaled, so a scaler can only be folded into weights
+        if scaler is not None and arrays['kind'] == 'trees':
+            return None
+        return cls(arrays)
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """Class probabilities for raw feature rows, in the model's class order"""
+        features = np.atleast_2d(features)
+        if len(features) > self.CHUNK_ROWS:
+            return np.vstack([
+                self.predict_proba(features[start:start + self.CHUNK_ROWS])
+                for start in range(0, len(features), self.CHUNK_ROWS)
+            ])
+
+        if self.kind == 'trees':
+            raw = self._score_trees(features)
+        else:
+            raw = self._score_layers(features)
+        return self._link(raw, self.arrays['link'])
+
+    # ------------------------------------------------------------------ trees
+
+    @classmethod
+    def _compile_forest(cls, model, max_depth: Optional[int], quantize: bool) -> Dict[str, Any]:
+        trees = []
+        for estimator in model.estimators_:
+            value = estimator.tree_.value[:, 0, :].astype(np.float64)
+            # Older sklearn stores class counts; probabilities are the normalized rows
+            value = value / np.maximum(value.sum(axis=1, keepdims=True), 1e-300)
+            trees.append((estimator.tree_, value))
+
+        arrays = cls._node_table(trees, len(model.classes_), max_depth, quantize)
+        arrays.update({
+            'bias': np.zeros(len(model.classes_)),
+            'scale': 1.0 / len(model.estimators_),
+            'link': 'identity',
+        })
+        return arrays
+
+    @classmethod
+    def _compile_boosting(cls, model, max_depth: Optional[int], quantize: bool) -> Dict[str, Any]:
+        n_outputs = model.estimators_.shape[1]
+        trees, tree_output = [], []
+        for stage in model.estimators_:
+            for output, estimator in enumerate(stage):
+                # Each regression tree adds learning_rate * leaf value to one output
+                trees.append((estimator.tree_, estimator.tree_.value[:, 0, :1] * model.learning_rate))
+                tree_output.append(output)
+
+        arrays = cls._node_table(trees, 1, max_depth, quantize)
+        if n_outputs > 1:
+            arrays['tree_output'] = np.asarray(tree_output, dtype=np.int32)
+        bias = model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0]
+        arrays.update({
+            'bias': np.asarray(bias, dtype=np.float64),
+            'scale': 1.0,
+            'link': 'softmax' if n_outputs > 1 else 'sigmoid',
+        })
+        return arrays
+
+    @classmethod
+    def _node_table(cls, trees, n_outputs: int, max_depth: Optional[int] = None,
+                    quantize: bool = False) -> Dict[str, Any]:
+        """Concatenate trees into one table; leaves point to themselves"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        table_depth = 0
+        for tree, value in trees:
+            depth = cls._node_depths(tree)
+            cap = tree.max_depth if max_depth is None else min(max_depth, tree.max_depth)
+            if cap < tree.max_depth:
+                value = cls._subtree_means(tree, value, depth, cap)
+            # Nodes are numbered depth-first, so dropping deeper nodes keeps subtrees contiguous
+            kept = depth <= cap
+            new_ids = np.cumsum(kept, dtype=np.int32) - 1 + offset
+            is_leaf = (tree.children_left == -1)[kept] | (depth[kept] == cap)
+            node_ids = new_ids[kept]
+
+            features.append(np.where(is_leaf, 0, tree.feature[kept]).astype(np.int32))
+            thresholds.append(tree.threshold[kept])
+            lefts.append(np.where(is_leaf, node_ids, new_ids[np.maximum(tree.children_left[kept], 0)]))
+            rights.append(np.where(is_leaf, node_ids, new_ids[np.maximum(tree.children_right[kept], 0)]))
+            values.append(value.reshape(tree.node_count, n_outputs)[kept])
+            roots.append(offset)
+
+            table_depth = max(table_depth, cap)
+            offset += len(node_ids)
+
+        # Scoring compares float32 features, as sklearn does; rounding each threshold
+        # down to the nearest float32 keeps every comparison's outcome unchanged
+        threshold = np.concatenate(thresholds)
+        rounded = threshold.astype(np.float32)
+        over = rounded > threshold
+        rounded[over] = np.nextafter(rounded[over], np.float32(-np.inf))
+
+        arrays = {
+            'kind': 'trees',
+            'feature': np.concatenate(features),
+            'threshold': rounded,
+            # children[2 * node + went_left] = (right, left) child
+            'children': np.stack([np.concatenate(rights), np.concatenate(lefts)], axis=1).ravel().astype(np.int32),
+            'value': np.concatenate(values).astype(np.float64),
+            'roots': np.asarray(roots, dtype=np.int32),
+            'max_depth': int(table_depth),
+        }
+        if quantize:
+            arrays.update(cls._quantize(arrays['value']))
+        return arrays
+
+    @staticmethod
+    def _node_depths(tree) -> np.ndarray:
+        depth = np.zeros(tree.node_count, dtype=np.int32)
+        frontier = np.zeros(1, dtype=np.intp)
+        level = 0
+        while len(frontier):
+            depth[frontier] = level
+            children = np.concatenate([tree.children_left[frontier], tree.children_right[frontier]])
+            frontier = children[children != -1]
+            level += 1
+        return depth
+
+    @staticmethod
+    def _subtree_means(tree, value: np.ndarray, depth: np.ndarray, cap: int) -> np.ndarray:
+        """Give the nodes at depth cap the sample-weighted mean of their leaves
+
+        Boosting only fits leaf values, so inner nodes are rebuilt bottom-up
+        from their children; for forests this reproduces the node's class
+        distribution.
+        """
+        value = np.array(value, dtype=np.float64).reshape(tree.node_count, -1)
+        weights = tree.weighted_n_node_samples
+        inner = np.flatnonzero(tree.children_left != -1)
+        for level in range(tree.max_depth - 1, cap - 1, -1):
+            nodes = inner[depth[inner] == level]
+            left, right = tree.children_left[nodes], tree.children_right[nodes]
+            left_weight, right_weight = weights[left][:, None], weights[right][:, None]
+            value[nodes] = (left_weight * value[left] + right_weight * value[right]) / np.maximum(
+                left_weight + right_weight, 1e-300
+            )
+        return value
+
+    @staticmethod
+    def _quantize(value: np.ndarray) -> Dict[str, Any]:
+        """uint16 steps between the smallest and largest value; value = offset + step * q"""
+        low, high = float(value.min()), float(value.max())
+        step = (high - low) / 65535 if high > low else 1.0
+        return {
+            'value': np.rint((value - low) / step).astype(np.uint16),
+            'value_offset': low,
+            'value_step': step,
+        }
+
+    def _score_trees(self, features: np.ndarray) -> np.ndarray:
+        arrays = self.arrays
+        # Exports made before thresholds were float32 promote the comparison to float64
+        features = np.asarray(features, dtype=np.float32)
+        n_rows, n_features = features.shape
+        roots = arrays['roots']
+
+        # One flat walk per (row, tree) pair, all advanced one level per step
+        flat_features = features.ravel()
+        row_offsets = np.repeat(np.arange(n_rows) * n_features, len(roots))
+        nodes = np.tile(roots, n_rows)
+        feature, threshold, children = arrays['feature'], arrays['threshold'], arrays['children']
+        for depth in range(arrays['max_depth']):
+            go_left = np.take(flat_features, row_offsets + np.take(feature, nodes)) <= np.take(threshold, nodes)
+            next_nodes = np.take(children, 2 * nodes + go_left)
+            # Leaves point to themselves; stop once every walk has reached one
+            if depth % 4 == 3 and np.array_equal(next_nodes, nodes):
+                break
+            nodes = next_nodes
+
+        leaf_values = np.take(arrays['value'], nodes, axis=0).reshape(n_rows, len(roots), -1)
+        if 'value_step' in arrays:
+            leaf_values = arrays['value_offset'] + arrays['value_step'] * leaf_values
+        if self._outputs is not None:
+            totals = leaf_values[:, :, 0] @ self._outputs
+        else:
+            totals = leaf_values.sum(axis=1)
+        return arrays['bias'] + arrays['scale'] * totals
+
+    # ----------------------------------------------------------------- layers
+
+    @staticmethod
+    def _fold_scaler(weights: np.ndarray, intercept: np.ndarray, scaler):
+        """Rewrite a first layer so it takes unscaled inputs: x -> (x - mean) / scale"""
+        if scaler is None:
+            return weights, intercept
+        mean = scaler.mean_ if getattr(scaler, 'mean_', None) is not None else np.zeros(weights.shape[0])
+        scale = scaler.scale_ if getattr(scaler, 'scale_', None) is not None else np.ones(weights.shape[0])
+        folded = weights / scale[:, None]
+        return folded, intercept - (mean / scale) @ weights
+
+    @classmethod
+    def _compile_linear(cls, model, scaler) -> Dict[str, Any]:
+        weights, intercept = cls._fold_scaler(
+            model.coef_.T.astype(np.float64), model.intercept_.astype(np.float64), scaler
+        )
+        if weights.shape[1] == 1:
+            link = 'sigmoid'
+        elif getattr(model, 'multi_class', 'auto') == 'ovr':
+            link = 'ovr'
+        else:
+            link = 'softmax'
+        return {
+            'kind': 'layers',
+            'weights': [weights],
+            'intercepts': [intercept],
+            'activation': 'identity',
+            'link': link,
+        }
+
+    @classmethod
+    def _compile_mlp(cls, model, scaler) -> Dict[str, Any]:
+        weights = [w.astype(np.float64) for w in model.coefs_]
+        intercepts = [b.astype(np.float64) for b in model.intercepts_]
+        weights[0], intercepts[0] = cls._fold_scaler(weights[0], intercepts[0], scaler)
+        return {
+            'kind': 'layers',
+            'weights': weights,
+            'intercepts': intercepts,
+            'activation': model.activation,
+            'link': 'softmax' if model.out_activation_ == 'softmax' else 'sigmoid',
+        }
+
+    def _score_layers(self, features: np.ndarray) -> np.ndarray:
+        arrays = self.arrays
+        hidden = np.asarray(features, dtype=np.float64)
+        last = len(arrays['weights']) - 1
+        for layer, (weights, intercept) in enumerate(zip(arrays['weights'], arrays['intercepts'])):
+            hidden = hidden @ weights + intercept
+            if layer < last:
+                hidden = self._activate(hidden, arrays['activation'])
+        return hidden
+
+    @staticmethod
+    def _activate(values: np.ndarray, activation: str) -> np.ndarray:
+        if activation == 'relu':
+            return np.maximum(values, 0)
+        if activation == 'tanh':
+            return np.tanh(values)
+        if activation == 'logistic':
+            return 1.0 / (1.0 + np.exp(-values))
+        return values
+
+    # ------------------------------------------------------------------- link
+
+    @staticmethod
+    def _link(raw: np.ndarray, link: str) -> np.ndarray:
+        if link == 'identity':
+            return raw
+        if link == 'sigmoid':
+            positive = 1.0 / (1.0 + np.exp(-raw[:, :1]))
+            return np.hstack([1.0 - positive, positive])
+        if link == 'ovr':
+            scores = 1.0 / (1.0 + np.exp(-raw))
+            return scores / scores.sum(axis=1, keepdims=True)
+        shifted = np.exp(raw - raw.max(axis=1, keepdims=True))
+        return shifted / shifted.sum(axis=1, keepdims=True)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Database Connection Pool
+Bounded pool of MySQL connections shared by the predictor's threads, with
+health checks on checkout and automatic reconnect
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Optional, Sequence
+
+from metrics import MetricsRegistry
+
+# MySQL client errors meaning the connection itself is gone
+DISCONNECT_ERRNOS = {
+    2006,  # server has gone away
+    2013,  # lost connection during query
+    2055,  # lost connection (system error)
+}
+
+
+def is_disconnect(error: Exception) -> bool:
+    """Whether an error means the connection is unusable, rather than a bad query"""
+    if getattr(error, 'errno', None) in DISCONNECT_ERRNOS:
+        return True
+    # The connector raises these without an errno when the socket is already closed
+    return type(error).__name__ in ('InterfaceError', 'OperationalError') and getattr(error, 'errno', None) in (None, -1)
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the checkout timeout"""
+
+
+class DatabasePool:
+    """Thread-safe pool of at most `size` connections made by `connect`
+
+    Connections are created on demand and reused most-recently-used first.
+    One idle longer than `health_check_interval` seconds is pinged (with
+    reconnect) before it is handed out, so connections dropped by the
+    server's wait_timeout during a long training run are replaced instead of
+    failing the next query. A thread that already holds a connection gets
+    the same one back from a nested checkout, so helpers can take a
+    connection without deadlocking a caller that holds the last one.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int = 8, timeout: float = 30,
+                 health_check_interval: float = 30, retries: int = 2,
+                 logger: Optional[logging.Logger] = None, metrics: Optional[MetricsRegistry] = None):
+        self.connect = connect
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.retries = retries
+        self.logger = logger or logging.getLogger('EmailPredictor')
+
+        metrics = metrics or MetricsRegistry()
+        self._wait_timer = metrics.histogram('db_pool_wait_seconds', 'Time waiting for a pooled database connection')
+        self._reconnects = metrics.counter('db_reconnects_total', 'Database connections replaced after a failure')
+
+        self._idle = deque()  # (connection, last_used)
+        self._created = 0
+        self._available = threading.Condition()
+        self._local = threading.local()
+        self._closed = False
+
+    @contextmanager
+    def connection(self):
+        """Check out a healthy connection for the duration of the block"""
+        held = getattr(self._local, 'connection', None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        connection = self._checkout()
+        self._local.connection, self._local.depth = connection, 0
+        broken = False
+        try:
+            yield connection
+        except Exception as e:
+            broken = is_disconnect(e)
+            raise
+        finally:
+            self._local.connection = None
+            self._checkin(connection, broken)
+
+    @contextmanager
+    def dedicated(self):
+        """Check out a connection that nested checkouts on this thread will not share
+
+        For long-lived streaming reads, which leave the connection unusable
+        for other statements until the result is fully read. A block left
+        early (an error, or an abandoned generator) may leave a result
+        unread, so the connection is then closed instead of reused.
+        """
+        connection = self._checkout()
+        completed = False
+        try:
+            yield connection
+            completed = True
+        finally:
+            if completed:
+                self._checkin(connection, broken=False)
+            else:
+                self._discard(connection)
+
+    def query(self, sql: str, params: Sequence = (), dictionary: bool = False, fetch: Optional[str] = 'all',
+              timer=None):
+        """Run one statement and return fetchall() rows, fetchone() or None (fetch='all'|'one'|None)
+
+        A statement that fails because the connection dropped is retried on
+        a fresh connection, unless the calling thread already held one.
+        """
+        attempt = 0
+        while True:
+            nested = getattr(self._local, 'connection', None) is not None
+            try:
+                with self.connection() as connection:
+                    cursor = connection.cursor(dictionary=dictionary)
+                    try:
+                        if timer is not None:
+                            with timer.time():
+                                return self._run(cursor, sql, params, fetch)
+                        return self._run(cursor, sql, params, fetch)
+                    finally:
+                        cursor.close()
+            except Exception as e:
+                if nested or attempt >= self.retries or not is_disconnect(e):
+                    raise
+                attempt += 1
+                self.logger.warning(f"Database connection lost ({e}); retrying ({attempt}/{self.retries})")
+
+    def stats(self) -> dict:
+        with self._available:
+            return {'size': self.size, 'open': self._created, 'idle': len(self._idle)}
+
+    def close(self):
+        """Close idle connections; connections in use close when returned"""
+        with self._available:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._created -= len(idle)
+            self._available.notify_all()
+        for connection, _ in idle:
+            self._close(connection)
+
+    @staticmethod
+    def _run(cursor, sql: str, params: Sequence, fetch: Optional[str]):
+        cursor.execute(sql, params)
+        if fetch == 'all':
+            return cursor.fetchall()
+        if fetch == 'one':
+            return cursor.fetchone()
+        return None
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        with self._wait_timer.time(), self._available:
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    raise PoolTimeout(f"No database connection free after {self.timeout}s (pool size {self.size})")
+                self._available.wait(remaining)
+            if self._idle:
+                connection, last_used = self._idle.pop()
+            else:
+                connection, last_used = None, None
+                self._created += 1
+
+        try:
+            if connection is None:
+                return self.connect()
+            if time.monotonic() - last_used > self.health_check_interval and not self._healthy(connection):
+                self._reconnects.inc()
+                self._close(connection)
+                return self.connect()
+            return connection
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _checkin(self, connection, broken: bool):
+        if broken or self._closed:
+            if broken:
+                self._reconnects.inc()
+            self._discard(connection)
+            return
+        with self._available:
+            self._idle.append((connection, time.monotonic()))
+            self._available.notify()
+
+    def _discard(self, connection):
+        self._close(connection)
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _healthy(self, connection) -> bool:
+        try:
+            connection.ping(reconnect=True, attempts=2, delay=0.5)
+            return True
+        except Exception as e:
+            self.logger.warning(f"Replacing unhealthy database connection: {e}")
+            return False
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
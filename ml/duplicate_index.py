@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Near-Duplicate Index
+SimHash fingerprints of normalized subject/body shingles, indexed with LSH
+bands, so copies of bulk mail can reuse one stored prediction
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import MetricsRegistry
+
+_PRIME = np.uint64(0x100000001B3)
+# Word tokens: ASCII word characters and any non-ASCII UTF-8 byte, so accented words stay whole
+_TOKEN_RE = re.compile(rb'[\w\x80-\xff]+')
+_DIGITS_RE = re.compile(rb'\d+')
+# Distinct starting values keep subject and body shingles apart
+_SUBJECT_SALT, _BODY_SALT = 0x5B, 0xB0
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: spreads 32-bit token hashes over all 64 bits (array arithmetic wraps silently)"""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+class DuplicateIndex:
+    """Bounded map from near-duplicate email clusters to a stored value
+
+    An email's fingerprint is the 64-bit SimHash of its word shingles
+    (subject and body shingled separately from their first max_chars,
+    digits collapsed so order numbers and dates do not matter). Two emails
+    are near-duplicates when their fingerprints differ in at most
+    max_distance bits. The fingerprint
+    is split into max_distance + 1 bands, so any such pair shares at least
+    one whole band and a lookup only compares against that band's bucket.
+
+    Entries live in a scope (user and model version), are kept in a
+    bounded local LRU and, with a Redis client, also under one Redis key per
+    band with a TTL, so other processes find them with a single MGET.
+    """
+
+    REDIS_PREFIX = 'duplicate'
+
+    def __init__(self, redis_client=None, max_entries: int = 100000, max_distance: int = 3, shingle_size: int = 3,
+                 max_chars: int = 2000, ttl: int = 86400, logger: Optional[logging.Logger] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.shingle_size = shingle_size
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger('EmailPredictor')
+        metrics = metrics or MetricsRegistry()
+        self._hit_counter = metrics.cache_result('duplicate', 'hit')
+        self._redis_hit_counter = metrics.cache_result('duplicate', 'redis_hit')
+        self._miss_counter = metrics.cache_result('duplicate', 'miss')
+        self._mget_timer = metrics.redis_call('duplicate_mget')
+        self._write_timer = metrics.redis_call('duplicate_write')
+
+        self.bands = max_distance + 1
+        self._band_bits = -(-64 // self.bands)
+        self._entries: 'OrderedDict[Tuple[str, int], Any]' = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, int], List[int]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def fingerprint(self, subject: str, body: str) -> int:
+        """64-bit SimHash of the email's shingles"""
+        return self.fingerprints([(subject, body)])[0]
+
+    def fingerprints(self, emails: List[Tuple[str, str]]) -> List[int]:
+        """fingerprint() for many (subject, body) pairs, tokenized, hashed and counted in one vectorized pass"""
+        # Tokens are runs of word bytes of the lowercased UTF-8 text, every run of digits collapsed to '0'
+        fields = [
+            _TOKEN_RE.findall(_DIGITS_RE.sub(b'0', (text or '')[:self.max_chars].lower().encode('utf-8', 'surrogatepass')))
+            for pair in emails for text in pair
+        ]
+        counts = [len(tokens) for tokens in fields]
+        if not sum(counts):
+            return [0] * len(emails)
+        tokens = np.fromiter(map(zlib.crc32, itertools.chain.from_iterable(fields)), dtype=np.uint64, count=sum(counts))
+        token_fields = np.repeat(np.arange(len(fields)), counts)
+
+        # Shingles are windows of shingle_size tokens that stay inside one field;
+        # a field with fewer tokens is one shingle padded with zeros
+        width = self.shingle_size
+        padded = np.concatenate((tokens, np.zeros(width, dtype=np.uint64)))
+        padded_fields = np.concatenate((token_fields, np.full(width, -1)))
+        first = np.empty(len(tokens), dtype=bool)
+        first[0] = True
+        np.not_equal(token_fields[1:], token_fields[:-1], out=first[1:])
+        full = padded_fields[width - 1:width - 1 + len(tokens)] == token_fields
+        starts = np.flatnonzero(full | first)
+        shingles = np.where(token_fields[starts] % 2, np.uint64(_BODY_SALT), np.uint64(_SUBJECT_SALT))
+        for step in range(width):
+            window = np.where(padded_fields[starts + step] == token_fields[starts], padded[starts + step], np.uint64(0))
+            shingles = _mix(shingles * _PRIME ^ window)
+
+        # SimHash: bit b is set when most of the email's shingles have it set
+        owners = token_fields[starts] // 2
+        totals = np.bincount(owners, minlength=len(emails))
+        packed = np.zeros(len(emails), dtype=np.uint64)
+        if len(emails) == 1:
+            bits = np.unpackbits(shingles.astype('<u8').view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+            ones = bits.sum(axis=0)[None, :]
+            packed[:] = np.packbits(ones * 2 > totals[0], axis=1, bitorder='little').view('<u8')[:, 0]
+        else:
+            # One bit at a time: 64 contiguous 1-D sums beat one over an unpacked (shingles x 64) matrix
+            present = np.flatnonzero(totals)
+            group_starts = np.searchsorted(owners, present)
+            for bit in range(64):
+                ones = np.add.reduceat((shingles >> np.uint64(bit) & np.uint64(1)).astype(np.int32), group_starts)
+                packed[present] |= (ones * 2 > totals[present]).astype(np.uint64) << np.uint64(bit)
+        return [int(value) for value in packed]
+
+    def find(self, scope: str, fingerprint: int) -> Optional[Any]:
+        """Value stored for a near-duplicate of fingerprint in scope, or None"""
+        return self.find_many([(scope, fingerprint)])[0]
+
+    def find_many(self, keys: List[Tuple[str, int]]) -> List[Optional[Any]]:
+        """find() for several (scope, fingerprint) pairs, with one Redis round trip for the local misses"""
+        values: List[Optional[Any]] = [None] * len(keys)
+        with self._lock:
+            for position, (scope, fingerprint) in enumerate(keys):
+                values[position] = self._find_local(scope, fingerprint)
+            local_hits = sum(value is not None for value in values)
+            self.hits += local_hits
+        self._hit_counter.inc(local_hits)
+
+        remote = [position for position, value in enumerate(values) if value is None]
+        if remote and self.redis:
+            for position, value in zip(remote, self._find_remote([keys[position] for position in remote])):
+                values[position] = value
+
+        redis_hits = sum(values[position] is not None for position in remote)
+        with self._lock:
+            for position in remote:
+                if values[position] is not None:
+                    self._store(*keys[position], values[position])
+            self.redis_hits += redis_hits
+            self.misses += len(remote) - redis_hits
+        self._redis_hit_counter.inc(redis_hits)
+        self._miss_counter.inc(len(remote) - redis_hits)
+        return values
+
+    def add(self, scope: str, fingerprint: int, value: Any):
+        """Store a value for fingerprint's cluster"""
+        self.add_many([(scope, fingerprint, value)])
+
+    def add_many(self, items: List[Tuple[str, int, Any]]):
+        """Store several (scope, fingerprint, value) entries, with one pipelined write to Redis"""
+        if not items:
+            return
+        with self._lock:
+            for scope, fingerprint, value in items:
+                self._store(scope, fingerprint, value)
+
+        if self.redis:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for scope, fingerprint, value in items:
+                    payload = json.dumps({'fingerprint': fingerprint, 'value': value}, default=float)
+                    for key in self._redis_keys(scope, fingerprint):
+                        pipe.set(key, payload, ex=self.ttl)
+                with self._write_timer.time():
+                    pipe.execute()
+            except Exception as e:
+                self.logger.error(f"Error writing duplicate index to Redis: {e}")
+
+    def cluster(self, keys: List[Tuple[str, int]]) -> List[int]:
+        """For each (scope, fingerprint), the position of the first key it is a near-duplicate of
+
+        A key that matches no earlier one leads its own cluster and maps to
+        itself. Nothing is stored, so a batch can be grouped before lookup.
+        """
+        buckets: Dict[Tuple[str, int, int], List[int]] = {}
+        leaders = []
+        for position, (scope, fingerprint) in enumerate(keys):
+            bands = self._bands(fingerprint)
+            leader = next((
+                candidate
+                for band, value in enumerate(bands)
+                for candidate in buckets.get((scope, band, value), ())
+                if bin(keys[candidate][1] ^ fingerprint).count('1') <= self.max_distance
+            ), position)
+            if leader == position:
+                for band, value in enumerate(bands):
+                    buckets.setdefault((scope, band, value), []).append(position)
+            leaders.append(leader)
+        return leaders
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            'hits': self.hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+        }
+
+    def _bands(self, fingerprint: int) -> List[int]:
+        mask = (1 << self._band_bits) - 1
+        return [(fingerprint >> (band * self._band_bits)) & mask for band in range(self.bands)]
+
+    def _find_local(self, scope: str, fingerprint: int) -> Optional[Any]:
+        exact = self._entries.get((scope, fingerprint))
+        if exact is not None:
+            self._entries.move_to_end((scope, fingerprint))
+            return exact
+        for band, value in enumerate(self._bands(fingerprint)):
+            for candidate in self._buckets.get((scope, band, value), ()):
+                if bin(candidate ^ fingerprint).count('1') <= self.max_distance:
+                    self._entries.move_to_end((scope, candidate))
+                    return self._entries[(scope, candidate)]
+        return None
+
+    def _find_remote(self, keys: List[Tuple[str, int]]) -> List[Optional[Any]]:
+        """Values for keys from Redis, reading every band key of every fingerprint in one MGET"""
+        try:
+            with self._mget_timer.time():
+                payloads = self.redis.mget([
+                    redis_key for scope, fingerprint in keys for redis_key in self._redis_keys(scope, fingerprint)
+                ])
+        except Exception as e:
+            self.logger.error(f"Error reading duplicate index from Redis: {e}")
+            return [None] * len(keys)
+
+        values: List[Optional[Any]] = []
+        for position, (_, fingerprint) in enumerate(keys):
+            value = None
+            for payload in payloads[position * self.bands:(position + 1) * self.bands]:
+                try:
+                    entry = json.loads(payload) if payload is not None else None
+                except ValueError:
+                    entry = None
+                if entry is not None and bin(entry['fingerprint'] ^ fingerprint).count('1') <= self.max_distance:
+                    value = entry['value']
+                    break
+            values.append(value)
+        return values
+
+    def _redis_keys(self, scope: str, fingerprint: int) -> List[str]:
+        scope_digest = hashlib.blake2b(scope.encode('utf-8'), digest_size=8).hexdigest()
+        return [
+            f"{self.REDIS_PREFIX}:{scope_digest}:{band}:{value:x}"
+            for band, value in enumerate(self._bands(fingerprint))
+        ]
+
+    def _store(self, scope: str, fingerprint: int, value: Any):
+        key = (scope, fingerprint)
+        if key not in self._entries:
+            for band, band_value in enumerate(self._bands(fingerprint)):
+                self._buckets.setdefault((scope, band, band_value), []).append(fingerprint)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            (old_scope, old_fingerprint), _ = self._entries.popitem(last=False)
+            for band, band_value in enumerate(self._bands(old_fingerprint)):
+                bucket_key = (old_scope, band, band_value)
+                bucket = self._buckets.get(bucket_key)
+                if bucket is not None:
+                    bucket.remove(old_fingerprint)
+                    if not bucket:
+                        del self._buckets[bucket_key]
+            self.evictions += 1
@@ -7,71 +7,223 @@ Implements sophisticated ML models for email behavior prediction and optimizatio
 import os
 import sys
 import json
+import contextlib
+import copy
+import hashlib
+import importlib.util
 import numpy as np
 import pandas as pd
-import pickle
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional, Any
+import multiprocessing
+import multiprocessing.connection
+import random
+import shutil
+import threading
+import tempfile
+import time
+from datetime import datetime
+from email.utils import parseaddr
+from typing import Dict, Iterator, List, Tuple, Optional, Any, TYPE_CHECKING
 import warnings
 warnings.filterwarnings('ignore')
 
-# ML Libraries
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.neural_network import MLPClassifier
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.pipeline import Pipeline
+# ML Libraries; estimators are imported where they are first used, so
+# actions that never train (predict, evaluate, serve) do not pay for them
 import joblib
 
-# Deep Learning
-try:
-    import tensorflow as tf
-    from tensorflow.keras.models import Sequential, Model
-    from tensorflow.keras.layers import Dense, LSTM, Embedding, Dropout, Attention
-    from tensorflow.keras.preprocessing.text import Tokenizer
-    from tensorflow.keras.preprocessing.sequence import pad_sequences
-    TENSORFLOW_AVAILABLE = True
-except ImportError:
-    TENSORFLOW_AVAILABLE = False
+if TYPE_CHECKING:
+    from sklearn.preprocessing import StandardScaler
 
-# NLP Libraries
-try:
-    import spacy
-    import nltk
-    from transformers import pipeline, AutoTokenizer, AutoModel
-    NLP_AVAILABLE = True
-except ImportError:
-    NLP_AVAILABLE = False
+
+def _module_available(*names: str) -> bool:
+    """Whether every named package is installed, without importing any of them"""
+    return all(importlib.util.find_spec(name) is not None for name in names)
+
+
+# Optional backends: capability probes only, imported on first use
+TENSORFLOW_AVAILABLE = _module_available('tensorflow')
+NLP_AVAILABLE = _module_available('spacy', 'nltk', 'transformers')
 
 # Database
 import mysql.connector
 import redis
 
+from analysis_cache import AnalysisCache
+from compiled_model import CompiledModel
+from connection_pool import DatabasePool
+from duplicate_index import DuplicateIndex
+from feature_buffer import FeatureBuffer, fit_scaler, gather_rows, standardize
+from feature_store import FeatureStore
+from hyperparameter_search import HyperparameterSearch, HyperparameterStore
+from lexicon_matcher import LexiconMatcher
+from metrics import MetricsRegistry
+from model_registry import ModelRegistry
+from sender_index import SenderFrequencyIndex
+from text_features import TextHasher
+from training_queue import LeaseLost, TrainingQueue, TrainingWorker
+
+def _fit_candidate(model_name: str, model, data_dir: str, scaled: bool, text: bool, threads: int, conn):
+    """Fit and score one candidate in a worker process
+    
+    Arrays are memory-mapped from data_dir; the fitted model is written back
+    there so only the winner ever has to be loaded by the parent. With text,
+    the hashed text matrices saved alongside are appended to the features.
+    """
+    try:
+        from sklearn.metrics import accuracy_score
+        from threadpoolctl import threadpool_limits
+        
+        suffix = '_scaled' if scaled else ''
+        X_train = np.load(os.path.join(data_dir, f'X_train{suffix}.npy'), mmap_mode='r')
+        X_test = np.load(os.path.join(data_dir, f'X_test{suffix}.npy'), mmap_mode='r')
+        y_train = np.load(os.path.join(data_dir, 'y_train.npy'), mmap_mode='r')
+        y_test = np.load(os.path.join(data_dir, 'y_test.npy'), mmap_mode='r')
+        if text:
+            import scipy.sparse as sp
+            X_train = TextHasher.combine(X_train, sp.load_npz(os.path.join(data_dir, 'T_train.npz')))
+            X_test = TextHasher.combine(X_test, sp.load_npz(os.path.join(data_dir, 'T_test.npz')))
+        
+        # Keep BLAS/OpenMP from oversubscribing the cores shared with other workers
+        with threadpool_limits(limits=threads):
+            model.fit(X_train, y_train)
+            y_pred = model.predict(X_test)
+        
+        joblib.dump(model, os.path.join(data_dir, f'{model_name}.joblib'))
+        conn.send(('ok', float(accuracy_score(y_test, y_pred))))
+    except Exception as e:
+        conn.send(('error', str(e)))
+    finally:
+        conn.close()
+
+
 class EmailPredictor:
     """Advanced ML-powered email behavior prediction system"""
     
-    def __init__(self, config_path: str = None):
+    # Default keyword lexicons; the 'lexicons' config entry or a 'lexicon_path'
+    # JSON file can replace any of them by name
+    URGENCY_KEYWORDS = [
+        'urgent', 'asap', 'immediate', 'emergency', 'critical',
+        'deadline', 'rush', 'priority', 'important', 'action required'
+    ]
+    POSITIVE_WORDS = ['good', 'great', 'excellent', 'amazing', 'wonderful', 'fantastic']
+    NEGATIVE_WORDS = ['bad', 'terrible', 'awful', 'horrible', 'disappointing', 'frustrated']
+    SPAM_KEYWORDS = [
+        'free', 'win', 'winner', 'congratulations', 'prize',
+        'money', 'cash', 'loan', 'credit', 'debt', 'viagra',
+        'pharmacy', 'casino', 'gambling', 'lottery'
+    ]
+    # Email columns read by the feature extractors
+    TRAINING_EMAIL_COLUMNS = [
+        'id', 'subject', 'body', 'sender', 'recipients', 'attachments', 'received_at'
+    ]
+    # Candidates trained on standardized features
+    SCALED_MODELS = ['logistic_regression', 'neural_network']
+    # Candidates that can absorb new emails without a full retrain
+    INCREMENTAL_MODELS = ['random_forest', 'gradient_boosting', 'neural_network']
+    NLP_FEATURE_COLUMNS = [
+        'email_count', 'phone_count', 'url_count', 'money_mentions', 'vocabulary_richness'
+    ]
+    # Integer-valued columns, held as int16 in training buffers (the rest as float32)
+    INTEGER_FEATURES = [
+        'hour_of_day', 'day_of_week', 'month', 'recipient_count', 'attachment_count',
+        'has_links', 'urgency_keywords', 'email_count', 'phone_count', 'url_count', 'money_mentions',
+    ]
+    # Schema version of each feature column in the feature store; bump a
+    # column's version whenever its extractor changes so cached values are recomputed
+    FEATURE_VERSIONS = {
+        'hour_of_day': 1, 'day_of_week': 1, 'month': 1, 'email_length': 1,
+        'subject_length': 1, 'recipient_count': 1, 'attachment_count': 1,
+        'has_links': 1, 'urgency_keywords': 1, 'sentiment_score': 1,
+        'readability_score': 1, 'spam_score': 1, 'email_count': 1,
+        'phone_count': 1, 'url_count': 1, 'money_mentions': 1, 'vocabulary_richness': 1,
+    }
+    # Columns derived from the lexicons, versioned with a fingerprint of them
+    LEXICON_FEATURES = ['urgency_keywords', 'sentiment_score', 'spam_score']
+    # Columns that change as the mailbox changes and are never cached
+    VOLATILE_FEATURES = ['sender_frequency']
+    # Feature extraction stages timed in the feature_extraction_seconds metrics
+    FEATURE_STAGES = [
+        'temporal', 'content', 'sender_frequency', 'analysis_cache', 'lexicon',
+        'sentiment', 'readability', 'spam', 'nlp',
+    ]
+    
+    def __init__(self, config_path: str = None, db=None, redis_client=None):
         """Initialize the email predictor with configuration"""
         self.config = self._load_config(config_path)
         self.logger = self._setup_logging()
         
-        # Database connections
-        self.db = self._connect_database()
-        self.redis = self._connect_redis()
+        # Latency histograms and counters, exported in the Prometheus text format
+        self.metrics = MetricsRegistry()
+        feature_seconds = self.metrics.histogram(
+            'feature_extraction_seconds', 'Per-email feature extraction time by stage', ('stage',)
+        )
+        self._feature_timers = {stage: feature_seconds.labels(stage=stage) for stage in self.FEATURE_STAGES}
+        batch_seconds = self.metrics.histogram(
+            'feature_batch_seconds', 'Batch feature extraction time by stage', ('stage',)
+        )
+        self._batch_timers = {stage: batch_seconds.labels(stage=stage) for stage in self.FEATURE_STAGES}
+        self._predict_seconds = self.metrics.histogram('predict_seconds', 'Prediction latency by call', ('mode',))
+        self._fit_seconds = self.metrics.histogram(
+            'candidate_fit_seconds', 'Candidate model fit and evaluation time', ('model', 'status')
+        )
+        self._fallbacks = self.metrics.counter(
+            'global_fallbacks_total', 'Users without their own model served by the global model'
+        )
+        self._no_model_errors = self.metrics.counter(
+            'no_model_errors_total', 'Predictions answered without a trained model'
+        )
+        
+        # Pooled database connections shared by all threads; an injected
+        # connection (benchmarks, embedding) cannot be duplicated, so it is
+        # the pool's only connection
+        self._owns_db = db is None
+        self.db = DatabasePool(
+            self._connect_database if db is None else (lambda: db),
+            size=self.config.get('db_pool_size', 8) if db is None else 1,
+            timeout=self.config.get('db_pool_timeout', 30),
+            health_check_interval=self.config.get('db_health_check_interval', 30),
+            retries=self.config.get('db_retries', 2),
+            logger=self.logger,
+            metrics=self.metrics
+        )
+        self.redis = redis_client if redis_client is not None else self._connect_redis()
         
-        # ML Models
-        self.models = {}
-        self.vectorizers = {}
-        self.scalers = {}
-        self.label_encoders = {}
+        # ML Models, one serving bundle (model, scaler, label encoder, compiled
+        # export) per key, replaced as a whole so concurrent predictions never
+        # mix parts of two model versions
+        self._serving: Dict[str, Dict[str, Any]] = {}
+        self.personalizations = {}
         
         # Model paths
         self.model_dir = self.config.get('model_dir', '/var/www/html/ml/models')
         os.makedirs(self.model_dir, exist_ok=True)
+        self.model_registry = ModelRegistry(
+            self.model_dir,
+            memory_budget=self.config.get('model_cache_memory_mb', 1024) * 1024 * 1024,
+            negative_ttl=self.config.get('model_negative_ttl', 300),
+            on_evict=self._forget_model,
+            artifacts=self.config.get('model_artifacts', True),
+            compress=self.config.get('model_compression', 3),
+            logger=self.logger,
+            metrics=self.metrics
+        )
+        
+        # Sender frequencies, loaded lazily with one grouped query
+        self.sender_index = SenderFrequencyIndex(
+            self.db,
+            self.redis,
+            window_days=self.config.get('sender_frequency_window_days', 30),
+            max_senders=self.config.get('sender_index_max_senders', 200000),
+            refresh_interval=self.config.get('sender_index_refresh_interval', 60),
+            logger=self.logger,
+            metrics=self.metrics
+        )
+        
+        # Keyword lexicons, compiled once
+        self.lexicon_matcher = LexiconMatcher(
+            self._load_lexicons(),
+            word_boundaries=self.config.get('lexicon_word_boundaries', False)
+        )
         
         # Features
         self.feature_columns = [
@@ -81,15 +233,65 @@ class EmailPredictor:
             'sentiment_score', 'readability_score', 'spam_score'
         ]
         
+        # Hashed subject/body text, for the candidates in text_feature_models
+        self.text_hasher = None
+        if self.config.get('text_features'):
+            self.text_hasher = TextHasher(
+                n_features=self.config.get('text_hash_features', 2 ** 14),
+                ngram_range=self.config.get('text_ngram_range', [1, 2]),
+                max_chars=self.config.get('text_max_chars', 10000)
+            )
+        
+        # NLP-backend results cached by content digest, shared through Redis; the
+        # lexicon, readability and spam analyzers take microseconds and are never cached
+        self.analysis_cache = None
+        if self.config.get('analysis_cache_enabled', True) and self._analysis_columns():
+            self.analysis_cache = AnalysisCache(
+                self.redis,
+                max_entries=self.config.get('analysis_cache_size', 50000),
+                ttl=self.config.get('analysis_cache_ttl', 3600),
+                logger=self.logger,
+                metrics=self.metrics
+            )
+        feature_versions = self._feature_versions()
+        self._analysis_version = json.dumps(
+            [[name, feature_versions[name]] for name in self._analysis_columns()]
+        )
+        
+        # Predictions shared by near-duplicate emails of the same user and model version
+        self.duplicate_index = None
+        if self.config.get('duplicate_detection'):
+            self.duplicate_index = DuplicateIndex(
+                self.redis,
+                max_entries=self.config.get('duplicate_index_size', 100000),
+                max_distance=self.config.get('duplicate_max_distance', 3),
+                ttl=self.config.get('duplicate_ttl', 86400),
+                logger=self.logger,
+                metrics=self.metrics
+            )
+        self._duplicate_audits = self.metrics.counter(
+            'duplicate_audits_total', 'Reused near-duplicate predictions checked against a full prediction', ('outcome',)
+        )
+        
+        # Computed feature vectors cached on disk by email id
+        self.feature_store = None
+        if self.config.get('feature_store_enabled', True):
+            self.feature_store = FeatureStore(
+                self.config.get('feature_store_dir') or os.path.join(self.model_dir, 'features'),
+                feature_versions,
+                max_rows=self.config.get('feature_store_max_rows'),
+                max_segments=self.config.get('feature_store_max_segments', 16),
+                logger=self.logger
+            )
+        
+        if self.config.get('model_preload_users'):
+            self.preload_models(self.config['model_preload_users'])
+        
         self.logger.info("EmailPredictor initialized successfully")
     
     def _load_config(self, config_path: str) -> Dict:
         """Load configuration from file or environment"""
-        if config_path and os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                return json.load(f)
-        
-        return {
+        config = {
             'db_host': os.getenv('DB_HOST', 'localhost'),
             'db_port': int(os.getenv('DB_PORT', 3306)),
             'db_name': os.getenv('DB_NAME', 'rotz_email_butler'),
@@ -97,10 +299,137 @@ class EmailPredictor:
             'db_password': os.getenv('DB_PASSWORD', ''),
             'redis_host': os.getenv('REDIS_HOST', 'localhost'),
             'redis_port': int(os.getenv('REDIS_PORT', 6379)),
+            'db_pool_size': int(os.getenv('DB_POOL_SIZE', 8)),  # connections shared by all threads
+            'db_pool_timeout': 30,  # seconds to wait for a free connection
+            'db_health_check_interval': 30,  # ping connections idle for longer before reuse
+            'db_retries': 2,  # re-runs of a statement whose connection dropped
+            'redis_pool_size': int(os.getenv('REDIS_POOL_SIZE', 16)),
+            'redis_pool_timeout': 5,  # seconds to wait for a free connection
+            'redis_health_check_interval': 30,
             'model_update_interval': 3600,  # 1 hour
             'min_training_samples': 1000,
+            'incremental_training': True,  # fold new emails into the current model between full retrains
+            'incremental_min_samples': 100,  # new emails needed for an update
+            'incremental_trees': 10,  # trees (forest) or stages (boosting) added per update
+            'incremental_max_trees': 300,  # retrain fully instead of growing past this
+            'incremental_epochs': 5,  # partial_fit passes over the new emails (neural network)
+            'incremental_drift_tolerance': 0.05,  # retrain fully when accuracy on new emails drops more
+            'full_retrain_interval': 604800,  # 1 week
+            'training_window_days': int(os.getenv('TRAINING_WINDOW_DAYS', 90)),
+            'training_row_limit': None,  # no cap; set to train on the newest N emails only
+            'training_chunk_size': 5000,
             'feature_importance_threshold': 0.01,
+            'training_workers': int(os.getenv('TRAINING_WORKERS', 0)),  # 0 = one per CPU
+            'candidate_timeout': 1800,  # seconds per candidate model
+            'candidate_models': None,  # names of the candidates to train; None trains all
+            'hierarchical_models': False,  # per-user calibration layers over one global model
+            'min_personalization_samples': 100,
+            'training_tmp_dir': os.getenv('TRAINING_TMP_DIR'),  # e.g. /dev/shm
+            'text_features': False,  # hashed subject/body tokens alongside the handcrafted features
+            'text_hash_features': 2 ** 14,  # columns per field; fixed, however large the vocabulary
+            'text_ngram_range': [1, 2],
+            'text_max_chars': 10000,  # characters hashed per field
+            'text_feature_models': ['logistic_regression'],  # candidates given the text columns
+            'hyperparameter_search': False,  # tune candidates by successive halving before training
+            'search_budget_seconds': 600,  # wall clock per search; None for no limit
+            'search_cpu_budget_seconds': None,  # CPU time summed over search workers
+            'search_candidates': 27,  # configurations sampled per estimator
+            'search_eta': 3,  # keep the best 1/eta configurations at each rung
+            'search_folds': 3,
+            'search_min_rows': 500,  # training rows per fold at the first rung
+            'search_max_age': 2592000,  # 30 days; reuse remembered configurations until then
+            'sender_frequency_window_days': int(os.getenv('SENDER_FREQUENCY_WINDOW_DAYS', 30)),
+            'sender_index_max_senders': 200000,
+            'sender_index_refresh_interval': 60,  # seconds
+            'lexicon_path': os.getenv('LEXICON_PATH'),
+            'lexicon_word_boundaries': False,  # True matches whole words only; changes feature values, so retrain
+            'feature_store_enabled': True,
+            'feature_store_dir': os.getenv('FEATURE_STORE_DIR'),  # default: <model_dir>/features
+            'feature_store_max_rows': 1_000_000,  # keep only the newest N emails (~4 bytes per feature each)
+            'feature_store_max_segments': 16,  # merge all segments once this many have accumulated
+            'analysis_cache_enabled': True,  # only used when an NLP backend is installed
+            'analysis_cache_size': 50000,  # entries kept in process
+            'analysis_cache_ttl': 3600,  # seconds in Redis
+            'model_cache_memory_mb': 1024,  # loaded models, estimated from file size
+            'model_negative_ttl': 300,  # seconds to remember that a user has no model
+            'model_preload_users': 0,  # most active users whose models load at startup
+            'duplicate_detection': False,  # reuse one prediction for near-identical emails (bulk mail); see _reuses_duplicates
+            'duplicate_max_distance': 3,  # SimHash bits in which near-duplicates may differ
+            'duplicate_index_size': 100000,  # clusters kept in process
+            'duplicate_ttl': 86400,  # seconds in Redis
+            'duplicate_audit_rate': 0.0,  # share of reuses also predicted in full, to measure agreement
+            'compiled_inference': True,  # score with NumPy exports of the models
+            'compiled_tolerance': 1e-6,  # max probability difference accepted at export
+            'model_artifacts': True,  # save models as directories with memory-mapped arrays
+            'model_compression': 3,  # zlib level of the estimator file in an artifact
+            'artifact_depth_caps': [8, 12, 16, 24],  # tree depths tried when compacting exports
+            'artifact_quantize': True,  # store tree leaf values as uint16
+            'artifact_accuracy_tolerance': 0.002,  # held-out accuracy a compacted export may lose
+            'serve_socket': os.getenv('PREDICTOR_SOCKET', '/tmp/rotz-email-predictor.sock'),
+            'serve_workers': 4,
+            'serve_stats_interval': 60,  # seconds between latency log lines
+            'pipeline_concurrency': 8,  # batches whose lookups run at once in --action ingest
+            'pipeline_batch_size': 64,
+            'pipeline_batch_timeout': 0.05,  # seconds to wait for a batch to fill
+            'pipeline_queue_size': 4,  # batches buffered between stages
+            'pipeline_cpu_workers': 0,  # feature/prediction threads; 0 = min(4, CPUs)
+            'training_lease_seconds': 300,  # a worker that misses heartbeats this long loses its job
+            'training_max_attempts': 3,  # runs of a job before it is marked failed
+            'training_retry_delay': 60,  # seconds before retrying a failed job, doubled per attempt
+            'training_poll_interval': 5,  # seconds an idle worker waits before looking again
+            'training_active_days': 30,  # users with email this recent are queued by enqueue without --user-id
+            'retrain_min_new_emails': 100,  # new emails since training that make a model due
+            'retrain_concurrency': 1,  # models retrained at once by retrain-all; each uses training_workers
+            'retrain_time_budget': None,  # seconds after which retrain-all starts no more jobs
+            'metrics_port': None,  # serve /metrics on this port alongside a Unix socket server
+            'metrics_textfile': os.getenv('METRICS_TEXTFILE'),  # CLI runs; "{action}" is replaced
+            'metrics_pushgateway': os.getenv('METRICS_PUSHGATEWAY'),  # e.g. http://pushgateway:9091
+        }
+        
+        # Values from the config file override the defaults
+        if config_path and os.path.exists(config_path):
+            with open(config_path, 'r') as f:
+                config.update(json.load(f))
+        
+        return config
+    
+    def _load_lexicons(self) -> Dict[str, List[str]]:
+        """Build the keyword lexicons from the defaults, a lexicon file and inline config"""
+        lexicons = {
+            'urgency': list(self.URGENCY_KEYWORDS),
+            'positive': list(self.POSITIVE_WORDS),
+            'negative': list(self.NEGATIVE_WORDS),
+            'spam': list(self.SPAM_KEYWORDS),
         }
+        
+        lexicon_path = self.config.get('lexicon_path')
+        if lexicon_path:
+            with open(lexicon_path, 'r') as f:
+                lexicons.update(json.load(f))
+        
+        lexicons.update(self.config.get('lexicons', {}))
+        return lexicons
+    
+    def _feature_versions(self) -> Dict[str, str]:
+        """Feature store version of every cacheable column, including the settings it depends on"""
+        lexicon_fingerprint = hashlib.blake2b(
+            json.dumps([self.lexicon_matcher.lexicons, self.lexicon_matcher.word_boundaries],
+                       sort_keys=True).encode(),
+            digest_size=8
+        ).hexdigest()
+        
+        versions = {}
+        for name in self._training_columns():
+            if name in self.VOLATILE_FEATURES:
+                continue
+            version = str(self.FEATURE_VERSIONS.get(name, 1))
+            if name in self.LEXICON_FEATURES:
+                version += f"-{lexicon_fingerprint}"
+            if name == 'sentiment_score' and not NLP_AVAILABLE:
+                # Sentiment is a constant zero without the NLP backends
+                version += "-off"
+            versions[name] = version
+        return versions
     
     def _setup_logging(self) -> logging.Logger:
         """Setup logging configuration"""
@@ -135,13 +464,26 @@ class EmailPredictor:
             raise
     
     def _connect_redis(self) -> redis.Redis:
-        """Connect to Redis cache"""
+        """Connect to Redis cache through a bounded, health-checked connection pool"""
+        if not self.config.get('redis_enabled', True):
+            return None
+        
         try:
-            r = redis.Redis(
+            from redis.backoff import ExponentialBackoff
+            from redis.retry import Retry
+            
+            pool = redis.BlockingConnectionPool(
                 host=self.config['redis_host'],
                 port=self.config['redis_port'],
-                decode_responses=True
+                decode_responses=True,
+                max_connections=self.config.get('redis_pool_size', 16),
+                timeout=self.config.get('redis_pool_timeout', 5),
+                health_check_interval=self.config.get('redis_health_check_interval', 30),
+                socket_keepalive=True,
+                retry=Retry(ExponentialBackoff(cap=1.0), 3),
+                retry_on_error=[redis.ConnectionError, redis.TimeoutError]
             )
+            r = redis.Redis(connection_pool=pool)
             r.ping()
             self.logger.info("Redis connection established")
             return r
@@ -152,12 +494,15 @@ class EmailPredictor:
     def extract_features(self, email_data: Dict) -> Dict:
         """Extract comprehensive features from email data"""
         features = {}
+        timers = self._feature_timers
+        mark = time.perf_counter()
         
         # Temporal features
-        timestamp = datetime.fromisoformat(email_data.get('received_at', datetime.now().isoformat()))
+        timestamp = self._parse_timestamp(email_data.get('received_at', datetime.now().isoformat()))
         features['hour_of_day'] = timestamp.hour
         features['day_of_week'] = timestamp.weekday()
         features['month'] = timestamp.month
+        mark = self._lap(timers['temporal'], mark)
         
         # Content features
         subject = email_data.get('subject', '')
@@ -167,74 +512,425 @@ class EmailPredictor:
         features['subject_length'] = len(subject)
         features['recipient_count'] = len(email_data.get('recipients', []))
         features['attachment_count'] = len(email_data.get('attachments', []))
-        features['has_links'] = 1 if 'http' in body.lower() else 0
+        body_lower = body.lower()
+        features['has_links'] = 1 if 'http' in body_lower else 0
+        mark = self._lap(timers['content'], mark)
         
         # Sender features
         sender = email_data.get('sender', '')
         features['sender_frequency'] = self._get_sender_frequency(sender)
+        mark = self._lap(timers['sender_frequency'], mark)
         
-        # Content analysis
-        features['urgency_keywords'] = self._count_urgency_keywords(subject + ' ' + body)
-        features['sentiment_score'] = self._analyze_sentiment(body)
+        # Content analysis, with one lexicon scan shared by all keyword features
+        lexicon_hits = self._scan_lexicons(subject.lower(), body_lower)
+        features['urgency_keywords'] = lexicon_hits['urgency']
+        mark = self._lap(timers['lexicon'], mark)
+        features['sentiment_score'] = self._analyze_sentiment(body, lexicon_hits)
+        mark = self._lap(timers['sentiment'], mark)
         features['readability_score'] = self._calculate_readability(body)
-        features['spam_score'] = self._calculate_spam_score(email_data)
+        mark = self._lap(timers['readability'], mark)
+        features['spam_score'] = self._calculate_spam_score(email_data, lexicon_hits)
+        mark = self._lap(timers['spam'], mark)
         
-        # Advanced NLP features
+        # Advanced NLP features, served from the analysis cache for content seen before
         if NLP_AVAILABLE:
+            analysis_key = self._analysis_key(subject, body) if self.analysis_cache else None
+            cached = self.analysis_cache.get(analysis_key) if analysis_key else None
+            mark = self._lap(timers['analysis_cache'], mark)
+            if cached is not None and len(cached) == len(self._analysis_columns()):
+                features.update(zip(self._analysis_columns(), cached))
+                return features
+            
             features.update(self._extract_nlp_features(subject, body))
+            self._lap(timers['nlp'], mark)
+            if analysis_key:
+                self.analysis_cache.set(analysis_key, [features[name] for name in self._analysis_columns()])
         
         return features
     
+    @staticmethod
+    def _lap(timer, start: float) -> float:
+        """Record the time since start on a stage timer and return the new start"""
+        now = time.perf_counter()
+        timer.observe(now - start)
+        return now
+    
+    def _training_columns(self) -> List[str]:
+        """Columns produced by the feature extractors, in matrix order"""
+        if NLP_AVAILABLE:
+            return self.feature_columns + self.NLP_FEATURE_COLUMNS
+        return list(self.feature_columns)
+    
+    def _analysis_columns(self) -> List[str]:
+        """Columns cached together in the analysis cache, in stored order; none without an NLP backend"""
+        if NLP_AVAILABLE:
+            return list(self.NLP_FEATURE_COLUMNS)
+        return []
+    
+    def _analysis_key(self, subject: str, body: str) -> str:
+        """Analysis cache key for an email's content"""
+        return AnalysisCache.key(self._analysis_version, subject, body)
+    
+    def extract_features_batch(self, emails: List[Dict], columns: Optional[List[str]] = None) -> np.ndarray:
+        """Extract features for many emails column-wise, matching extract_features value for value
+        
+        Returns a float64 matrix whose columns follow _training_columns(), or the
+        given subset of it, in which case only the extractors those columns need run.
+        NLP-backend columns come from the analysis cache where possible, with
+        one batched lookup and one pipelined write per call.
+        """
+        columns = self._training_columns() if columns is None else columns
+        analysis_columns = self._analysis_columns()
+        requested = [name for name in columns if name in analysis_columns]
+        if self.analysis_cache is None or not requested or not emails:
+            return self._compute_features_batch(emails, columns)
+        
+        keys = [
+            self._analysis_key(email.get('subject') or '', email.get('body') or '')
+            for email in emails
+        ]
+        with self._batch_timers['analysis_cache'].time():
+            cached = {
+                key: values for key, values in self.analysis_cache.get_many(keys).items()
+                if len(values) == len(analysis_columns)
+            }
+        
+        analysis = np.empty((len(emails), len(analysis_columns)), dtype=np.float64)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        for i, key in enumerate(keys):
+            if key in cached:
+                analysis[i] = cached[key]
+        if missing:
+            analysis[missing] = self._compute_features_batch([emails[i] for i in missing], analysis_columns)
+            self.analysis_cache.set_many({keys[i]: analysis[i].tolist() for i in missing})
+        
+        matrix = np.empty((len(emails), len(columns)), dtype=np.float64)
+        matrix[:, [columns.index(name) for name in requested]] = \
+            analysis[:, [analysis_columns.index(name) for name in requested]]
+        others = [name for name in columns if name not in analysis_columns]
+        if others:
+            matrix[:, [columns.index(name) for name in others]] = self._compute_features_batch(emails, others)
+        return matrix
+    
+    def _compute_features_batch(self, emails: List[Dict], columns: List[str]) -> np.ndarray:
+        """Column-wise feature extraction for the given columns, bypassing the analysis cache"""
+        col = {name: i for i, name in enumerate(columns)}
+        matrix = np.zeros((len(emails), len(columns)), dtype=np.float64)
+        if not emails:
+            return matrix
+        
+        def needs(*names: str) -> bool:
+            return any(name in col for name in names)
+        
+        timers = self._batch_timers
+        mark = time.perf_counter()
+        
+        # Temporal features
+        if needs('hour_of_day', 'day_of_week', 'month'):
+            now = datetime.now().isoformat()
+            timestamps = [self._parse_timestamp(email.get('received_at', now)) for email in emails]
+            for name, values in (('hour_of_day', [t.hour for t in timestamps]),
+                                 ('day_of_week', [t.weekday() for t in timestamps]),
+                                 ('month', [t.month for t in timestamps])):
+                if name in col:
+                    matrix[:, col[name]] = values
+            mark = self._lap(timers['temporal'], mark)
+        
+        if 'recipient_count' in col:
+            matrix[:, col['recipient_count']] = [len(email.get('recipients') or []) for email in emails]
+        if 'attachment_count' in col:
+            matrix[:, col['attachment_count']] = [len(email.get('attachments') or []) for email in emails]
+        
+        # Sender features, resolved once per distinct sender
+        senders = [email.get('sender') or '' for email in emails]
+        if 'sender_frequency' in col:
+            mark = time.perf_counter()
+            sender_frequency = {sender: self._get_sender_frequency(sender) for sender in set(senders)}
+            matrix[:, col['sender_frequency']] = [sender_frequency[sender] for sender in senders]
+            mark = self._lap(timers['sender_frequency'], mark)
+        
+        text_columns = ['email_length', 'subject_length', 'has_links', 'urgency_keywords',
+                        'sentiment_score', 'readability_score', 'spam_score'] + self.NLP_FEATURE_COLUMNS
+        if not needs(*text_columns):
+            return matrix
+        
+        # Content columns, lowercased exactly once
+        mark = time.perf_counter()
+        subject = pd.Series([email.get('subject') or '' for email in emails], dtype=object)
+        body = pd.Series([email.get('body') or '' for email in emails], dtype=object)
+        subject_lower = subject.str.lower()
+        body_lower = body.str.lower()
+        text_lower = subject_lower + ' ' + body_lower
+        
+        nlp_features = NLP_AVAILABLE and needs(*self.NLP_FEATURE_COLUMNS)
+        if needs('sentiment_score', 'readability_score') or nlp_features:
+            body_stats = self._text_statistics_batch(body_lower.tolist(), nlp_features)
+        
+        if 'email_length' in col:
+            matrix[:, col['email_length']] = body.str.len()
+        if 'subject_length' in col:
+            matrix[:, col['subject_length']] = subject.str.len()
+        if 'has_links' in col:
+            matrix[:, col['has_links']] = body_lower.str.contains('http', regex=False)
+        mark = self._lap(timers['content'], mark)
+        
+        # Content analysis
+        if needs('urgency_keywords', 'sentiment_score', 'spam_score'):
+            lexicon_hits = self._scan_lexicons_batch(subject_lower.tolist(), body_lower.tolist())
+            if 'urgency_keywords' in col:
+                matrix[:, col['urgency_keywords']] = lexicon_hits['urgency']
+            mark = self._lap(timers['lexicon'], mark)
+            if 'sentiment_score' in col:
+                matrix[:, col['sentiment_score']] = self._analyze_sentiment_batch(lexicon_hits, body_stats['words'])
+                mark = self._lap(timers['sentiment'], mark)
+            if 'spam_score' in col:
+                matrix[:, col['spam_score']] = self._calculate_spam_score_batch(
+                    subject_lower, text_lower, senders, lexicon_hits
+                )
+                mark = self._lap(timers['spam'], mark)
+        if 'readability_score' in col:
+            matrix[:, col['readability_score']] = self._calculate_readability_batch(body_lower, body_stats)
+            mark = self._lap(timers['readability'], mark)
+        
+        # Advanced NLP features
+        if nlp_features:
+            subject_stats = self._text_statistics_batch(subject_lower.tolist(), True)
+            for name, values in self._extract_nlp_features_batch(text_lower, subject_stats, body_stats).items():
+                if name in col:
+                    matrix[:, col[name]] = values
+            self._lap(timers['nlp'], mark)
+        
+        return matrix
+    
+    # Lazily built lookup tables over the Basic Multilingual Plane for str predicates
+    _CHAR_TABLES: Dict[str, np.ndarray] = {}
+    
+    @classmethod
+    def _char_mask(cls, codepoints: np.ndarray, predicate) -> np.ndarray:
+        """Apply a str predicate such as str.isspace to every codepoint"""
+        table = cls._CHAR_TABLES.get(predicate.__name__)
+        if table is None:
+            table = np.fromiter((predicate(chr(c)) for c in range(0x10000)), dtype=bool, count=0x10000)
+            cls._CHAR_TABLES[predicate.__name__] = table
+        
+        in_bmp = codepoints < 0x10000
+        mask = np.zeros(len(codepoints), dtype=bool)
+        mask[in_bmp] = table[codepoints[in_bmp]]
+        
+        # Astral characters are rare; classify the distinct ones directly
+        if not in_bmp.all():
+            astral = codepoints[~in_bmp]
+            unique = np.unique(astral)
+            hits = np.fromiter((predicate(chr(c)) for c in unique), dtype=bool, count=len(unique))
+            mask[~in_bmp] = hits[np.searchsorted(unique, astral)]
+        return mask
+    
+    @classmethod
+    def _text_statistics_batch(cls, texts_lower: List[str], count_phones: bool = False,
+                               chunk_chars: int = 8_000_000) -> Dict[str, np.ndarray]:
+        """Word, syllable and phone-number counts for lowercased texts
+        
+        Texts are processed as flat codepoint arrays in chunks of roughly
+        chunk_chars characters, so word boundaries and vowel groups are found
+        with array operations instead of a Python loop per word.
+        """
+        n = len(texts_lower)
+        stats = {
+            'words': np.zeros(n, dtype=np.int64),
+            'syllables': np.zeros(n, dtype=np.int64),
+            'phones': np.zeros(n, dtype=np.int64),
+        }
+        # ASCII lookup tables; every codepoint above 127 maps to the (false) DEL slot
+        vowel_table = np.zeros(128, dtype=bool)
+        vowel_table[[ord(c) for c in 'aeiouy']] = True
+        phone_punctuation_table = np.zeros(128, dtype=bool)
+        phone_punctuation_table[[ord(c) for c in '-()']] = True
+        
+        start = 0
+        while start < n:
+            # Pick a chunk of documents bounded by total characters
+            end, size = start, 0
+            while end < n and (end == start or size + len(texts_lower[end]) <= chunk_chars):
+                size += len(texts_lower[end]) + 1
+                end += 1
+            chunk = texts_lower[start:end]
+            
+            # A newline separator keeps words from spanning documents
+            codepoints = np.frombuffer(
+                '\n'.join(chunk).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32
+            )
+            lengths = np.fromiter((len(text) + 1 for text in chunk), dtype=np.int64, count=len(chunk))
+            doc_starts = np.cumsum(lengths) - lengths
+            ascii_codepoints = np.minimum(codepoints, 127)
+            
+            space = cls._char_mask(codepoints, str.isspace)
+            prev_space = np.concatenate(([True], space[:-1]))
+            next_space = np.concatenate((space[1:], [True]))
+            word_start = ~space & prev_space
+            word_end = ~space & next_space
+            
+            word_ids = np.cumsum(word_start, dtype=np.int32) - 1
+            word_docs = np.searchsorted(doc_starts, np.flatnonzero(word_start), side='right') - 1
+            word_count = len(word_docs)
+            
+            # Syllables per word: vowel groups, minus a trailing 'e', at least one
+            vowel = vowel_table[ascii_codepoints]
+            group_start = vowel & ~np.concatenate(([False], vowel[:-1]))
+            groups = np.bincount(word_ids[group_start], minlength=word_count)
+            ends_with_e = codepoints[word_end] == ord('e')
+            syllables = np.maximum(1, groups - ends_with_e)
+            
+            stats['words'][start:end] = np.bincount(word_docs, minlength=len(chunk))
+            stats['syllables'][start:end] = np.bincount(
+                word_docs, weights=syllables, minlength=len(chunk)
+            ).astype(np.int64)
+            
+            if count_phones:
+                # Phone numbers: words of digits and -() with at least ten characters
+                digit = cls._char_mask(codepoints, str.isdigit)
+                other = ~space & ~digit & ~phone_punctuation_table[ascii_codepoints]
+                word_length = np.bincount(word_ids[~space], minlength=word_count)
+                word_digits = np.bincount(word_ids[digit], minlength=word_count)
+                word_other = np.bincount(word_ids[other], minlength=word_count)
+                is_phone = (word_other == 0) & (word_digits > 0) & (word_length >= 10)
+                stats['phones'][start:end] = np.bincount(word_docs[is_phone], minlength=len(chunk))
+            
+            start = end
+        
+        return stats
+    
+    def _scan_lexicons_batch(self, subject_lower: List[str], body_lower: List[str]) -> Dict[str, np.ndarray]:
+        """Column-wise equivalent of _scan_lexicons: keyword counts per email, one array per lexicon"""
+        subject_hits = self.lexicon_matcher.term_presence(subject_lower)
+        body_hits = self.lexicon_matcher.term_presence(body_lower)
+        
+        def distinct(name: str, subject: bool) -> np.ndarray:
+            if name not in body_hits:
+                return np.zeros(len(body_lower), dtype=np.int64)
+            hits = body_hits[name] | subject_hits[name] if subject else body_hits[name]
+            return hits.sum(axis=1, dtype=np.int64)
+        
+        return {
+            'urgency': distinct('urgency', True),
+            'spam': distinct('spam', True),
+            'positive': distinct('positive', False),
+            'negative': distinct('negative', False),
+        }
+    
+    def _analyze_sentiment_batch(self, lexicon_hits: Dict[str, np.ndarray], body_words: np.ndarray) -> np.ndarray:
+        """Column-wise equivalent of _analyze_sentiment"""
+        if not NLP_AVAILABLE:
+            return np.zeros(len(body_words))
+        
+        return (lexicon_hits['positive'] - lexicon_hits['negative']) / np.maximum(body_words, 1)
+    
+    @staticmethod
+    def _calculate_readability_batch(body_lower: pd.Series, body_stats: Dict[str, np.ndarray]) -> np.ndarray:
+        """Column-wise equivalent of _calculate_readability"""
+        sentences = np.fromiter(
+            (text.count('.') + text.count('!') + text.count('?') for text in body_lower),
+            dtype=np.int64, count=len(body_lower)
+        )
+        words = body_stats['words']
+        syllables = body_stats['syllables']
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = 206.835 - (1.015 * (words / sentences)) - (84.6 * (syllables / words))
+        
+        return np.where((sentences == 0) | (words == 0), 0.0, np.clip(score, 0, 100) / 100)
+    
+    def _calculate_spam_score_batch(self, subject_lower: pd.Series, text_lower: pd.Series,
+                                    senders: List[str], lexicon_hits: Dict[str, np.ndarray]) -> np.ndarray:
+        """Column-wise equivalent of _calculate_spam_score"""
+        spam_indicators = lexicon_hits['spam'].copy()
+        total_checks = self.lexicon_matcher.size('spam') + 3
+        
+        # Excessive capitalization (checked on the lowercased subject, like the scalar path)
+        upper_counts = np.fromiter(
+            (sum(map(str.isupper, text)) for text in subject_lower), dtype=np.int64, count=len(subject_lower)
+        )
+        spam_indicators += upper_counts > subject_lower.str.len().to_numpy() * 0.5
+        
+        # Suspicious sender patterns, evaluated once per distinct sender
+        suspicious = {}
+        for sender in set(senders):
+            local_part = sender.lower().split('@')[0]
+            suspicious[sender] = any(char.isdigit() for char in local_part) and len(local_part) > 10
+        spam_indicators += np.array([suspicious[sender] for sender in senders], dtype=np.int64)
+        
+        # Excessive exclamation marks
+        exclamations = np.fromiter((text.count('!') for text in text_lower), dtype=np.int64, count=len(text_lower))
+        spam_indicators += exclamations > 3
+        
+        return spam_indicators / total_checks
+    
+    @staticmethod
+    def _extract_nlp_features_batch(text_lower: pd.Series, subject_stats: Dict[str, np.ndarray],
+                                    body_stats: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Column-wise equivalent of _extract_nlp_features"""
+        def count(needle: str) -> np.ndarray:
+            return np.fromiter((text.count(needle) for text in text_lower), dtype=np.int64, count=len(text_lower))
+        
+        # Subject and body are joined by a space, so their word counts add up
+        total_words = subject_stats['words'] + body_stats['words']
+        unique_words = np.fromiter(
+            (len(set(text.split())) for text in text_lower), dtype=np.int64, count=len(text_lower)
+        )
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            richness = np.where(total_words > 0, unique_words / total_words, 0)
+        
+        return {
+            'email_count': count('@'),
+            'phone_count': subject_stats['phones'] + body_stats['phones'],
+            'url_count': count('http'),
+            'money_mentions': count('$') + count('dollar') + count('price'),
+            'vocabulary_richness': richness,
+        }
+    
+    @staticmethod
+    def _parse_timestamp(value) -> datetime:
+        """Accept both ISO strings and the datetime objects returned by MySQL"""
+        if isinstance(value, datetime):
+            return value
+        return datetime.fromisoformat(value)
+    
     def _get_sender_frequency(self, sender: str) -> int:
         """Get frequency of emails from this sender"""
         try:
-            cursor = self.db.cursor()
-            cursor.execute(
-                "SELECT COUNT(*) FROM emails WHERE sender = %s AND received_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)",
-                (sender,)
-            )
-            result = cursor.fetchone()
-            return result[0] if result else 0
+            return self.sender_index.get(sender)
         except Exception as e:
             self.logger.error(f"Error getting sender frequency: {e}")
             return 0
     
+    def _scan_lexicons(self, subject_lower: str, body_lower: str) -> Dict[str, int]:
+        """Scan subject and body once each and derive every keyword count from the hits"""
+        subject_hits = self.lexicon_matcher.scan(subject_lower)
+        body_hits = self.lexicon_matcher.scan(body_lower)
+        return {
+            'urgency': len(subject_hits.get('urgency', set()) | body_hits.get('urgency', set())),
+            'spam': len(subject_hits.get('spam', set()) | body_hits.get('spam', set())),
+            'positive': len(body_hits.get('positive', set())),
+            'negative': len(body_hits.get('negative', set())),
+        }
+    
     def _count_urgency_keywords(self, text: str) -> int:
         """Count urgency keywords in text"""
-        urgency_keywords = [
-            'urgent', 'asap', 'immediate', 'emergency', 'critical',
-            'deadline', 'rush', 'priority', 'important', 'action required'
-        ]
-        text_lower = text.lower()
-        return sum(1 for keyword in urgency_keywords if keyword in text_lower)
+        return len(self.lexicon_matcher.scan(text.lower()).get('urgency', set()))
     
-    def _analyze_sentiment(self, text: str) -> float:
+    def _analyze_sentiment(self, text: str, lexicon_hits: Optional[Dict[str, int]] = None) -> float:
         """Analyze sentiment of email content"""
         if not NLP_AVAILABLE:
             return 0.0
         
         try:
-            # Use cached sentiment analyzer
-            cache_key = f"sentiment:{hash(text)}"
-            cached_result = self.redis.get(cache_key) if self.redis else None
-            
-            if cached_result:
-                return float(cached_result)
-            
             # Simple sentiment analysis (can be enhanced with transformers)
-            positive_words = ['good', 'great', 'excellent', 'amazing', 'wonderful', 'fantastic']
-            negative_words = ['bad', 'terrible', 'awful', 'horrible', 'disappointing', 'frustrated']
-            
-            text_lower = text.lower()
-            positive_count = sum(1 for word in positive_words if word in text_lower)
-            negative_count = sum(1 for word in negative_words if word in text_lower)
-            
-            sentiment = (positive_count - negative_count) / max(len(text.split()), 1)
-            
-            if self.redis:
-                self.redis.setex(cache_key, 3600, sentiment)  # Cache for 1 hour
+            if lexicon_hits is None:
+                lexicon_hits = self._scan_lexicons('', text.lower())
+            positive_count = lexicon_hits['positive']
+            negative_count = lexicon_hits['negative']
             
-            return sentiment
+            return (positive_count - negative_count) / max(len(text.split()), 1)
         except Exception as e:
             self.logger.error(f"Error analyzing sentiment: {e}")
             return 0.0
@@ -273,7 +969,7 @@ class EmailPredictor:
         
         return max(1, syllable_count)
     
-    def _calculate_spam_score(self, email_data: Dict) -> float:
+    def _calculate_spam_score(self, email_data: Dict, lexicon_hits: Optional[Dict[str, int]] = None) -> float:
         """Calculate spam probability score"""
         spam_indicators = 0
         total_checks = 0
@@ -283,16 +979,10 @@ class EmailPredictor:
         sender = email_data.get('sender', '').lower()
         
         # Check for spam keywords
-        spam_keywords = [
-            'free', 'win', 'winner', 'congratulations', 'prize',
-            'money', 'cash', 'loan', 'credit', 'debt', 'viagra',
-            'pharmacy', 'casino', 'gambling', 'lottery'
-        ]
-        
-        for keyword in spam_keywords:
-            total_checks += 1
-            if keyword in subject or keyword in body:
-                spam_indicators += 1
+        if lexicon_hits is None:
+            lexicon_hits = self._scan_lexicons(subject, body)
+        total_checks += self.lexicon_matcher.size('spam')
+        spam_indicators += lexicon_hits['spam']
         
         # Check for excessive capitalization
         total_checks += 1
@@ -339,236 +1029,967 @@ class EmailPredictor:
         
         return features
     
-    def prepare_training_data(self, user_id: Optional[int] = None) -> Tuple[pd.DataFrame, pd.Series]:
-        """Prepare training data from database"""
+    def prepare_training_data(self, user_id: Optional[int] = None, min_samples: Optional[int] = None,
+                              since_id: Optional[int] = None, text_chunks: Optional[List] = None,
+                              text_hasher: Optional[TextHasher] = None) -> Tuple[pd.DataFrame, pd.Series]:
+        """Prepare training data from database
+        
+        Emails are streamed in fixed-size chunks and each chunk goes straight
+        through feature extraction into a typed column buffer (int16 for
+        integer-valued columns, float32 otherwise), so peak memory is bounded
+        by the chunk size plus the features themselves. Vectors already in
+        the feature store are read from it, and newly computed ones are
+        written back in one bulk update at the end. Rows are indexed by email
+        id; since_id limits the data to emails newer than that id.
+        
+        When text_chunks is a list, each chunk's hashed text (text_hasher,
+        or the configured one) is appended to it, row-aligned with the
+        features; no vocabulary is built, so chunks are hashed as they stream.
+        """
         try:
-            # Build query
-            query = """
-                SELECT 
-                    e.*,
-                    u.timezone,
-                    ea.provider as email_provider,
-                    CASE 
-                        WHEN e.is_read = 1 THEN 'read'
-                        WHEN e.is_archived = 1 THEN 'archived'
-                        WHEN e.is_deleted = 1 THEN 'deleted'
-                        WHEN e.priority = 'high' THEN 'priority'
-                        ELSE 'normal'
-                    END as action_taken
-                FROM emails e
-                JOIN email_accounts ea ON e.email_account_id = ea.id
-                JOIN users u ON ea.user_id = u.id
-                WHERE e.received_at >= DATE_SUB(NOW(), INTERVAL 90 DAY)
-            """
+            row_limit = self.config.get('training_row_limit')
+            columns = self._training_columns()
             
-            params = []
-            if user_id:
-                query += " AND u.id = %s"
-                params.append(user_id)
+            # With a row limit the buffer is reserved up front (pages are only
+            # committed as rows are written); otherwise it grows by doubling
+            buffer = FeatureBuffer(
+                columns, self.INTEGER_FEATURES,
+                capacity=row_limit or self.config.get('training_chunk_size', 5000)
+            )
+            labels = []
+            ids = []
+            computed = []
             
-            query += " ORDER BY e.received_at DESC LIMIT 10000"
+            for chunk in self._stream_training_emails(user_id, since_id):
+                chunk_features, chunk_labels, chunk_ids = self._extract_training_chunk(chunk, columns, computed)
+                buffer.append(chunk_features)
+                if text_chunks is not None:
+                    if len(chunk_ids) < len(chunk):
+                        kept = set(chunk_ids)
+                        chunk = [email for email in chunk if email['id'] in kept]
+                    text_chunks.append((text_hasher or self.text_hasher).transform(chunk))
+                labels.extend(chunk_labels)
+                ids.extend(chunk_ids)
             
-            cursor = self.db.cursor(dictionary=True)
-            cursor.execute(query, params)
-            emails = cursor.fetchall()
+            self._store_computed_features(computed)
             
-            if len(emails) < self.config['min_training_samples']:
-                self.logger.warning(f"Insufficient training data: {len(emails)} samples")
+            if buffer.n_rows < (min_samples or self.config['min_training_samples']):
+                self.logger.warning(f"Insufficient training data: {buffer.n_rows} samples")
                 return None, None
             
-            # Extract features for each email
-            features_list = []
-            labels = []
-            
-            for email in emails:
-                try:
-                    features = self.extract_features(email)
-                    features_list.append(features)
-                    labels.append(email['action_taken'])
-                except Exception as e:
-                    self.logger.error(f"Error processing email {email.get('id')}: {e}")
-                    continue
-            
-            # Convert to DataFrame
-            df_features = pd.DataFrame(features_list)
-            df_labels = pd.Series(labels)
-            
-            # Handle missing values
-            df_features = df_features.fillna(0)
+            index = pd.Index(ids, dtype=np.int64, name='id')
+            df_features = buffer.frame(index)
+            df_labels = pd.Series(labels, index=index)
             
-            self.logger.info(f"Prepared training data: {len(df_features)} samples, {len(df_features.columns)} features")
+            self.logger.info(
+                f"Prepared training data: {len(df_features)} samples, {len(df_features.columns)} features "
+                f"({buffer.nbytes / 1024 / 1024:.1f} MB)"
+            )
+            self.logger.info(f"Cache statistics: {self.get_cache_stats()}")
             return df_features, df_labels
             
         except Exception as e:
             self.logger.error(f"Error preparing training data: {e}")
             return None, None
     
-    def train_models(self, user_id: Optional[int] = None) -> Dict[str, float]:
-        """Train multiple ML models and select the best one"""
+    def _stream_training_emails(self, user_id: Optional[int] = None,
+                                since_id: Optional[int] = None) -> Iterator[List[Dict]]:
+        """Yield training emails in chunks from an unbuffered cursor"""
+        window_days = self.config.get('training_window_days', 90)
+        row_limit = self.config.get('training_row_limit')
+        chunk_size = self.config.get('training_chunk_size', 5000)
+        email_columns = self.config.get('training_email_columns', self.TRAINING_EMAIL_COLUMNS)
+        
+        # Build query, fetching only the columns feature extraction reads
+        query = f"""
+            SELECT 
+                {', '.join(f'e.{column}' for column in email_columns)},
+                CASE 
+                    WHEN e.is_read = 1 THEN 'read'
+                    WHEN e.is_archived = 1 THEN 'archived'
+                    WHEN e.is_deleted = 1 THEN 'deleted'
+                    WHEN e.priority = 'high' THEN 'priority'
+                    ELSE 'normal'
+                END as action_taken
+            FROM emails e
+            JOIN email_accounts ea ON e.email_account_id = ea.id
+            JOIN users u ON ea.user_id = u.id
+            WHERE e.received_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+        """
+        
+        params = [window_days]
+        if user_id:
+            query += " AND u.id = %s"
+            params.append(user_id)
+        
+        if since_id is not None:
+            query += " AND e.id > %s"
+            params.append(since_id)
+        
+        if row_limit:
+            query += " ORDER BY e.received_at DESC LIMIT %s"
+            params.append(row_limit)
+        
+        # Sender frequencies must be loaded before the stream occupies a connection
+        self.sender_index.warm()
+        
+        # An unbuffered cursor keeps its connection busy until fully read, so
+        # stream on a connection of its own when we own the database handle
+        fetch_timer = self.metrics.db_query('training_fetch')
+        with (self.db.dedicated() if self._owns_db else self.db.connection()) as connection:
+            cursor = connection.cursor(dictionary=True, buffered=False)
+            try:
+                with self.metrics.db_query('training_stream').time():
+                    cursor.execute(query, params)
+                while True:
+                    with fetch_timer.time():
+                        rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+    
+    def _extract_training_chunk(self, emails: List[Dict], columns: List[str],
+                                computed: Optional[List] = None) -> Tuple[np.ndarray, List[str], List[int]]:
+        """Extract features, labels and email ids for one chunk, falling back to per-email on failure"""
+        try:
+            labels = [email['action_taken'] for email in emails]
+            ids = [email['id'] for email in emails]
+            if self.feature_store is not None:
+                return self._cached_feature_matrix(emails, columns, computed), labels, ids
+            
+            # Extract features for all emails in one columnar pass
+            return self.extract_features_batch(emails, columns), labels, ids
+        except Exception as e:
+            self.logger.error(f"Batch feature extraction failed, falling back to per-email: {e}")
+        
+        # Extract features for each email
+        features_list = []
+        labels = []
+        ids = []
+        
+        for email in emails:
+            try:
+                features = self.extract_features(email)
+                features_list.append(features)
+                labels.append(email['action_taken'])
+                ids.append(email['id'])
+            except Exception as e:
+                self.logger.error(f"Error processing email {email.get('id')}: {e}")
+                continue
+        
+        # Same column order as the batch path, missing values as zero
+        df_features = pd.DataFrame(features_list).reindex(columns=columns).fillna(0)
+        return df_features.to_numpy(dtype=np.float64), labels, ids
+    
+    def _cached_feature_matrix(self, emails: List[Dict], columns: List[str],
+                               computed: Optional[List] = None) -> np.ndarray:
+        """Feature matrix for a chunk, extracting only rows and columns the feature store lacks
+        
+        Freshly extracted rows are appended to computed as (ids, values) pairs
+        for _store_computed_features.
+        """
+        ids = np.array([email['id'] for email in emails], dtype=np.int64)
+        cacheable = [name for name in columns if name not in self.VOLATILE_FEATURES]
+        cacheable_idx = [columns.index(name) for name in cacheable]
+        
+        try:
+            cached, found = self.feature_store.lookup(ids, cacheable)
+        except Exception as e:
+            self.logger.error(f"Error reading feature store: {e}")
+            cached = np.zeros((len(emails), len(cacheable)), dtype=np.float32)
+            found = np.zeros(cached.shape, dtype=bool)
+        
+        matrix = np.empty((len(emails), len(columns)), dtype=np.float64)
+        matrix[:, cacheable_idx] = cached
+        complete = int(found.all(axis=1).sum())
+        self.metrics.cache_result('feature_store', 'hit').inc(complete)
+        self.metrics.cache_result('feature_store', 'miss').inc(len(emails) - complete)
+        
+        # Extract only the columns that are missing or stale in at least one row
+        stale_rows = np.flatnonzero(~found.all(axis=1))
+        if len(stale_rows):
+            stale_columns = [cacheable[j] for j in np.flatnonzero(~found[stale_rows].all(axis=0))]
+            matrix[np.ix_(stale_rows, [columns.index(name) for name in stale_columns])] = \
+                self.extract_features_batch([emails[i] for i in stale_rows], stale_columns)
+            if computed is not None:
+                computed.append((ids[stale_rows], matrix[np.ix_(stale_rows, cacheable_idx)]))
+        
+        volatile = [name for name in columns if name in self.VOLATILE_FEATURES]
+        if volatile:
+            matrix[:, [columns.index(name) for name in volatile]] = self.extract_features_batch(emails, volatile)
+        
+        return matrix
+    
+    def _store_computed_features(self, computed: List):
+        """Write the vectors extracted during a training run to the feature store"""
+        if self.feature_store is None or not computed:
+            return
+        
+        try:
+            columns = [name for name in self._training_columns() if name not in self.VOLATILE_FEATURES]
+            self.feature_store.put(
+                np.concatenate([ids for ids, _ in computed]),
+                np.concatenate([values for _, values in computed]),
+                columns
+            )
+        except Exception as e:
+            self.logger.error(f"Error writing feature store: {e}")
+    
+    def _cached_features(self, emails: List[Dict]) -> List[Optional[Dict]]:
+        """Feature dicts served from the feature store, None where an email must be extracted"""
+        cached: List[Optional[Dict]] = [None] * len(emails)
+        positions = [i for i, email in enumerate(emails) if email.get('id') is not None]
+        if self.feature_store is None or not positions:
+            return cached
+        
+        columns = [name for name in self._training_columns() if name not in self.VOLATILE_FEATURES]
+        try:
+            values, found = self.feature_store.lookup(
+                np.array([emails[i]['id'] for i in positions], dtype=np.int64), columns
+            )
+        except Exception as e:
+            self.logger.error(f"Error reading feature store: {e}")
+            return cached
+        
+        for row, index in enumerate(positions):
+            if found[row].all():
+                features = dict(zip(columns, values[row].tolist()))
+                features['sender_frequency'] = self._get_sender_frequency(emails[index].get('sender', ''))
+                cached[index] = features
+        
+        hits = sum(features is not None for features in cached)
+        self.metrics.cache_result('feature_store', 'hit').inc(hits)
+        self.metrics.cache_result('feature_store', 'miss').inc(len(positions) - hits)
+        return cached
+    
+    def train_models(self, user_id: Optional[int] = None, lost: Optional[threading.Event] = None) -> Dict[str, float]:
+        """Train multiple ML models and select the best one
+        
+        lost is the training lease's lost event (see run_training_job).
+        """
         self.logger.info(f"Starting model training for user {user_id or 'global'}")
         
-        # Prepare data
-        X, y = self.prepare_training_data(user_id)
+        # In hierarchical mode users only get a personalization layer
+        if user_id and self.config.get('hierarchical_models'):
+            scores = self.train_personalization(user_id, lost)
+            if scores is not None:
+                return scores
+        
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import LabelEncoder
+        
+        # Prepare data, with hashed text for the candidates that take it
+        text_models = self._text_models()
+        text_chunks = [] if text_models else None
+        X, y = self.prepare_training_data(user_id, text_chunks=text_chunks)
         if X is None or y is None:
             return {}
         
-        # Split data
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y
-        )
+        columns = list(X.columns)
+        watermark = int(X.index.max())
+        labels = y.to_numpy()
         
-        # Scale features
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
+        # Split row positions; feature rows are copied once, straight into the worker files
+        train_idx, test_idx = train_test_split(
+            np.arange(len(labels)), test_size=0.2, random_state=42, stratify=labels
+        )
+        T_train = T_test = None
+        if text_chunks:
+            import scipy.sparse as sp
+            text = sp.vstack(text_chunks, format='csr')
+            T_train, T_test = text[train_idx], text[test_idx]
+            del text, text_chunks
         
         # Encode labels
         label_encoder = LabelEncoder()
-        y_train_encoded = label_encoder.fit_transform(y_train)
-        y_test_encoded = label_encoder.transform(y_test)
-        
-        # Define models to train
-        models_to_train = {
-            'random_forest': RandomForestClassifier(
-                n_estimators=100, random_state=42, n_jobs=-1
-            ),
-            'gradient_boosting': GradientBoostingClassifier(
-                n_estimators=100, random_state=42
-            ),
-            'logistic_regression': LogisticRegression(
-                random_state=42, max_iter=1000
-            ),
-            'neural_network': MLPClassifier(
-                hidden_layer_sizes=(100, 50), random_state=42, max_iter=500
-            )
-        }
-        
-        # Train and evaluate models
-        model_scores = {}
-        best_model = None
-        best_score = 0
+        y_train_encoded = label_encoder.fit_transform(labels[train_idx])
+        y_test_encoded = label_encoder.transform(labels[test_idx])
         
-        for model_name, model in models_to_train.items():
-            try:
-                self.logger.info(f"Training {model_name}...")
-                
-                # Train model
-                if model_name in ['logistic_regression', 'neural_network']:
-                    model.fit(X_train_scaled, y_train_encoded)
-                    y_pred = model.predict(X_test_scaled)
-                else:
-                    model.fit(X_train, y_train_encoded)
-                    y_pred = model.predict(X_test)
-                
-                # Evaluate
-                accuracy = accuracy_score(y_test_encoded, y_pred)
-                model_scores[model_name] = accuracy
+        # Train and evaluate models concurrently; workers memory-map the
+        # arrays from disk instead of receiving pickled copies
+        data_dir = tempfile.mkdtemp(prefix='rotz_train_', dir=self.config.get('training_tmp_dir'))
+        try:
+            matrices = {}
+            for name, positions in (('X_train', train_idx), ('X_test', test_idx)):
+                matrices[name] = gather_rows(X, positions, np.lib.format.open_memmap(
+                    os.path.join(data_dir, f'{name}.npy'), mode='w+', dtype=np.float32, shape=(len(positions), len(columns))
+                ))
+            # The typed buffer is no longer needed once its rows are in the files
+            del X
+            
+            # Scale features in place, in copies of the unscaled files
+            scaler = fit_scaler(matrices['X_train'], columns)
+            for name in ('X_train', 'X_test'):
+                scaled = np.lib.format.open_memmap(
+                    os.path.join(data_dir, f'{name}_scaled.npy'), mode='w+', dtype=np.float32,
+                    shape=matrices[name].shape
+                )
+                scaled[:] = matrices[name]
+                standardize(scaled, scaler).flush()
+                del scaled
+            
+            for name, array in (('y_train', y_train_encoded), ('y_test', y_test_encoded)):
+                np.save(os.path.join(data_dir, f'{name}.npy'), array)
+            if T_train is not None:
+                sp.save_npz(os.path.join(data_dir, 'T_train.npz'), T_train, compressed=False)
+                sp.save_npz(os.path.join(data_dir, 'T_test.npz'), T_test, compressed=False)
+            
+            # Define models to train
+            worker_budget = self.config.get('training_workers') or os.cpu_count() or 1
+            hyperparameters = self._tuned_hyperparameters(user_id, matrices['X_train'], y_train_encoded, worker_budget)
+            models_to_train = self._candidate_models(worker_budget, hyperparameters)
+            
+            model_scores = self._fit_candidates(models_to_train, data_dir, worker_budget, text_models)
+            
+            # Select the best model, earliest candidate winning ties
+            best_model = None
+            best_score = 0
+            for model_name in models_to_train:
+                if model_scores[model_name] > best_score:
+                    best_score = model_scores[model_name]
+                    best_model = model_name
+            
+            # Only the winner is loaded back and written to the model directory
+            if best_model:
+                model = joblib.load(os.path.join(data_dir, f'{best_model}.joblib'))
+                model_key = f"user_{user_id}" if user_id else "global"
+                model_scaler = scaler if best_model in self.SCALED_MODELS else None
+                uses_text = T_train is not None and best_model in text_models
+                trained_at = datetime.now().isoformat()
                 
-                self.logger.info(f"{model_name} accuracy: {accuracy:.4f}")
+                model_data = {
+                    'model': model,
+                    'scaler': model_scaler,
+                    'label_encoder': label_encoder,
+                    'feature_columns': columns,
+                    'model_type': best_model,
+                    'hyperparameters': hyperparameters.get(best_model),
+                    # The hasher is stateless; its parameters are all a model needs to rebuild it
+                    'text_features': self.text_hasher.params() if uses_text else None,
+                    'accuracy': best_score,
+                    'trained_at': trained_at,
+                    # Incremental updates continue from the newest email trained on
+                    'watermark': watermark,
+                    'full_trained_at': trained_at,
+                    'incremental_updates': 0,
+                }
+                # Verify against float64 inputs, as served, rather than the float32 training matrix;
+                # compiled exports only take the dense features
+                raw_test = matrices['X_test'].astype(np.float64)
+                model_data['compiled'] = None if uses_text else self._compile_model(
+                    model, model_scaler, label_encoder, raw_test,
+                    model_scaler.transform(raw_test) if model_scaler is not None else raw_test,
+                    labels=y_test_encoded
+                )
+                self._check_lease(model_key, lost)
+                self._install_model(model_key, model_data)
                 
-                # Save best model
-                if accuracy > best_score:
-                    best_score = accuracy
-                    best_model = model_name
-                    
-                    # Save model, scaler, and encoder
-                    model_key = f"user_{user_id}" if user_id else "global"
-                    
-                    self.models[model_key] = model
-                    self.scalers[model_key] = scaler if model_name in ['logistic_regression', 'neural_network'] else None
-                    self.label_encoders[model_key] = label_encoder
-                    
-                    # Save to disk
-                    model_path = os.path.join(self.model_dir, f"{model_key}_{model_name}.joblib")
-                    joblib.dump({
-                        'model': model,
-                        'scaler': scaler,
-                        'label_encoder': label_encoder,
-                        'feature_columns': list(X.columns),
-                        'model_type': model_name,
-                        'accuracy': accuracy,
-                        'trained_at': datetime.now().isoformat()
-                    }, model_path)
-                    
-            except Exception as e:
-                self.logger.error(f"Error training {model_name}: {e}")
-                model_scores[model_name] = 0.0
+                # Save to disk, and time loading it back as a cold prediction would; the served
+                # accuracy and compaction stay in the artifact metadata, its size in the manifest
+                self.model_registry.save(model_key, model_data, best_model)
+                artifact_bytes = self.model_registry.entries()[model_key]['size']
+                cold_load_ms = self._cold_load_seconds(model_key, raw_test[:1]) * 1000
+                served_accuracy = model_data['compiled']['accuracy'] if model_data['compiled'] is not None else best_score
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
         
-        self.logger.info(f"Best model: {best_model} with accuracy: {best_score:.4f}")
+        if best_model:
+            self.logger.info(
+                f"Best model: {best_model} with accuracy: {best_score:.4f} (served {served_accuracy:.4f}), "
+                f"artifact {artifact_bytes / 1024:.0f} KiB, cold load {cold_load_ms:.1f} ms"
+            )
+        else:
+            self.logger.info(f"Best model: {best_model} with accuracy: {best_score:.4f}")
         
         # Update model metadata in database
         self._update_model_metadata(user_id, best_model, best_score, model_scores)
         
         return model_scores
     
-    def predict_email_action(self, email_data: Dict, user_id: Optional[int] = None) -> Dict:
-        """Predict the best action for an email"""
+    def update_model(self, user_id: Optional[int] = None, lost: Optional[threading.Event] = None) -> Dict[str, float]:
+        """Bring a model up to date, incrementally when possible and with a full retrain otherwise"""
+        # Personalization layers are small enough to always refit
+        if user_id and self.config.get('hierarchical_models'):
+            return self.train_models(user_id, lost)
+        
+        scores = self._update_incrementally(user_id, lost)
+        if scores is None:
+            return self.train_models(user_id, lost)
+        return scores
+    
+    def _update_incrementally(self, user_id: Optional[int] = None,
+                              lost: Optional[threading.Event] = None) -> Optional[Dict[str, float]]:
+        """Fold the emails received since the model's watermark into a copy of it
+        
+        Only the new emails are read and featurized, so the cost follows the
+        number of new emails rather than the training window. The serving
+        model is first scored on them (test-then-train) to catch drift.
+        Returns the update's scores, {} when there are too few new emails yet,
+        or None when the model needs a full retrain instead.
+        """
+        if not self.config.get('incremental_training', True):
+            return None
+        
+        model_key = f"user_{user_id}" if user_id else "global"
         try:
-            # Get model
-            model_key = f"user_{user_id}" if user_id else "global"
-            
-            if model_key not in self.models:
-                # Try to load from disk
-                self._load_model(model_key)
-            
-            if model_key not in self.models:
-                # Fallback to global model
-                if "global" not in self.models:
-                    self._load_model("global")
-                model_key = "global"
-            
-            if model_key not in self.models:
-                return {
-                    'predicted_action': 'normal',
-                    'confidence': 0.0,
-                    'error': 'No trained model available'
-                }
+            model_data = self.model_registry.get(model_key)
+        except Exception as e:
+            self.logger.error(f"Error loading model {model_key}: {e}")
+            return None
+        
+        reason = self._full_retrain_reason(model_data)
+        if reason:
+            self.logger.info(f"Full retrain of {model_key}: {reason}")
+            return None
+        
+        text_hasher = TextHasher.from_params(model_data['text_features']) if model_data.get('text_features') else None
+        text_chunks = [] if text_hasher else None
+        X, y = self.prepare_training_data(
+            user_id, min_samples=self.config.get('incremental_min_samples', 100),
+            since_id=model_data['watermark'], text_chunks=text_chunks, text_hasher=text_hasher
+        )
+        if X is None or y is None:
+            return {}
+        
+        try:
+            label_encoder = model_data['label_encoder']
+            unseen = set(y.unique()) - set(label_encoder.classes_)
+            if unseen:
+                self.logger.info(f"Full retrain of {model_key}: new actions {sorted(unseen)}")
+                return None
             
-            # Extract features
-            features = self.extract_features(email_data)
+            scaler = model_data.get('scaler')
+            features = X.to_numpy(dtype=np.float64)
+            model_input = scaler.transform(features) if scaler is not None else features
+            if text_chunks:
+                import scipy.sparse as sp
+                model_input = TextHasher.combine(model_input, sp.vstack(text_chunks, format='csr'))
+            labels = label_encoder.transform(y)
             
-            # Prepare feature vector
-            feature_df = pd.DataFrame([features])
+            accuracy = float(np.mean(model_data['model'].predict(model_input) == labels))
+            tolerance = self.config.get('incremental_drift_tolerance', 0.05)
+            if accuracy < model_data['accuracy'] - tolerance:
+                self.logger.info(
+                    f"Full retrain of {model_key}: accuracy on new emails {accuracy:.4f} "
+                    f"vs {model_data['accuracy']:.4f} at training"
+                )
+                return None
             
-            # Ensure all required columns are present
-            for col in self.feature_columns:
-                if col not in feature_df.columns:
-                    feature_df[col] = 0
+            # Update a copy; the loaded model keeps serving until the swap
+            model = self._partial_update(model_data['model_type'], copy.deepcopy(model_data['model']),
+                                         model_input, labels)
+            if model is None:
+                self.logger.info(f"Deferring update of {model_key}: new emails do not cover every action yet")
+                return {}
+        except Exception as e:
+            self.logger.error(f"Error updating model {model_key} incrementally: {e}")
+            return None
+        
+        compaction = (model_data.get('compiled') or {}).get('compaction')
+        updated = dict(
+            model_data,
+            model=model,
+            trained_at=datetime.now().isoformat(),
+            watermark=int(X.index.max()),
+            incremental_updates=model_data.get('incremental_updates', 0) + 1,
+            # New emails are not held out, so only reapply the compaction chosen at the last full retrain
+            compiled=None if text_hasher else self._compile_model(
+                model, scaler, label_encoder, features, model_input,
+                labels=labels if compaction else None, compaction=compaction
+            ),
+        )
+        self._check_lease(model_key, lost)
+        self._install_model(model_key, updated)
+        self.model_registry.save(model_key, updated, model_data['model_type'])
+        
+        self.logger.info(f"Updated {model_key} with {len(X)} new emails; accuracy on them before the update: {accuracy:.4f}")
+        # Accuracy and candidate scores stay those of the last full retrain
+        self._touch_model_metadata(user_id)
+        return {'incremental_accuracy': accuracy, 'new_samples': len(X)}
+    
+    def _full_retrain_reason(self, model_data: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Why a model cannot be updated incrementally, or None when it can"""
+        if model_data is None:
+            return "no model yet"
+        if 'watermark' not in model_data:
+            return "model predates incremental updates"
+        if model_data['model_type'] not in self.INCREMENTAL_MODELS:
+            return f"{model_data['model_type']} cannot be updated incrementally"
+        if model_data['feature_columns'] != self._training_columns():
+            return "feature columns changed"
+        text_features = self.text_hasher.params() if model_data['model_type'] in self._text_models() else None
+        if model_data.get('text_features') != text_features:
+            return "text features changed"
+        
+        full_trained_at = datetime.fromisoformat(model_data['full_trained_at'])
+        if (datetime.now() - full_trained_at).total_seconds() >= self.config.get('full_retrain_interval', 604800):
+            return f"last full retrain at {model_data['full_trained_at']}"
+        
+        if model_data['model_type'] != 'neural_network':
+            trees = model_data['model'].n_estimators + self.config.get('incremental_trees', 10)
+            if trees > self.config.get('incremental_max_trees', 300):
+                return f"model would grow to {trees} trees"
+        return None
+    
+    def _partial_update(self, model_type: str, model, model_input: np.ndarray, labels: np.ndarray):
+        """Train a fitted model further on new rows; None when these rows cannot be used yet"""
+        present = set(np.unique(labels))
+        
+        if model_type == 'neural_network':
+            for _ in range(self.config.get('incremental_epochs', 5)):
+                model.partial_fit(model_input, labels)
+            return model
+        
+        # Added trees are fit on the new rows alone; they must see every class
+        # or their outputs would not line up with the existing trees'
+        if present != set(model.classes_):
+            return None
+        model.set_params(warm_start=True, n_estimators=model.n_estimators + self.config.get('incremental_trees', 10))
+        model.fit(model_input, labels)
+        return model
+    
+    def _compile_model(self, model, scaler, label_encoder, raw_features: np.ndarray, model_input,
+                       labels: Optional[np.ndarray] = None,
+                       compaction: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Export a model for compiled inference, verified against sklearn on held-out rows
+        
+        With labels, tree exports are then compacted as far as the held-out
+        accuracy allows (_compact_model); compaction fixes the settings to use.
+        """
+        try:
+            compiled = CompiledModel.compile(model, scaler)
+            if compiled is None:
+                return None
+            
+            probabilities = model.predict_proba(model_input)
+            difference = float(np.max(np.abs(
+                compiled.predict_proba(raw_features) - probabilities
+            ))) if len(raw_features) else 0.0
+            tolerance = self.config.get('compiled_tolerance', 1e-6)
+            if difference > tolerance:
+                self.logger.warning(
+                    f"Compiled {type(model).__name__} differs from sklearn by {difference:.2e}; not exported"
+                )
+                return None
+            
+            accuracy = float(np.mean(probabilities.argmax(axis=1) == labels)) if labels is not None else None
+            settings = {'max_depth': None, 'quantized': False}
+            if labels is not None and compiled.kind == 'trees' and len(raw_features):
+                compiled, settings, accuracy = self._compact_model(
+                    model, compiled, raw_features, labels, accuracy, compaction
+                )
+        except Exception as e:
+            self.logger.error(f"Error compiling model: {e}")
+            return None
+        
+        return {
+            'arrays': compiled.arrays,
+            'class_labels': label_encoder.inverse_transform(model.classes_),
+            'feature_importances': getattr(model, 'feature_importances_', None),
+            'max_difference': difference,
+            'accuracy': accuracy,
+            'compaction': dict(settings, nodes=compiled.node_count),
+        }
+    
+    def _compact_model(self, model, compiled: CompiledModel, raw_features: np.ndarray, labels: np.ndarray,
+                       accuracy: float, compaction: Optional[Dict[str, Any]] = None):
+        """Smallest tree export whose held-out accuracy stays within tolerance of the exact one
+        
+        Depth caps are tried shallowest first, each with quantized leaf values
+        when enabled; returns the export, its settings and its accuracy.
+        """
+        quantize = self.config.get('artifact_quantize', True)
+        if compaction is not None:
+            candidates = [(compaction['max_depth'], compaction['quantized'])]
+        else:
+            depth = compiled.arrays['max_depth']
+            caps = sorted(cap for cap in self.config.get('artifact_depth_caps') or [] if cap < depth)
+            candidates = [(cap, quantize) for cap in caps] + ([(None, True)] if quantize else [])
+        
+        minimum = accuracy - self.config.get('artifact_accuracy_tolerance', 0.002)
+        for max_depth, quantized in candidates:
+            if max_depth is None and not quantized:
+                break
+            candidate = CompiledModel.compile(model, max_depth=max_depth, quantize=quantized)
+            candidate_accuracy = float(np.mean(candidate.predict_proba(raw_features).argmax(axis=1) == labels))
+            if candidate_accuracy >= minimum:
+                self.logger.info(
+                    f"Compacted {type(model).__name__} to {candidate.node_count} of {compiled.node_count} nodes "
+                    f"(depth cap {max_depth}, quantized {quantized}): accuracy {candidate_accuracy:.4f} vs {accuracy:.4f}"
+                )
+                return candidate, {'max_depth': max_depth, 'quantized': quantized}, candidate_accuracy
+        return compiled, {'max_depth': None, 'quantized': False}, accuracy
+    
+    def _cold_load_seconds(self, model_key: str, raw_features: np.ndarray) -> float:
+        """Time from reading a model's file to its first prediction, as in a fresh process"""
+        start = time.perf_counter()
+        model_data = self.model_registry.read(model_key)
+        compiled = model_data.get('compiled') if self.config.get('compiled_inference', True) else None
+        if compiled is not None:
+            CompiledModel(compiled['arrays']).predict_proba(raw_features)
+        else:
+            # Uncompiled models serve from the estimator, read on first use
+            model_data.get('model')
+        return time.perf_counter() - start
+    
+    def train_personalization(self, user_id: int,
+                              lost: Optional[threading.Event] = None) -> Optional[Dict[str, float]]:
+        """Fit a small per-user calibration layer on top of the global model
+        
+        The layer is a logistic regression over the global model's log
+        probabilities and the user's standardized features, so it costs a few
+        kilobytes per user. Returns None when no global model exists yet.
+        """
+        model_key, serving = self._resolve_model(None)
+        if model_key != 'global':
+            self.logger.warning(f"No global model for hierarchical training; training user {user_id} independently")
+            return None
+        
+        # A global model with text features scores the user's emails with its own hasher
+        text_chunks = [] if serving['text_hasher'] is not None else None
+        X, y = self.prepare_training_data(user_id, min_samples=self.config.get('min_personalization_samples', 100),
+                                          text_chunks=text_chunks, text_hasher=serving['text_hasher'])
+        if X is None or y is None:
+            return {}
+        
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.metrics import accuracy_score
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import StandardScaler
+        
+        model_key = f"user_{user_id}"
+        try:
+            # The layer sees the rows the global model was trained on
+            features = X[serving['feature_columns']].to_numpy(dtype=np.float64)
+            labels = y.to_numpy()
+            if text_chunks:
+                import scipy.sparse as sp
+                text = sp.vstack(text_chunks, format='csr')
+            else:
+                text = None
+            global_probabilities, global_classes = self._global_probabilities(features, text)
             
-            feature_df = feature_df[self.feature_columns]
+            counts = y.value_counts()
+            train_idx, test_idx = train_test_split(
+                np.arange(len(labels)), test_size=0.2, random_state=42,
+                stratify=labels if counts.min() >= 2 else None
+            )
             
-            # Scale if needed
-            if self.scalers.get(model_key):
-                feature_vector = self.scalers[model_key].transform(feature_df)
+            scaler = StandardScaler().fit(features[train_idx])
+            calibrator = LogisticRegression(max_iter=1000, random_state=42)
+            calibrator.fit(self._personalization_inputs(global_probabilities[train_idx], scaler, features[train_idx]),
+                           labels[train_idx])
+            
+            # Compare both layers on the user's held-out emails
+            global_accuracy = accuracy_score(
+                labels[test_idx], global_classes[np.argmax(global_probabilities[test_idx], axis=1)]
+            )
+            personalized_accuracy = accuracy_score(
+                labels[test_idx],
+                calibrator.predict(self._personalization_inputs(global_probabilities[test_idx], scaler, features[test_idx]))
+            )
+        except Exception as e:
+            self.logger.error(f"Error training personalization for user {user_id}: {e}")
+            return {}
+        
+        scores = {'global_accuracy': global_accuracy, 'personalized_accuracy': personalized_accuracy}
+        self.logger.info(
+            f"User {user_id} global accuracy: {global_accuracy:.4f}, personalized: {personalized_accuracy:.4f}"
+        )
+        
+        # Keep the layer only when it does not hurt this user
+        self._check_lease(model_key, lost)
+        if personalized_accuracy >= global_accuracy:
+            personalization = {
+                'calibrator': calibrator,
+                'scaler': scaler,
+                'global_classes': list(global_classes),
+                'accuracy': personalized_accuracy,
+                'global_accuracy': global_accuracy,
+                'trained_at': datetime.now().isoformat()
+            }
+            self.model_registry.save(f"personal_{model_key}", personalization, 'personalized_calibration')
+            self.personalizations[model_key] = personalization
+            self._update_model_metadata(user_id, 'personalized_calibration', personalized_accuracy, scores)
+        else:
+            self.model_registry.remove(f"personal_{model_key}")
+            self.personalizations.pop(model_key, None)
+            self._update_model_metadata(user_id, 'global', global_accuracy, scores)
+        
+        return scores
+    
+    def _global_probabilities(self, features: np.ndarray, text=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Global model probabilities for raw feature rows, with their class labels"""
+        serving = self._load_model('global')
+        if serving is None:
+            raise ValueError("No global model available")
+        return self._score(serving, features, text)
+    
+    @staticmethod
+    def _personalization_inputs(global_probabilities: np.ndarray, scaler: 'StandardScaler',
+                                features: np.ndarray) -> np.ndarray:
+        """Inputs of a personalization layer: global log-probabilities plus scaled features"""
+        return np.hstack([np.log(np.clip(global_probabilities, 1e-6, 1.0)), scaler.transform(features)])
+    
+    def _personalize(self, personalization: Dict, probabilities: np.ndarray, class_labels: np.ndarray,
+                     features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Combine global probabilities with a user's personalization layer"""
+        if list(class_labels) != personalization['global_classes']:
+            # The global model was retrained with other classes; the layer is stale
+            return probabilities, class_labels
+        
+        calibrator = personalization['calibrator']
+        inputs = self._personalization_inputs(probabilities, personalization['scaler'], features)
+        return calibrator.predict_proba(inputs), calibrator.classes_
+    
+    def _resolve_personalization(self, user_id: Optional[int]) -> Optional[Dict]:
+        """Return the user's personalization layer in hierarchical mode, loading it on first use"""
+        if not user_id or not self.config.get('hierarchical_models'):
+            return None
+        
+        model_key = f"user_{user_id}"
+        try:
+            personalization = self.model_registry.get(f"personal_{model_key}")
+        except Exception as e:
+            self.logger.error(f"Error loading personalization {model_key}: {e}")
+            return None
+        
+        if personalization is None:
+            self.personalizations.pop(model_key, None)
+            return None
+        
+        self.personalizations[model_key] = personalization
+        return personalization
+    
+    def _candidate_models(self, worker_budget: int,
+                          hyperparameters: Optional[Dict[str, Dict]] = None) -> Dict[str, Any]:
+        """Candidate estimators, with the random forest using cores left over by the pool
+        
+        hyperparameters maps candidate names to tuned parameters that
+        replace the defaults below.
+        """
+        from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.neural_network import MLPClassifier
+        
+        parallel_fits = min(worker_budget, 4)
+        
+        candidates = {
+            'random_forest': RandomForestClassifier(
+                n_estimators=100, random_state=42, n_jobs=max(1, worker_budget - parallel_fits + 1)
+            ),
+            'gradient_boosting': GradientBoostingClassifier(
+                n_estimators=100, random_state=42
+            ),
+            'logistic_regression': LogisticRegression(
+                random_state=42, max_iter=1000
+            ),
+            'neural_network': MLPClassifier(
+                hidden_layer_sizes=(100, 50), random_state=42, max_iter=500
+            )
+        }
+        
+        selected = self.config.get('candidate_models')
+        if selected:
+            candidates = {name: model for name, model in candidates.items() if name in selected}
+        for name, params in (hyperparameters or {}).items():
+            if name in candidates:
+                candidates[name].set_params(**params)
+        return candidates
+    
+    def _tuned_hyperparameters(self, user_id: Optional[int], X_train: np.ndarray, y_train: np.ndarray,
+                               worker_budget: int) -> Dict[str, Dict]:
+        """Per-candidate parameters from a budgeted search, or remembered from a recent one
+        
+        Only the training split is searched, so the holdout that picks the
+        winner stays unseen. A user without a remembered configuration
+        starts the search from the global model's.
+        """
+        if not self.config.get('hyperparameter_search'):
+            return {}
+        
+        model_key = f"user_{user_id}" if user_id else "global"
+        candidates = self._candidate_models(worker_budget)
+        try:
+            store = HyperparameterStore(os.path.join(self.model_dir, 'hyperparameters'), logger=self.logger)
+            remembered = store.get(model_key)
+            if remembered:
+                age = (datetime.now() - datetime.fromisoformat(remembered['searched_at'])).total_seconds()
+                if age < self.config.get('search_max_age', 2592000) and set(candidates) <= set(remembered['estimators']):
+                    self.logger.info(f"Reusing hyperparameters for {model_key} searched {age / 3600:.1f}h ago")
+                    return {name: remembered['estimators'][name]['params'] for name in candidates}
             else:
-                feature_vector = feature_df.values
+                remembered = store.get('global') if user_id else None
+            
+            search = HyperparameterSearch(
+                folds=self.config.get('search_folds', 3),
+                eta=self.config.get('search_eta', 3),
+                min_rows=self.config.get('search_min_rows', 500),
+                n_jobs=worker_budget,
+                budget_seconds=self.config.get('search_budget_seconds', 600),
+                cpu_budget_seconds=self.config.get('search_cpu_budget_seconds'),
+                tmp_dir=self.config.get('training_tmp_dir'),
+                logger=self.logger
+            )
+            seeds = {name: entry['params'] for name, entry in (remembered or {}).get('estimators', {}).items()}
+            start = time.perf_counter()
+            results = search.run(
+                X_train, y_train, candidates, self.SCALED_MODELS,
+                n_configs=self.config.get('search_candidates', 27), seeds=seeds
+            )
+            self.logger.info(f"Hyperparameter search for {model_key} took {time.perf_counter() - start:.1f}s: "
+                             + ", ".join(f"{name} {entry['score']:.4f}" for name, entry in results.items()))
+            if results:
+                store.save(model_key, results)
+            return {name: entry['params'] for name, entry in results.items()}
+            
+        except Exception as e:
+            self.logger.error(f"Error in hyperparameter search: {e}")
+            return {}
+    
+    def _text_models(self) -> List[str]:
+        """Candidates trained with the hashed text features, empty when they are disabled"""
+        if self.text_hasher is None:
+            return []
+        return list(self.config.get('text_feature_models', ['logistic_regression']))
+    
+    def _fit_candidates(self, models_to_train: Dict[str, Any], data_dir: str,
+                        worker_budget: int, text_models: Optional[List[str]] = None) -> Dict[str, float]:
+        """Fit candidates in worker processes, aborting any that exceed the per-model timeout"""
+        timeout = self.config.get('candidate_timeout', 1800)
+        # Fork from a single-threaded server rather than from this process, whose other
+        # threads (lease heartbeats, retrain-all, serving) may hold locks at fork time;
+        # the server imports this module once, so workers start without re-importing
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        
+        pending = list(models_to_train.items())
+        running = {}  # model_name -> (process, parent_conn, started_at)
+        model_scores = {}
+        
+        while pending or running:
+            # Start candidates while the worker budget allows
+            while pending and len(running) < worker_budget:
+                model_name, model = pending.pop(0)
+                threads = model.n_jobs if model_name == 'random_forest' else 1
+                parent_conn, child_conn = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=_fit_candidate,
+                    args=(model_name, model, data_dir, model_name in self.SCALED_MODELS,
+                          model_name in (text_models or []), threads, child_conn),
+                    daemon=True
+                )
+                self.logger.info(f"Training {model_name}...")
+                process.start()
+                child_conn.close()
+                running[model_name] = (process, parent_conn, time.monotonic())
+            
+            # Wait until a worker finishes or the nearest deadline passes
+            now = time.monotonic()
+            wait_for = min(started + timeout - now for _, _, started in running.values()) if timeout else None
+            multiprocessing.connection.wait(
+                [process.sentinel for process, _, _ in running.values()],
+                timeout=max(0, wait_for) if wait_for is not None else None
+            )
+            
+            for model_name, (process, parent_conn, started) in list(running.items()):
+                if not process.is_alive():
+                    process.join()
+                    status, value = parent_conn.recv() if parent_conn.poll() else (
+                        'error', f"worker exited with code {process.exitcode}"
+                    )
+                elif timeout and time.monotonic() - started > timeout:
+                    process.terminate()
+                    process.join()
+                    status, value = 'error', f"timed out after {timeout}s"
+                else:
+                    continue
+                
+                parent_conn.close()
+                del running[model_name]
+                self._fit_seconds.observe(time.monotonic() - started, model=model_name, status=status)
+                
+                if status == 'ok':
+                    model_scores[model_name] = value
+                    self.logger.info(f"{model_name} accuracy: {value:.4f}")
+                else:
+                    self.logger.error(f"Error training {model_name}: {value}")
+                    model_scores[model_name] = 0.0
+        
+        return {model_name: model_scores[model_name] for model_name in models_to_train}
+    
+    def predict_email_action(self, email_data: Dict, user_id: Optional[int] = None) -> Dict:
+        """Predict the best action for an email"""
+        with self._predict_seconds.time(mode='single'):
+            return self._predict_email_action(email_data, user_id)
+    
+    def _predict_email_action(self, email_data: Dict, user_id: Optional[int] = None) -> Dict:
+        try:
+            # Get model
+            model_key, serving = self._resolve_model(user_id)
+            
+            if model_key is None:
+                self._no_model_errors.inc()
+                return {
+                    'predicted_action': 'normal',
+                    'confidence': 0.0,
+                    'error': 'No trained model available'
+                }
+            
+            # Reuse the prediction of a near-duplicate predicted before
+            personalization = self._resolve_personalization(user_id) if model_key == 'global' else None
+            duplicate_key = audited = None
+            if self._reuses_duplicates(serving, batch=False):
+                duplicate_key = self._duplicate_keys([email_data], [user_id], model_key, serving, personalization)[0]
+                stored = self.duplicate_index.find(*duplicate_key)
+                if stored is not None:
+                    if not self._audit_due():
+                        return self._reused_prediction(stored, serving)
+                    audited = stored
+            
+            # Extract features, reusing the stored vector for emails seen before
+            features = self._cached_features([email_data])[0] or self.extract_features(email_data)
+            
+            # Preordered feature vector, missing values as zero
+            raw_features = np.array([[features.get(col, 0) for col in serving['feature_columns']]], dtype=np.float64)
             
             # Predict
-            model = self.models[model_key]
-            prediction = model.predict(feature_vector)[0]
-            probabilities = model.predict_proba(feature_vector)[0]
+            probabilities, class_labels = self._score(serving, raw_features, self._text_matrix(serving, [email_data]))
+            
+            # Combine with the user's personalization layer when served by the global model
+            model_used = model_key
+            if personalization:
+                probabilities, class_labels = self._personalize(
+                    personalization, probabilities, class_labels, raw_features
+                )
+                model_used = f"global+user_{user_id}"
             
             # Decode prediction
-            predicted_action = self.label_encoders[model_key].inverse_transform([prediction])[0]
-            confidence = max(probabilities)
+            probabilities = probabilities[0]
+            best = int(np.argmax(probabilities))
+            predicted_action = class_labels[best]
+            confidence = probabilities[best]
             
             # Get feature importance (for tree-based models)
-            feature_importance = {}
-            if hasattr(model, 'feature_importances_'):
-                for i, importance in enumerate(model.feature_importances_):
-                    if importance > self.config['feature_importance_threshold']:
-                        feature_importance[self.feature_columns[i]] = importance
+            feature_importance = self._feature_importance(serving)
             
-            return {
+            result = {
                 'predicted_action': predicted_action,
                 'confidence': float(confidence),
                 'probabilities': {
-                    self.label_encoders[model_key].inverse_transform([i])[0]: float(prob)
-                    for i, prob in enumerate(probabilities)
+                    label: float(prob)
+                    for label, prob in zip(class_labels, probabilities)
                 },
                 'feature_importance': feature_importance,
-                'model_used': model_key
+                'model_used': model_used
             }
+            if audited is not None:
+                self._audit_duplicate(audited, result)
+            elif duplicate_key is not None:
+                self.duplicate_index.add(*duplicate_key, self._duplicate_entry(result))
+            return result
             
         except Exception as e:
             self.logger.error(f"Error predicting email action: {e}")
@@ -578,37 +1999,424 @@ class EmailPredictor:
                 'error': str(e)
             }
     
-    def _load_model(self, model_key: str) -> bool:
-        """Load model from disk"""
-        try:
-            # Find the latest model file
-            model_files = [f for f in os.listdir(self.model_dir) if f.startswith(f"{model_key}_")]
-            if not model_files:
-                return False
-            
-            # Load the most recent model
-            latest_model = max(model_files, key=lambda x: os.path.getctime(os.path.join(self.model_dir, x)))
-            model_path = os.path.join(self.model_dir, latest_model)
-            
-            model_data = joblib.load(model_path)
-            
-            self.models[model_key] = model_data['model']
-            self.scalers[model_key] = model_data.get('scaler')
-            self.label_encoders[model_key] = model_data['label_encoder']
+    def predict_email_actions(self, emails: List[Dict],
+                              user_ids: Optional[List[Optional[int]]] = None,
+                              user_id: Optional[int] = None) -> List[Dict]:
+        """Predict the best action for many emails, returning results in input order"""
+        with self._predict_seconds.time(mode='batch'):
+            return self._predict_email_actions(emails, user_ids, user_id)
+    
+    def _predict_email_actions(self, emails: List[Dict], user_ids: Optional[List[Optional[int]]],
+                               user_id: Optional[int]) -> List[Dict]:
+        if user_ids is None:
+            user_ids = [user_id] * len(emails)
+        elif len(user_ids) != len(emails):
+            raise ValueError("user_ids must have the same length as emails")
+        
+        results: List[Optional[Dict]] = [None] * len(emails)
+        
+        # Group emails by the model (and personalization layer) that will serve them
+        groups: Dict[Tuple[str, Optional[int]], List[int]] = {}
+        resolved_keys: Dict[Optional[int], Tuple[Optional[str], Optional[int]]] = {}
+        # One bundle per model for the whole batch, even if a retrain swaps it meanwhile
+        serving_models: Dict[str, Dict[str, Any]] = {}
+        for index, uid in enumerate(user_ids):
+            if uid not in resolved_keys:
+                model_key, serving = self._resolve_model(uid)
+                if model_key is not None:
+                    serving = serving_models.setdefault(model_key, serving)
+                personal_user = uid if model_key == 'global' and self._resolve_personalization(uid) else None
+                resolved_keys[uid] = (model_key, personal_user)
+            model_key, personal_user = resolved_keys[uid]
             
-            self.logger.info(f"Loaded model {model_key} from {model_path}")
+            if model_key is None:
+                self._no_model_errors.inc()
+                results[index] = {
+                    'predicted_action': 'normal',
+                    'confidence': 0.0,
+                    'error': 'No trained model available'
+                }
+            else:
+                groups.setdefault((model_key, personal_user), []).append(index)
+        
+        for (model_key, personal_user), indices in groups.items():
+            try:
+                if self._reuses_duplicates(serving_models[model_key], batch=True):
+                    self._predict_group_deduplicated(model_key, serving_models[model_key], emails, indices, results,
+                                                     personal_user, user_ids)
+                else:
+                    self._predict_group(model_key, serving_models[model_key], emails, indices, results, personal_user)
+            except Exception as e:
+                self.logger.error(f"Error predicting batch for {model_key}: {e}")
+                for index in indices:
+                    if results[index] is None:
+                        results[index] = {
+                            'predicted_action': 'normal',
+                            'confidence': 0.0,
+                            'error': str(e)
+                        }
+        
+        return results
+    
+    def _predict_group(self, model_key: str, serving: Dict[str, Any], emails: List[Dict], indices: List[int],
+                       results: List[Optional[Dict]], personal_user: Optional[int] = None):
+        """Run one predict_proba call for all emails served by the same model"""
+        # Extract features, isolating per-email failures
+        rows = []
+        row_indices = []
+        cached = self._cached_features([emails[index] for index in indices])
+        computed = self._extract_uncached([emails[index] for index in indices], cached, serving['feature_columns'])
+        for index, features in zip(indices, computed):
+            try:
+                features = features or self.extract_features(emails[index])
+            except Exception as e:
+                self.logger.error(f"Error extracting features for email {emails[index].get('id')}: {e}")
+                results[index] = {
+                    'predicted_action': 'normal',
+                    'confidence': 0.0,
+                    'error': str(e)
+                }
+                continue
+            rows.append([features.get(col, 0) for col in serving['feature_columns']])
+            row_indices.append(index)
+        
+        if not rows:
+            return
+        
+        raw_features = np.asarray(rows, dtype=np.float64)
+        
+        # Single probability pass, with every class label decoded once
+        probabilities, class_labels = self._score(
+            serving, raw_features, self._text_matrix(serving, [emails[index] for index in row_indices])
+        )
+        
+        model_used = model_key
+        personalization = self._resolve_personalization(personal_user) if personal_user else None
+        if personalization:
+            probabilities, class_labels = self._personalize(
+                personalization, probabilities, class_labels, raw_features
+            )
+            model_used = f"global+user_{personal_user}"
+        
+        # The prediction is the argmax of the probabilities
+        best = np.argmax(probabilities, axis=1)
+        confidences = probabilities[np.arange(len(best)), best]
+        predicted_actions = class_labels[best]
+        
+        # Feature importance is a property of the model, not the email
+        feature_importance = self._feature_importance(serving)
+        
+        for row, index in enumerate(row_indices):
+            results[index] = {
+                'predicted_action': predicted_actions[row],
+                'confidence': float(confidences[row]),
+                'probabilities': {
+                    label: float(prob)
+                    for label, prob in zip(class_labels, probabilities[row])
+                },
+                'feature_importance': feature_importance,
+                'model_used': model_used
+            }
+    
+    def _predict_group_deduplicated(self, model_key: str, serving: Dict[str, Any], emails: List[Dict],
+                                    indices: List[int], results: List[Optional[Dict]],
+                                    personal_user: Optional[int], user_ids: List[Optional[int]]):
+        """_predict_group, reusing stored predictions for near-duplicates of emails predicted before
+        
+        Copies within the batch are predicted once: only the first email of
+        each cluster goes to the model, and the rest then find its prediction.
+        """
+        personalization = self._resolve_personalization(personal_user) if personal_user else None
+        batch_keys = self._duplicate_keys(
+            [emails[index] for index in indices], [user_ids[index] for index in indices],
+            model_key, serving, personalization
+        )
+        keys = dict(zip(indices, batch_keys))
+        leaders, followers = [], []
+        for position, leader in enumerate(self.duplicate_index.cluster(batch_keys)):
+            (leaders if leader == position else followers).append(indices[position])
+        
+        to_predict, audited = [], {}
+        for index, stored in zip(leaders, self.duplicate_index.find_many([keys[index] for index in leaders])):
+            if stored is None:
+                to_predict.append(index)
+            elif self._audit_due():
+                to_predict.append(index)
+                audited[index] = stored
+            else:
+                results[index] = self._reused_prediction(stored, serving)
+        self._predict_group(model_key, serving, emails, to_predict, results, personal_user)
+        self._remember_predictions(keys, to_predict, results, audited)
+        
+        # Followers of a leader that failed are predicted themselves
+        missing = []
+        for index, stored in zip(followers, self.duplicate_index.find_many([keys[index] for index in followers])):
+            if stored is None:
+                missing.append(index)
+            else:
+                results[index] = self._reused_prediction(stored, serving)
+        if missing:
+            self._predict_group(model_key, serving, emails, missing, results, personal_user)
+            self._remember_predictions(keys, missing, results, {})
+    
+    def _duplicate_keys(self, emails: List[Dict], user_ids: List[Optional[int]], model_key: str,
+                        serving: Dict[str, Any], personalization: Optional[Dict]) -> List[Tuple[str, int]]:
+        """(scope, fingerprint) of each email in the duplicate index
+        
+        The scope pins the user, the sender (features such as
+        sender_frequency and the spam checks depend on it, so the same text
+        from another sender is not a duplicate) and the exact model version
+        (and personalization layer), so a retrain never serves stale predictions.
+        """
+        version = f"{model_key}|{serving['version']}|{personalization['trained_at'] if personalization else ''}"
+        fingerprints = self.duplicate_index.fingerprints(
+            [(email.get('subject') or '', email.get('body') or '') for email in emails]
+        )
+        senders = [email.get('sender') or '' for email in emails]
+        sender_digests = {sender: self._sender_digest(sender) for sender in set(senders)}
+        return [
+            (f"{user_id or 0}|{sender_digests[sender]}|{version}", fingerprint)
+            for user_id, sender, fingerprint in zip(user_ids, senders, fingerprints)
+        ]
+    
+    @staticmethod
+    def _sender_digest(sender: str) -> str:
+        """Short digest of a sender's normalized address, so 'Ann <ann@x.org>' and 'ANN@x.org' match"""
+        address = parseaddr(sender)[1] or sender
+        return hashlib.blake2b(address.strip().lower().encode(), digest_size=8).hexdigest()
+    
+    def _remember_predictions(self, keys: Dict[int, Tuple[str, int]], indices: List[int],
+                              results: List[Optional[Dict]], audited: Dict[int, Dict]):
+        """Store fresh predictions in the duplicate index, or compare them with the reused ones they audit"""
+        items = []
+        for index in indices:
+            result = results[index]
+            if result is None or 'error' in result:
+                continue
+            if index in audited:
+                self._audit_duplicate(audited[index], result)
+            else:
+                items.append((*keys[index], self._duplicate_entry(result)))
+        self.duplicate_index.add_many(items)
+    
+    def _reuses_duplicates(self, serving: Dict[str, Any], batch: bool) -> bool:
+        """Whether predictions of this model go through the duplicate index
+        
+        Fingerprinting an email costs more than predicting it with a compiled
+        model, or with any feature-only model in a batch, so those skip the
+        index. Text-feature models always use it; other uncompiled models only
+        for single emails.
+        """
+        if self.duplicate_index is None:
+            return False
+        if serving['text_hasher'] is not None:
             return True
+        return serving['compiled'] is None and not batch
+    
+    @staticmethod
+    def _duplicate_entry(result: Dict) -> Dict:
+        """What the duplicate index stores of a prediction; feature importance belongs to the model"""
+        return {key: value for key, value in result.items() if key != 'feature_importance'}
+    
+    def _reused_prediction(self, stored: Dict, serving: Dict[str, Any]) -> Dict:
+        return dict(stored, feature_importance=self._feature_importance(serving), near_duplicate=True)
+    
+    def _audit_due(self) -> bool:
+        """Whether to also predict a near-duplicate in full, sampled at duplicate_audit_rate"""
+        return random.random() < self.config.get('duplicate_audit_rate', 0.0)
+    
+    def _audit_duplicate(self, stored: Dict, result: Dict):
+        outcome = 'agree' if stored['predicted_action'] == result['predicted_action'] else 'disagree'
+        self._duplicate_audits.inc(outcome=outcome)
+    
+    def _extract_uncached(self, emails: List[Dict], cached: List[Optional[Dict]],
+                          columns: List[str]) -> List[Optional[Dict]]:
+        """Fill the gaps in cached with one batched extraction (one analysis-cache round trip)
+        
+        Gaps stay None when the batch fails, so those emails are extracted one
+        at a time and a single bad email only fails itself.
+        """
+        missing = [i for i, features in enumerate(cached) if features is None]
+        if len(missing) < 2:
+            return cached
+        try:
+            matrix = self.extract_features_batch([emails[i] for i in missing], columns)
+        except Exception as e:
+            self.logger.warning(f"Batch feature extraction failed, extracting emails one at a time: {e}")
+            return cached
+        
+        filled = list(cached)
+        for i, row in zip(missing, matrix.tolist()):
+            filled[i] = dict(zip(columns, row))
+        return filled
+    
+    @staticmethod
+    def _text_matrix(serving: Dict[str, Any], emails: List[Dict]):
+        """Hashed text of the emails for a model trained with text features, else None"""
+        if serving['text_hasher'] is None:
+            return None
+        return serving['text_hasher'].transform(emails)
+    
+    def _score(self, serving: Dict[str, Any], raw_features: np.ndarray, text=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Class probabilities and labels for raw feature rows, compiled when available
+        
+        text holds the rows' hashed text (_text_matrix) for models trained with it.
+        """
+        compiled = serving['compiled']
+        if compiled is not None:
+            return compiled['model'].predict_proba(raw_features), compiled['class_labels']
+        
+        # Scale if needed
+        if serving['scaler'] is not None:
+            feature_matrix = serving['scaler'].transform(
+                pd.DataFrame(raw_features, columns=serving['feature_columns'])
+            )
+        else:
+            feature_matrix = raw_features
+        
+        if serving['text_hasher'] is not None:
+            if text is None:
+                raise ValueError("Model was trained with text features; the emails' text is required")
+            feature_matrix = TextHasher.combine(feature_matrix, text)
+        
+        return serving['model'].predict_proba(feature_matrix), serving['class_labels']
+    
+    def _feature_importance(self, serving: Dict[str, Any]) -> Dict[str, float]:
+        """Importances above the configured threshold, for tree-based models
+        
+        Computed once per serving bundle: a forest's feature_importances_
+        averages over every tree on each access.
+        """
+        if serving['feature_importance'] is None:
+            serving['feature_importance'] = self._compute_feature_importance(serving)
+        return dict(serving['feature_importance'])
+    
+    def _compute_feature_importance(self, serving: Dict[str, Any]) -> Dict[str, float]:
+        compiled = serving['compiled']
+        if compiled is not None:
+            importances = compiled['feature_importances']
+        else:
+            importances = getattr(serving['model'], 'feature_importances_', None)
+        
+        feature_importance = {}
+        if importances is not None:
+            for i, importance in enumerate(importances):
+                if importance > self.config['feature_importance_threshold']:
+                    feature_importance[serving['feature_columns'][i]] = importance
+        return feature_importance
+    
+    def _resolve_model(self, user_id: Optional[int] = None) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Return the key and serving bundle of the model for this user, falling back to global"""
+        model_key = f"user_{user_id}" if user_id else "global"
+        
+        # The registry answers from memory, including for users without a model
+        serving = self._load_model(model_key)
+        if serving is None:
+            # Fallback to global model
+            model_key = "global"
+            serving = self._load_model(model_key)
+            if serving is None:
+                return None, None
+            if user_id:
+                self._fallbacks.inc()
+        
+        return model_key, serving
+    
+    def _load_model(self, model_key: str) -> Optional[Dict[str, Any]]:
+        """Serving bundle for the current version of a model, loading it through the registry"""
+        try:
+            model_data = self.model_registry.get(model_key)
+            if model_data is None:
+                self._forget_model(model_key)
+                return None
+            
+            serving = self._serving.get(model_key)
+            if serving is None or serving['source'] is not model_data:
+                serving = self._install_model(model_key, model_data)
+            return serving
             
         except Exception as e:
             self.logger.error(f"Error loading model {model_key}: {e}")
-            return False
+            return None
+    
+    def _install_model(self, model_key: str, model_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Make loaded model data the one serving model_key, swapping it in as one bundle"""
+        compiled = model_data.get('compiled') if self.config.get('compiled_inference', True) else None
+        # A compiled model serves on its own; artifacts then never load the estimator
+        model = None if compiled else model_data['model']
+        serving = {
+            'source': model_data,
+            'model': model,
+            'scaler': model_data.get('scaler') if model is not None else None,
+            # Decoded once here instead of on every prediction
+            'class_labels': (compiled['class_labels'] if compiled
+                             else model_data['label_encoder'].inverse_transform(model.classes_)),
+            'compiled': dict(compiled, model=CompiledModel(compiled['arrays'])) if compiled else None,
+            'text_hasher': TextHasher.from_params(model_data['text_features']) if model_data.get('text_features') else None,
+            # Prediction rows follow the model's own columns; models saved without them used the base set
+            'feature_columns': model_data.get('feature_columns', self.feature_columns),
+            # Filled on first use by _feature_importance
+            'feature_importance': None,
+            # Identifies this model version, e.g. in duplicate-index scopes
+            'version': model_data.get('trained_at'),
+        }
+        self._serving[model_key] = serving
+        return serving
+    
+    def _forget_model(self, model_key: str):
+        """Drop a model evicted from the registry cache"""
+        if model_key.startswith('personal_'):
+            self.personalizations.pop(model_key[len('personal_'):], None)
+            return
+        
+        self._serving.pop(model_key, None)
+    
+    def active_users(self, days: int = 7, limit: Optional[int] = None) -> List[int]:
+        """Users with email in the last days, most emails first"""
+        rows = self.db.query(f"""
+            SELECT ea.user_id, COUNT(*) AS email_count
+            FROM emails e
+            JOIN email_accounts ea ON e.email_account_id = ea.id
+            WHERE e.received_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            GROUP BY ea.user_id
+            ORDER BY email_count DESC
+            {'LIMIT %s' if limit is not None else ''}
+        """, (days, limit) if limit is not None else (days,), timer=self.metrics.db_query('active_users'))
+        return [row[0] for row in rows]
+    
+    def preload_models(self, user_count: int) -> int:
+        """Load the global model and the models of the most active users"""
+        try:
+            user_ids = self.active_users(7, user_count)
+        except Exception as e:
+            self.logger.error(f"Error finding active users to preload: {e}")
+            user_ids = []
+        
+        keys = ['global']
+        for user_id in user_ids:
+            keys.append(f"user_{user_id}")
+            if self.config.get('hierarchical_models'):
+                keys.append(f"personal_user_{user_id}")
+        
+        try:
+            loaded = self.model_registry.preload(keys)
+        except Exception as e:
+            self.logger.error(f"Error preloading models: {e}")
+            return 0
+        
+        for key in loaded:
+            if key.startswith('personal_'):
+                self._resolve_personalization(int(key[len('personal_user_'):]))
+            else:
+                self._load_model(key)
+        
+        self.logger.info(f"Preloaded {len(loaded)} models for {len(user_ids)} active users")
+        return len(loaded)
     
     def _update_model_metadata(self, user_id: Optional[int], best_model: str, 
                               best_score: float, all_scores: Dict[str, float]):
         """Update model metadata in database"""
         try:
-            cursor = self.db.cursor()
-            
             # Insert or update model metadata
             query = """
                 INSERT INTO ml_models (user_id, model_type, accuracy, scores, trained_at, is_active)
@@ -621,36 +2429,87 @@ class EmailPredictor:
                 is_active = VALUES(is_active)
             """
             
-            cursor.execute(query, (
+            self.db.query(query, (
                 user_id,
                 best_model,
                 best_score,
                 json.dumps(all_scores)
-            ))
+            ), fetch=None, timer=self.metrics.db_query('model_metadata'))
             
             self.logger.info(f"Updated model metadata for user {user_id}")
             
         except Exception as e:
             self.logger.error(f"Error updating model metadata: {e}")
     
+    def _touch_model_metadata(self, user_id: Optional[int]):
+        """Mark a model as current after an incremental update, keeping its metadata"""
+        try:
+            self.db.query(
+                "UPDATE ml_models SET trained_at = NOW() WHERE user_id <=> %s",
+                (user_id,), fetch=None, timer=self.metrics.db_query('model_metadata')
+            )
+        except Exception as e:
+            self.logger.error(f"Error updating model metadata: {e}")
+    
+    def fetch_emails(self, email_ids: List[int]) -> Dict[int, Dict]:
+        """Fetch email rows by id in chunks, keyed by id"""
+        emails_by_id = {}
+        timer = self.metrics.db_query('fetch_emails')
+        for start in range(0, len(email_ids), 1000):
+            chunk = email_ids[start:start + 1000]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            rows = self.db.query(f"SELECT * FROM emails WHERE id IN ({placeholders})", chunk,
+                                 dictionary=True, timer=timer)
+            for row in rows:
+                emails_by_id[row['id']] = row
+        return emails_by_id
+    
+    def export_metrics(self, action: str, textfile: Optional[str] = None, pushgateway: Optional[str] = None):
+        """Write the metrics of a CLI run to a textfile and/or a Pushgateway, as configured"""
+        textfile = textfile or self.config.get('metrics_textfile')
+        pushgateway = pushgateway or self.config.get('metrics_pushgateway')
+        try:
+            if textfile:
+                self.metrics.write_textfile(textfile.replace('{action}', action))
+            if pushgateway:
+                self.metrics.push(pushgateway, 'rotz_email_predictor', {'action': action})
+        except Exception as e:
+            self.logger.error(f"Error exporting metrics: {e}")
+    
+    def get_cache_stats(self) -> Dict:
+        """Hit, miss and eviction counters of the in-process caches"""
+        return {
+            'analysis': self.analysis_cache.stats() if self.analysis_cache else None,
+            'models': self.model_registry.stats(),
+            'sender_index': {'senders': len(self.sender_index), 'evictions': self.sender_index.evictions},
+            'db_pool': self.db.stats(),
+            'duplicates': dict(
+                self.duplicate_index.stats(),
+                audits={outcome: self._duplicate_audits.value(outcome=outcome) for outcome in ('agree', 'disagree')}
+            ) if self.duplicate_index else None,
+        }
+    
     def get_model_performance(self, user_id: Optional[int] = None) -> Dict:
         """Get model performance metrics"""
         try:
-            cursor = self.db.cursor(dictionary=True)
-            
             query = """
                 SELECT model_type, accuracy, scores, trained_at
                 FROM ml_models
-                WHERE user_id = %s AND is_active = 1
+                WHERE user_id <=> %s AND is_active = 1
                 ORDER BY trained_at DESC
                 LIMIT 1
             """
             
-            cursor.execute(query, (user_id,))
-            result = cursor.fetchone()
+            result = self.db.query(query, (user_id,), dictionary=True, fetch='one',
+                                   timer=self.metrics.db_query('model_performance'))
             
             if result:
                 result['scores'] = json.loads(result['scores'])
+                
+                # Hierarchical users report both layers on their own held-out emails
+                if 'personalized_accuracy' in result['scores']:
+                    result['global_accuracy'] = result['scores']['global_accuracy']
+                    result['personalized_accuracy'] = result['scores']['personalized_accuracy']
                 return result
             else:
                 return {'error': 'No model found'}
@@ -659,37 +2518,185 @@ class EmailPredictor:
             self.logger.error(f"Error getting model performance: {e}")
             return {'error': str(e)}
     
+    def training_queue(self) -> Optional[TrainingQueue]:
+        """The training queue shared through Redis, or None when Redis is unavailable"""
+        if self.redis is None:
+            return None
+        return TrainingQueue(
+            self.redis,
+            lease_seconds=self.config.get('training_lease_seconds', 300),
+            max_attempts=self.config.get('training_max_attempts', 3),
+            retry_delay=self.config.get('training_retry_delay', 60),
+            logger=self.logger,
+            metrics=self.metrics
+        )
+    
+    def run_training_job(self, user_id: Optional[int], action: str,
+                         lost: Optional[threading.Event] = None) -> Dict[str, float]:
+        """Run one queued job: 'train' retrains fully, 'update' updates incrementally when possible
+        
+        lost is set when the job's training lease lapses; the job then raises
+        LeaseLost instead of installing or saving its model, since another
+        worker may be training the same one.
+        """
+        if action == 'train':
+            return self.train_models(user_id, lost)
+        if action == 'update':
+            return self.update_model(user_id, lost)
+        raise ValueError(f"Unknown training action: {action}")
+    
+    @staticmethod
+    def _check_lease(model_key: str, lost: Optional[threading.Event]):
+        if lost is not None and lost.is_set():
+            raise LeaseLost(f"Training lease on {model_key} was lost; not saving the model")
+    
+    def plan_retraining(self, user_ids: Optional[List[Optional[int]]] = None) -> List[Dict[str, Any]]:
+        """Every model due for retraining, highest priority first, from one grouped query
+        
+        Each user's change watermark is the trained_at of their newest model
+        row; one scan over the training window joins it to the user's emails
+        and counts those received after it, along with those received after
+        the global model's watermark. Models with at least
+        retrain_min_new_emails new emails and older than model_update_interval
+        are due; users without a model count emails of the last
+        training_active_days and get a full 'train'. Priority is the number of
+        new emails weighted by how many update intervals the model is old.
+        
+        user_ids limits the plan to those models (None for the global one);
+        without the global model, the scan only covers those users' emails.
+        """
+        lookback = self.config.get('training_active_days', 30)
+        params = [lookback, lookback, self.config.get('training_window_days', 90)]
+        user_filter = ''
+        if user_ids is not None and None not in user_ids:
+            if not user_ids:
+                return []
+            user_filter = f"AND ea.user_id IN ({', '.join(['%s'] * len(user_ids))})"
+            params.extend(user_ids)
+        rows = self.db.query(f"""
+            SELECT ea.user_id, m.trained_at, g.trained_at,
+                   SUM(e.received_at > COALESCE(m.trained_at, DATE_SUB(NOW(), INTERVAL %s DAY))) AS new_emails,
+                   SUM(e.received_at > COALESCE(g.trained_at, DATE_SUB(NOW(), INTERVAL %s DAY))) AS global_new_emails
+            FROM emails e
+            JOIN email_accounts ea ON e.email_account_id = ea.id
+            CROSS JOIN (
+                SELECT MAX(trained_at) AS trained_at FROM ml_models WHERE user_id IS NULL
+            ) g
+            LEFT JOIN (
+                SELECT user_id, MAX(trained_at) AS trained_at
+                FROM ml_models
+                WHERE user_id IS NOT NULL
+                GROUP BY user_id
+            ) m ON m.user_id = ea.user_id
+            WHERE e.received_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            {user_filter}
+            GROUP BY ea.user_id, m.trained_at, g.trained_at
+        """, tuple(params), timer=self.metrics.db_query('retrain_plan'))
+        
+        now = datetime.now()
+        plan = []
+        global_trained_at, global_new_emails = None, 0
+        for user_id, trained_at, global_trained_at, new_emails, user_global_new_emails in rows:
+            global_new_emails += int(user_global_new_emails or 0)
+            entry = self._plan_entry(user_id, trained_at, int(new_emails or 0), now)
+            if entry is not None:
+                plan.append(entry)
+        
+        entry = self._plan_entry(None, global_trained_at, global_new_emails, now) if not user_filter else None
+        if entry is not None:
+            plan.append(entry)
+        if user_ids is not None:
+            plan = [entry for entry in plan if entry['user_id'] in user_ids]
+        
+        plan.sort(key=lambda entry: entry['priority'], reverse=True)
+        return plan
+    
+    def _plan_entry(self, user_id: Optional[int], trained_at: Optional[datetime], new_emails: int,
+                    now: datetime) -> Optional[Dict[str, Any]]:
+        """A retrain plan entry, or None when the model is not due"""
+        interval = self.config['model_update_interval']
+        if new_emails < self.config.get('retrain_min_new_emails', 100):
+            return None
+        if trained_at is None:
+            age = self.config.get('training_active_days', 30) * 86400
+        else:
+            age = (now - trained_at).total_seconds()
+            if age < interval:
+                return None
+        
+        return {
+            'user_id': user_id,
+            'action': 'update' if trained_at is not None else 'train',
+            'new_emails': new_emails,
+            'trained_at': trained_at,
+            'age_seconds': age,
+            'priority': new_emails * (1 + age / interval),
+        }
+    
+    def retrain_all(self, concurrency: Optional[int] = None, time_budget: Optional[float] = None,
+                    plan: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Run the retrain plan, highest priority first, a few models at a time
+        
+        No job starts once time_budget seconds have passed; running jobs
+        finish. With Redis, each job holds the user's training lease, so
+        models a queue worker is training are skipped as busy.
+        """
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        
+        plan = self.plan_retraining() if plan is None else plan
+        concurrency = concurrency or self.config.get('retrain_concurrency', 1)
+        time_budget = time_budget if time_budget is not None else self.config.get('retrain_time_budget')
+        queue = self.training_queue()
+        start = time.monotonic()
+        
+        def retrain(entry: Dict[str, Any]) -> str:
+            user_id = entry['user_id']
+            with queue.exclusive(user_id) if queue is not None else contextlib.nullcontext(threading.Event()) as lost:
+                if lost is None:
+                    return 'busy'
+                scores = self.run_training_job(user_id, entry['action'], lost)
+            return 'retrained' if scores else 'unchanged'
+        
+        outcomes = {'retrained': 0, 'unchanged': 0, 'busy': 0, 'failed': 0, 'not_started': 0}
+        
+        def collect(futures):
+            for future in futures:
+                try:
+                    outcomes[future.result()] += 1
+                except Exception as e:
+                    self.logger.error(f"Error retraining {running[future]}: {e}")
+                    outcomes['failed'] += 1
+        
+        running = {}
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='retrain') as pool:
+            for position, entry in enumerate(plan):
+                if len(running) >= concurrency:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    collect(done)
+                    for future in done:
+                        running.pop(future)
+                if time_budget is not None and time.monotonic() - start >= time_budget:
+                    outcomes['not_started'] = len(plan) - position
+                    break
+                running[pool.submit(retrain, entry)] = TrainingQueue.job_key(entry['user_id'])
+            collect(list(running))
+        
+        summary = dict(outcomes, planned=len(plan), seconds=round(time.monotonic() - start, 3))
+        self.logger.info(f"Retrain run finished: {json.dumps(summary)}")
+        return summary
+    
     def retrain_if_needed(self, user_id: Optional[int] = None) -> bool:
         """Check if model needs retraining and retrain if necessary"""
         try:
-            # Check last training time
-            cursor = self.db.cursor()
-            cursor.execute(
-                "SELECT trained_at FROM ml_models WHERE user_id = %s ORDER BY trained_at DESC LIMIT 1",
-                (user_id,)
-            )
-            result = cursor.fetchone()
-            
-            if result:
-                last_trained = result[0]
-                time_since_training = datetime.now() - last_trained
-                
-                if time_since_training.total_seconds() < self.config['model_update_interval']:
-                    return False  # No need to retrain yet
-            
-            # Check if we have enough new data
-            cursor.execute(
-                "SELECT COUNT(*) FROM emails WHERE user_id = %s AND received_at > %s",
-                (user_id, result[0] if result else datetime.now() - timedelta(days=30))
-            )
-            new_emails = cursor.fetchone()[0]
+            # The planner's query, limited to this model
+            plan = self.plan_retraining([user_id])
+            if not plan:
+                return False  # No need to retrain yet
             
-            if new_emails < 100:  # Need at least 100 new emails
-                return False
-            
-            # Retrain model
-            self.logger.info(f"Retraining model for user {user_id} with {new_emails} new emails")
-            scores = self.train_models(user_id)
+            # Update model, retraining fully when an update is not possible
+            entry = plan[0]
+            self.logger.info(f"Updating model for user {user_id} with {entry['new_emails']} new emails")
+            scores = self.run_training_job(user_id, entry['action'])
             
             return len(scores) > 0
             
@@ -697,30 +2704,99 @@ class EmailPredictor:
             self.logger.error(f"Error checking retrain status: {e}")
             return False
 
+
+def _profile_startup(budget_ms: Optional[float] = None) -> int:
+    """Re-run this command under -X importtime and print where start-up time goes"""
+    import subprocess
+    
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.abspath(__file__)] + sys.argv[1:],
+        stderr=subprocess.PIPE, text=True,
+        env=dict(os.environ, ROTZ_STARTUP_PROFILED='1')
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    
+    # Cumulative time of each top-level import, grouped by root package
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            print(line, file=sys.stderr)
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit() or fields[2].startswith('  '):
+            continue
+        root = fields[2].strip().split('.')[0]
+        packages[root] = packages.get(root, 0) + int(fields[1])
+    
+    import_ms = sum(packages.values()) / 1000
+    print(f"Startup profile: {wall_ms:.1f} ms wall, {import_ms:.1f} ms importing")
+    for name, micros in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:20]:
+        print(f"  {name:<32} {micros / 1000:9.1f} ms")
+    
+    if budget_ms is not None and wall_ms > budget_ms:
+        print(f"Startup budget exceeded: {wall_ms:.1f} ms > {budget_ms:.1f} ms")
+        return 1
+    return result.returncode
+
+
 def main():
     """Main function for command-line usage"""
     import argparse
     
     parser = argparse.ArgumentParser(description='ROTZ Email Butler ML Predictor')
-    parser.add_argument('--action', choices=['train', 'predict', 'evaluate'], required=True)
+    parser.add_argument('--action', choices=['train', 'update', 'predict', 'predict-batch', 'ingest', 'evaluate', 'serve',
+                                             'enqueue', 'worker', 'retrain-all'], required=True)
     parser.add_argument('--user-id', type=int, help='User ID for personalized models')
     parser.add_argument('--email-id', type=int, help='Email ID for prediction')
+    parser.add_argument('--input', help='File with email IDs for batch prediction or ingest (default: stdin)')
+    parser.add_argument('--concurrency', type=int,
+                        help='Batches looked up concurrently for ingest, or models retrained at once for retrain-all')
+    parser.add_argument('--time-budget', type=float,
+                        help='With retrain-all, seconds after which no further model is started')
+    parser.add_argument('--dry-run', action='store_true', help='With retrain-all, print the plan without training')
+    parser.add_argument('--full', action='store_true', help='With enqueue, queue full retrains instead of updates')
+    parser.add_argument('--max-jobs', type=int, help='Jobs a worker runs before exiting (default: until stopped)')
+    parser.add_argument('--tune', action='store_true',
+                        help='Search hyperparameters when training, as with hyperparameter_search in the config')
     parser.add_argument('--config', help='Configuration file path')
+    parser.add_argument('--socket', help='Unix socket path for serve (default: serve_socket from config)')
+    parser.add_argument('--port', type=int, help='Serve over HTTP on this port instead of a Unix socket')
+    parser.add_argument('--host', default='127.0.0.1', help='HTTP bind address for serve')
+    parser.add_argument('--workers', type=int, help='Prediction worker threads for serve')
+    parser.add_argument('--metrics-port', type=int,
+                        help='With serve on a Unix socket, expose Prometheus metrics over HTTP on this port')
+    parser.add_argument('--metrics-file', help='Write Prometheus metrics to this file when the action ends')
+    parser.add_argument('--metrics-push', help='Push Prometheus metrics to this Pushgateway URL when the action ends')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Run the action and print an import-time breakdown')
+    parser.add_argument('--startup-budget-ms', type=float,
+                        help='With --profile-startup, exit non-zero when the run takes longer')
     
     args = parser.parse_args()
     
+    if args.profile_startup and not os.getenv('ROTZ_STARTUP_PROFILED'):
+        sys.exit(_profile_startup(args.startup_budget_ms))
+    
     # Initialize predictor
     predictor = EmailPredictor(args.config)
+    if args.tune:
+        predictor.config['hyperparameter_search'] = True
     
-    if args.action == 'train':
-        scores = predictor.train_models(args.user_id)
-        print(f"Training completed. Scores: {scores}")
+    if args.action in ('train', 'update'):
+        # Hold the user's training lease, so a queue worker or another run never trains them at the same time
+        queue = predictor.training_queue()
+        with queue.exclusive(args.user_id) if queue is not None else contextlib.nullcontext(threading.Event()) as lost:
+            if lost is None:
+                print(f"Training of {TrainingQueue.job_key(args.user_id)} is already running elsewhere")
+                sys.exit(1)
+            scores = predictor.run_training_job(args.user_id, args.action, lost)
+        print(f"{'Training' if args.action == 'train' else 'Update'} completed. Scores: {scores}")
         
     elif args.action == 'predict' and args.email_id:
         # Get email data from database
-        cursor = predictor.db.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM emails WHERE id = %s", (args.email_id,))
-        email_data = cursor.fetchone()
+        email_data = predictor.db.query("SELECT * FROM emails WHERE id = %s", (args.email_id,),
+                                        dictionary=True, fetch='one')
         
         if email_data:
             prediction = predictor.predict_email_action(email_data, args.user_id)
@@ -728,9 +2804,136 @@ def main():
         else:
             print(f"Email {args.email_id} not found")
             
+    elif args.action == 'predict-batch':
+        # Email IDs may be separated by newlines, whitespace or commas
+        if args.input:
+            with open(args.input, 'r') as f:
+                raw_ids = f.read()
+        else:
+            raw_ids = sys.stdin.read()
+        email_ids = [int(token) for token in raw_ids.replace(',', ' ').split()]
+        
+        emails_by_id = predictor.fetch_emails(email_ids)
+        
+        found_ids = [email_id for email_id in email_ids if email_id in emails_by_id]
+        predictions = predictor.predict_email_actions(
+            [emails_by_id[email_id] for email_id in found_ids], user_id=args.user_id
+        )
+        
+        predictions_by_id = dict(zip(found_ids, predictions))
+        results = [
+            dict(predictions_by_id[email_id], email_id=email_id)
+            if email_id in predictions_by_id
+            else {'email_id': email_id, 'error': 'Email not found'}
+            for email_id in email_ids
+        ]
+        print(f"Predictions: {json.dumps(results, indent=2, default=str)}")
+        
+    elif args.action == 'ingest':
+        # Stream email ids or JSON email objects, one per line, printing one JSON prediction per line
+        import asyncio
+        from ingestion_pipeline import IngestionPipeline, connect_async_redis
+        
+        def read_items(stream):
+            for line in stream:
+                line = line.strip()
+                if line:
+                    yield json.loads(line) if line.startswith('{') else int(line)
+        
+        async def ingest(stream):
+            redis_client = connect_async_redis(predictor.config) if predictor.redis is not None else None
+            pipeline = IngestionPipeline(
+                predictor,
+                concurrency=args.concurrency or predictor.config.get('pipeline_concurrency', 8),
+                batch_size=predictor.config.get('pipeline_batch_size', 64),
+                batch_timeout=predictor.config.get('pipeline_batch_timeout', 0.05),
+                queue_size=predictor.config.get('pipeline_queue_size', 4),
+                cpu_workers=predictor.config.get('pipeline_cpu_workers', 0),
+                redis_client=redis_client,
+                logger=predictor.logger
+            )
+            try:
+                async for result in pipeline.run(read_items(stream), user_id=args.user_id):
+                    print(json.dumps(result, default=str))
+            finally:
+                if redis_client is not None:
+                    await redis_client.aclose()
+        
+        if args.input:
+            with open(args.input, 'r') as f:
+                asyncio.run(ingest(f))
+        else:
+            asyncio.run(ingest(sys.stdin))
+        
+    elif args.action in ('enqueue', 'worker'):
+        queue = predictor.training_queue()
+        if queue is None:
+            print("The training queue needs Redis")
+            sys.exit(1)
+        
+        if args.action == 'enqueue':
+            # One user, or the global model and every recently active user
+            if args.user_id:
+                user_ids = [args.user_id]
+            else:
+                user_ids = [None] + predictor.active_users(predictor.config.get('training_active_days', 30))
+            queued = queue.enqueue_many(user_ids, 'train' if args.full else 'update')
+            print(f"Queued {queued} training jobs ({len(user_ids) - queued} already waiting). "
+                  f"Queue: {json.dumps(queue.stats())}")
+        else:
+            import signal
+            
+            worker = TrainingWorker(
+                queue, predictor.run_training_job,
+                poll_interval=predictor.config.get('training_poll_interval', 5),
+                logger=predictor.logger
+            )
+            signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+            try:
+                processed = worker.run(max_jobs=args.max_jobs)
+            except KeyboardInterrupt:
+                processed = None
+            print(f"Worker stopped after {processed} jobs" if processed is not None else "Worker interrupted")
+        
+    elif args.action == 'retrain-all':
+        plan = predictor.plan_retraining()
+        if args.dry_run:
+            print(f"Retrain plan: {json.dumps(plan, indent=2, default=str)}")
+        else:
+            summary = predictor.retrain_all(args.concurrency, args.time_budget, plan)
+            print(f"Retrained models: {json.dumps(summary)}")
+        
     elif args.action == 'evaluate':
         performance = predictor.get_model_performance(args.user_id)
         print(f"Model Performance: {json.dumps(performance, indent=2, default=str)}")
+        
+    elif args.action == 'serve':
+        import signal
+        from prediction_server import PredictionServer
+        
+        # Load models up front so the first requests do not pay for it
+        predictor._resolve_model(None)
+        
+        server = PredictionServer(
+            predictor,
+            workers=args.workers or predictor.config.get('serve_workers', 4),
+            stats_interval=predictor.config.get('serve_stats_interval', 60),
+            logger=predictor.logger
+        )
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+        try:
+            if args.port:
+                server.serve_http(args.host, args.port)
+            else:
+                metrics_port = args.metrics_port or predictor.config.get('metrics_port')
+                if metrics_port:
+                    predictor.metrics.serve(args.host, metrics_port)
+                server.serve_unix(args.socket or predictor.config['serve_socket'])
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    predictor.export_metrics(args.action, args.metrics_file, args.metrics_push)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Feature Buffer
+Compact column-oriented storage for training features, and helpers that copy
+selected rows into worker matrices and standardize them in place
+"""
+
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+INT16_MIN, INT16_MAX = np.iinfo(np.int16).min, np.iinfo(np.int16).max
+
+
+class FeatureBuffer:
+    """Growable typed columns for a fixed feature schema
+
+    Integer-valued columns (hours, counts, flags) are stored as int16 and the
+    rest as float32, one contiguous array per column. Growing doubles one
+    column at a time, so the transient overhead is a single column rather
+    than the whole matrix, and frame() wraps the columns without copying.
+    """
+
+    def __init__(self, columns: List[str], integer_columns: Iterable[str] = (), capacity: int = 1024):
+        integer_columns = set(integer_columns)
+        self.columns = list(columns)
+        self.dtypes = {name: np.dtype(np.int16 if name in integer_columns else np.float32) for name in self.columns}
+        self.capacity = max(1, capacity)
+        self.n_rows = 0
+        self._data = {name: np.empty(self.capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+
+    def append(self, rows: np.ndarray):
+        """Append a (rows x columns) block in schema order; integer columns are rounded and clipped"""
+        needed = self.n_rows + len(rows)
+        if needed > self.capacity:
+            self._grow(max(needed, self.capacity * 2))
+
+        for j, name in enumerate(self.columns):
+            target = self._data[name][self.n_rows:needed]
+            if self.dtypes[name] == np.int16:
+                target[:] = np.clip(np.rint(rows[:, j]), INT16_MIN, INT16_MAX)
+            else:
+                target[:] = rows[:, j]
+        self.n_rows = needed
+
+    def frame(self, index: Optional[pd.Index] = None) -> pd.DataFrame:
+        """The filled rows as a DataFrame sharing the buffer's memory"""
+        return pd.DataFrame(
+            {name: self._data[name][:self.n_rows] for name in self.columns}, index=index, copy=False
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(dtype.itemsize for dtype in self.dtypes.values()) * self.n_rows
+
+    def _grow(self, capacity: int):
+        for name, column in self._data.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.n_rows] = column[:self.n_rows]
+            self._data[name] = grown
+        self.capacity = capacity
+
+
+def gather_rows(frame: pd.DataFrame, positions: np.ndarray, out: np.ndarray, chunk_rows: int = 65536) -> np.ndarray:
+    """Copy the rows at positions into the float32 row-major matrix out, a block at a time"""
+    columns = [frame[name].to_numpy() for name in frame.columns]
+    for start in range(0, len(positions), chunk_rows):
+        rows = positions[start:start + chunk_rows]
+        block = np.empty((len(rows), len(columns)), dtype=out.dtype)
+        for j, column in enumerate(columns):
+            block[:, j] = column[rows]
+        out[start:start + len(rows)] = block
+    return out
+
+
+def fit_scaler(matrix: np.ndarray, columns: List[str], chunk_rows: int = 65536):
+    """StandardScaler fitted block by block, with the feature names of a DataFrame fit"""
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    for start in range(0, len(matrix), chunk_rows):
+        scaler.partial_fit(pd.DataFrame(matrix[start:start + chunk_rows], columns=columns, copy=False))
+    return scaler
+
+
+def standardize(matrix: np.ndarray, scaler, chunk_rows: int = 65536) -> np.ndarray:
+    """Apply a fitted StandardScaler to matrix in place"""
+    for start in range(0, len(matrix), chunk_rows):
+        block = matrix[start:start + chunk_rows]
+        block -= scaler.mean_
+        block /= scaler.scale_
+    return matrix
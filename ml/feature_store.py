@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Feature Store
+Versioned, columnar on-disk cache of computed feature vectors keyed by email id
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class FeatureStore:
+    """Columnar feature cache with per-column schema versions
+
+    The store is a list of immutable segments, each a directory holding a
+    sorted ids.npy and one float32 .npy file per feature column, read through
+    memory maps. Missing values are stored as NaN. A column whose stored
+    version differs from the expected one is treated as missing for every row
+    of that segment, so bumping one feature's version only invalidates that
+    column. Where segments overlap, the newest non-missing value wins.
+
+    Writers append the new rows as a segment and switch the CURRENT pointer
+    (the segment names, oldest first) atomically, so readers always see a
+    consistent snapshot. Small segments are merged into their older
+    neighbours as they accumulate, which keeps the segment count logarithmic
+    in the store size; see _merge_start.
+    """
+
+    def __init__(self, path: str, column_versions: Dict[str, str], max_rows: Optional[int] = None,
+                 max_segments: int = 16, logger: Optional[logging.Logger] = None):
+        self.path = path
+        self.column_versions = column_versions
+        self.max_rows = max_rows
+        self.max_segments = max_segments
+        self.logger = logger or logging.getLogger('EmailPredictor')
+        os.makedirs(path, exist_ok=True)
+
+        self._pointer = None
+        self._snapshot = None
+        self._segments: Dict[str, Dict] = {}
+
+    def lookup(self, ids: np.ndarray, columns: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return stored values for ids (NaN where missing) and a per-cell found mask"""
+        ids = np.asarray(ids, dtype=np.int64)
+        values = np.full((len(ids), len(columns)), np.nan, dtype=np.float32)
+
+        snapshot = self._load_snapshot()
+        if not snapshot or not len(ids):
+            return values, np.zeros(values.shape, dtype=bool)
+
+        # Newest segment first; older ones only fill cells still missing
+        for segment in reversed(snapshot):
+            stored_ids = segment['ids']
+            if not len(stored_ids):
+                continue
+            positions = np.minimum(np.searchsorted(stored_ids, ids), len(stored_ids) - 1)
+            present = stored_ids[positions] == ids
+            if not present.any():
+                continue
+            rows = positions[present]
+
+            for j, column in enumerate(columns):
+                stored = self._column(segment, column)
+                if stored is None:
+                    continue
+                current = values[present, j]
+                missing = np.isnan(current)
+                if missing.any():
+                    current[missing] = stored[rows[missing]]
+                    values[present, j] = current
+
+        return values, ~np.isnan(values)
+
+    def put(self, ids: np.ndarray, values: np.ndarray, columns: List[str]):
+        """Append computed rows to the store as a new segment, merging small segments"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+
+        order = np.argsort(ids, kind='stable')
+        values = np.asarray(values, dtype=np.float32)[order]
+        incoming = {
+            'name': None,
+            'ids': ids[order],
+            'rows': len(ids),
+            'columns': {column: self.column_versions[column] for column in columns if column in self.column_versions},
+            'arrays': {column: values[:, j] for j, column in enumerate(columns)},
+        }
+
+        with open(os.path.join(self.path, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            segments = self._load_snapshot() or []
+            merge_from = self._merge_start(segments, len(ids))
+            # Only a merge that includes the oldest segment can drop old rows
+            name, rows = self._write_segment(segments[merge_from:] + [incoming], trim=merge_from == 0)
+            names = [segment['name'] for segment in segments[:merge_from]] + [name]
+
+            # Switch readers to the new segment list atomically
+            pointer_tmp = os.path.join(self.path, 'CURRENT.tmp')
+            with open(pointer_tmp, 'w') as f:
+                f.write('\n'.join(names))
+            os.replace(pointer_tmp, os.path.join(self.path, 'CURRENT'))
+
+            # Merged segments stay readable through open memory maps until closed
+            for entry in os.listdir(self.path):
+                if entry.startswith(('seg_', 'gen_')) and entry not in names:
+                    shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+        merged = f", merged with {len(segments) - merge_from} older segments" if merge_from < len(segments) else ''
+        self.logger.info(
+            f"Feature store updated: {len(ids)} rows written as a segment of {rows}{merged}, {len(names)} segments"
+        )
+
+    def _merge_start(self, segments: List[Dict], new_rows: int) -> int:
+        """Index of the first segment to merge with the incoming rows
+
+        Newer segments are merged into an older one once they hold at least
+        half as many rows, so sizes at least halve from oldest to newest and
+        each row is rewritten O(log n) times. Everything is merged when the
+        segment limit is reached, or when the store holds a quarter more rows
+        than max_rows so the oldest are dropped.
+        """
+        start, tail = len(segments), new_rows
+        while start > 0 and tail * 2 >= segments[start - 1]['rows']:
+            start -= 1
+            tail += segments[start]['rows']
+
+        if start + 1 > self.max_segments:
+            return 0
+        if self.max_rows and sum(segment['rows'] for segment in segments) + new_rows > self.max_rows * 1.25:
+            return 0
+        return start
+
+    def _write_segment(self, sources: List[Dict], trim: bool) -> Tuple[str, int]:
+        """Write the union of sources (oldest first) as one segment; returns its name and row count"""
+        ids = np.unique(np.concatenate([source['ids'] for source in sources]))
+        if trim and self.max_rows and len(ids) > self.max_rows:
+            # Email ids grow over time, so the highest ids are the newest
+            ids = ids[-self.max_rows:]
+
+        name = f"seg_{time.time_ns()}"
+        segment_dir = os.path.join(self.path, name)
+        os.makedirs(segment_dir)
+        np.save(os.path.join(segment_dir, 'ids.npy'), ids)
+
+        placements = []
+        for source in sources:
+            positions = np.minimum(np.searchsorted(ids, source['ids']), len(ids) - 1)
+            kept = ids[positions] == source['ids']
+            placements.append((positions[kept], kept))
+
+        # Carry over still-valid columns, newer sources overlaying older ones
+        stored_columns = {}
+        for column in sorted(set().union(*(source['columns'] for source in sources))):
+            if column not in self.column_versions:
+                continue
+            merged = np.full(len(ids), np.nan, dtype=np.float32)
+            for source, (positions, kept) in zip(sources, placements):
+                values = self._column(source, column)
+                if values is None:
+                    continue
+                values = np.asarray(values[kept])
+                written = ~np.isnan(values)
+                merged[positions[written]] = values[written]
+            np.save(os.path.join(segment_dir, self._column_file(column)), merged)
+            stored_columns[column] = self.column_versions[column]
+
+        with open(os.path.join(segment_dir, 'manifest.json'), 'w') as f:
+            json.dump({'columns': stored_columns, 'rows': int(len(ids))}, f)
+
+        return name, len(ids)
+
+    def _load_snapshot(self) -> Optional[List[Dict]]:
+        """Open the current segments, oldest first, reusing the memory maps of unchanged ones"""
+        try:
+            with open(os.path.join(self.path, 'CURRENT'), 'r') as f:
+                pointer = f.read().strip()
+        except FileNotFoundError:
+            return None
+
+        if pointer != self._pointer or self._snapshot is None:
+            # A single generation name, as written by earlier versions, is a one-segment list
+            segments = {}
+            for name in pointer.split():
+                segment = self._segments.get(name)
+                if segment is None:
+                    segment_dir = os.path.join(self.path, name)
+                    try:
+                        with open(os.path.join(segment_dir, 'manifest.json'), 'r') as f:
+                            manifest = json.load(f)
+                        segment_ids = np.load(os.path.join(segment_dir, 'ids.npy'), mmap_mode='r')
+                    except FileNotFoundError:
+                        # Merged away between reading CURRENT and opening it; retry on next call
+                        return None
+                    segment = {'name': name, 'dir': segment_dir, 'ids': segment_ids,
+                               'rows': manifest.get('rows', len(segment_ids)),
+                               'columns': manifest['columns'], 'arrays': {}}
+                segments[name] = segment
+            self._segments = segments
+            self._snapshot = list(segments.values())
+            self._pointer = pointer
+
+        return self._snapshot
+
+    def _column(self, segment: Dict, column: str) -> Optional[np.ndarray]:
+        """Memory-mapped column, or None when absent or stored under another version"""
+        version = self.column_versions.get(column)
+        if version is None or segment['columns'].get(column) != version:
+            return None
+        if column not in segment['arrays']:
+            segment['arrays'][column] = np.load(
+                os.path.join(segment['dir'], self._column_file(column)), mmap_mode='r'
+            )
+        return segment['arrays'][column]
+
+    @staticmethod
+    def _column_file(column: str) -> str:
+        return f"col_{re.sub(r'[^A-Za-z0-9_]', '_', column)}.npy"
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Hyperparameter Search
+Budgeted successive-halving search over per-estimator search spaces, with
+cross-validation folds prepared once and remembered best configurations
+"""
+
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+# Values tried per estimator; a configuration is one value per parameter
+SEARCH_SPACES = {
+    'random_forest': {
+        'n_estimators': [50, 100, 200, 400],
+        'max_depth': [None, 10, 20, 40],
+        'min_samples_leaf': [1, 2, 5, 10],
+        'max_features': ['sqrt', 'log2', 0.5],
+    },
+    'gradient_boosting': {
+        'n_estimators': [50, 100, 200],
+        'learning_rate': [0.03, 0.1, 0.3],
+        'max_depth': [2, 3, 5],
+        'subsample': [0.7, 1.0],
+    },
+    'logistic_regression': {
+        'C': [0.01, 0.1, 1.0, 10.0, 100.0],
+        'class_weight': [None, 'balanced'],
+    },
+    'neural_network': {
+        'hidden_layer_sizes': [(50,), (100,), (100, 50)],
+        'alpha': [1e-5, 1e-4, 1e-3, 1e-2],
+        'learning_rate_init': [0.001, 0.003],
+    },
+}
+
+
+def _evaluate(model, data_dir: str, fold: int, rows: int, scaled: bool) -> Tuple[float, float]:
+    """Fit on the first `rows` rows of one fold's training part; validation accuracy and CPU seconds"""
+    from sklearn.metrics import accuracy_score
+    from threadpoolctl import threadpool_limits
+
+    started = time.process_time()
+    suffix = '_scaled' if scaled else ''
+    X_train = np.load(os.path.join(data_dir, f'X_train_{fold}{suffix}.npy'), mmap_mode='r')[:rows]
+    y_train = np.load(os.path.join(data_dir, f'y_train_{fold}.npy'), mmap_mode='r')[:rows]
+    X_valid = np.load(os.path.join(data_dir, f'X_valid_{fold}{suffix}.npy'), mmap_mode='r')
+    y_valid = np.load(os.path.join(data_dir, f'y_valid_{fold}.npy'), mmap_mode='r')
+
+    # Parallelism comes from evaluating many configurations at once
+    with threadpool_limits(limits=1):
+        model.fit(X_train, y_train)
+        accuracy = float(accuracy_score(y_valid, model.predict(X_valid)))
+    return accuracy, time.process_time() - started
+
+
+class HyperparameterSearch:
+    """Successive halving over the search spaces of several estimators at once
+
+    Every configuration starts on a small prefix of each fold's training
+    rows; after each rung only the best 1/eta of each estimator's
+    configurations by mean fold accuracy go on, with eta times more rows. The folds (and their standardized copies, with
+    a scaler fitted per fold) are written once as memory-mapped arrays shared
+    by all evaluations. Rows are stored in a class-interleaved order, so
+    every prefix keeps the class balance of the fold.
+
+    The search stops when the wall-clock or CPU budget runs out, returning
+    for each estimator the best configuration of the highest rung it reached.
+    """
+
+    def __init__(self, folds: int = 3, eta: int = 3, min_rows: int = 500, n_jobs: int = 1,
+                 budget_seconds: Optional[float] = 600, cpu_budget_seconds: Optional[float] = None,
+                 tmp_dir: Optional[str] = None, random_state: int = 42, logger: Optional[logging.Logger] = None):
+        self.folds = folds
+        self.eta = max(2, eta)
+        self.min_rows = min_rows
+        self.n_jobs = n_jobs
+        self.budget_seconds = budget_seconds
+        self.cpu_budget_seconds = cpu_budget_seconds
+        self.tmp_dir = tmp_dir
+        self.random_state = random_state
+        self.logger = logger or logging.getLogger('EmailPredictor')
+
+    def run(self, X: np.ndarray, y: np.ndarray, estimators: Dict[str, Any], scaled_models: List[str],
+            n_configs: int = 27, seeds: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict[str, Any]]:
+        """Search every estimator's space; returns {name: {'params', 'score', 'rows'}}"""
+        started = time.monotonic()
+        candidates = []  # (name, params)
+        for name in estimators:
+            for params in self._sample(name, n_configs, (seeds or {}).get(name)):
+                candidates.append((name, params))
+
+        data_dir = tempfile.mkdtemp(prefix='rotz_search_', dir=self.tmp_dir)
+        try:
+            fold_rows = self._write_folds(X, y, data_dir, any(name in scaled_models for name in estimators))
+            rungs = self._rungs(max(1, len(candidates) // max(1, len(estimators))), fold_rows)
+            best: Dict[str, Dict[str, Any]] = {}
+            cpu_used = 0.0
+            survivors = list(range(len(candidates)))
+
+            for rung, rows in enumerate(rungs):
+                tasks = [(index, fold) for index in survivors for fold in range(self.folds)]
+                scores: Dict[int, List[float]] = {index: [] for index in survivors}
+                out_of_budget = False
+
+                results = joblib.Parallel(n_jobs=self.n_jobs, return_as='generator_unordered')(
+                    joblib.delayed(self._evaluate_task)(
+                        index, fold, self._configure(estimators[candidates[index][0]], candidates[index][1]),
+                        data_dir, rows, candidates[index][0] in scaled_models
+                    )
+                    for index, fold in tasks
+                )
+                for index, accuracy, cpu_seconds in results:
+                    scores[index].append(accuracy)
+                    cpu_used += cpu_seconds
+                    if self._exhausted(started, cpu_used):
+                        out_of_budget = True
+                        break
+                del results  # abandons evaluations still queued
+
+                # Only configurations evaluated on every fold are ranked
+                ranked = sorted(
+                    ((float(np.mean(fold_scores)), index) for index, fold_scores in scores.items()
+                     if len(fold_scores) == self.folds),
+                    key=lambda item: -item[0]
+                )
+                for score, index in ranked:
+                    name, params = candidates[index]
+                    entry = best.get(name)
+                    if entry is None or entry['rows'] < rows or (entry['rows'] == rows and score > entry['score']):
+                        best[name] = {'params': params, 'score': score, 'rows': rows}
+
+                self.logger.info(
+                    f"Search rung {rung}: {len(ranked)} configurations on {rows} rows per fold, "
+                    f"best {ranked[0][0]:.4f}" if ranked else f"Search rung {rung}: no configuration finished"
+                )
+                if out_of_budget or not ranked:
+                    self.logger.info(f"Search budget exhausted after {time.monotonic() - started:.1f}s")
+                    break
+                survivors = []
+                for name in estimators:
+                    family = [index for _, index in ranked if candidates[index][0] == name]
+                    survivors.extend(family[:max(1, math.ceil(len(family) / self.eta))])
+
+            return best
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    @staticmethod
+    def _configure(estimator, params: Dict):
+        """A copy of the estimator with one configuration, fitting single-threaded"""
+        from sklearn.base import clone
+
+        model = clone(estimator).set_params(**params)
+        if 'n_jobs' in model.get_params():
+            model.set_params(n_jobs=1)
+        return model
+
+    @staticmethod
+    def _evaluate_task(index: int, fold: int, model, data_dir: str, rows: int, scaled: bool):
+        accuracy, cpu_seconds = _evaluate(model, data_dir, fold, rows, scaled)
+        return index, accuracy, cpu_seconds
+
+    def _sample(self, name: str, n_configs: int, seed: Optional[Dict]) -> List[Dict]:
+        """Distinct random configurations, led by a remembered one when given"""
+        space = SEARCH_SPACES.get(name, {})
+        names = sorted(space)
+        configs = [dict(zip(names, values)) for values in itertools.product(*(space[param] for param in names))]
+        random.Random(f"{self.random_state}:{name}").shuffle(configs)
+        if seed:
+            configs = [dict(seed)] + [params for params in configs if params != seed]
+        return configs[:max(1, n_configs)]
+
+    def _rungs(self, configs: int, fold_rows: int) -> List[int]:
+        """Rows per fold at each rung, ending with the full fold"""
+        rungs = max(1, int(math.log(configs, self.eta)) + 1)
+        rows = [int(fold_rows / self.eta ** (rungs - 1 - rung)) for rung in range(rungs)]
+        rows = [min(fold_rows, max(self.min_rows, value)) for value in rows]
+        return sorted(set(rows))
+
+    def _write_folds(self, X: np.ndarray, y: np.ndarray, data_dir: str, scaled: bool) -> int:
+        """Write each fold's training and validation arrays once; returns the smallest training size"""
+        from sklearn.model_selection import StratifiedKFold
+        from sklearn.preprocessing import StandardScaler
+
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y)
+        counts = np.bincount(y)
+        splits = min(self.folds, int(counts[counts > 0].min())) if len(counts) else self.folds
+        if splits < self.folds:
+            self.logger.info(f"Using {splits} folds: the rarest action has only {splits} emails")
+            self.folds = max(2, splits)
+        rnd = np.random.RandomState(self.random_state)
+
+        smallest = len(y)
+        splitter = StratifiedKFold(n_splits=self.folds, shuffle=True, random_state=self.random_state)
+        for fold, (train_idx, valid_idx) in enumerate(splitter.split(X, y)):
+            train_idx = train_idx[self._interleave(y[train_idx], rnd)]
+            arrays = {
+                f'X_train_{fold}': X[train_idx], f'y_train_{fold}': y[train_idx],
+                f'X_valid_{fold}': X[valid_idx], f'y_valid_{fold}': y[valid_idx],
+            }
+            if scaled:
+                scaler = StandardScaler().fit(arrays[f'X_train_{fold}'])
+                arrays[f'X_train_{fold}_scaled'] = scaler.transform(arrays[f'X_train_{fold}']).astype(np.float32)
+                arrays[f'X_valid_{fold}_scaled'] = scaler.transform(arrays[f'X_valid_{fold}']).astype(np.float32)
+            for name, array in arrays.items():
+                np.save(os.path.join(data_dir, f'{name}.npy'), np.ascontiguousarray(array))
+            smallest = min(smallest, len(train_idx))
+        return smallest
+
+    @staticmethod
+    def _interleave(labels: np.ndarray, rnd: np.random.RandomState) -> np.ndarray:
+        """Order rows so that every prefix has the classes in their overall proportions"""
+        position = np.empty(len(labels))
+        for label in np.unique(labels):
+            members = np.flatnonzero(labels == label)
+            position[members] = (rnd.permutation(len(members)) + rnd.uniform(size=len(members))) / len(members)
+        return np.argsort(position, kind='stable')
+
+    def _exhausted(self, started: float, cpu_used: float) -> bool:
+        if self.budget_seconds and time.monotonic() - started > self.budget_seconds:
+            return True
+        return bool(self.cpu_budget_seconds and cpu_used > self.cpu_budget_seconds)
+
+
+class HyperparameterStore:
+    """Best configurations per model key, one JSON file each, written atomically"""
+
+    def __init__(self, directory: str, logger: Optional[logging.Logger] = None):
+        self.directory = directory
+        self.logger = logger or logging.getLogger('EmailPredictor')
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, model_key: str) -> Optional[Dict[str, Any]]:
+        """{'searched_at': ..., 'estimators': {name: {'params', 'score', 'rows'}}}, or None"""
+        try:
+            with open(self._path(model_key), 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Error reading hyperparameters for {model_key}: {e}")
+            return None
+        # JSON turns tuples into lists; estimators such as MLPClassifier expect tuples
+        for result in entry.get('estimators', {}).values():
+            result['params'] = {
+                name: tuple(value) if isinstance(value, list) else value for name, value in result['params'].items()
+            }
+        return entry
+
+    def save(self, model_key: str, results: Dict[str, Dict[str, Any]]):
+        entry = {'searched_at': datetime.now().isoformat(), 'estimators': results}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.hyperparameters.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f, indent=2, default=str)
+            os.replace(tmp_path, self._path(model_key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _path(self, model_key: str) -> str:
+        return os.path.join(self.directory, f'{model_key}.json')
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Ingestion Pipeline
+Asyncio pipeline that overlaps the I/O-bound lookups of incoming emails with
+the CPU-bound feature extraction and prediction of earlier ones
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Union
+
+_DONE = object()
+
+
+def connect_async_redis(config: Dict):
+    """redis.asyncio client for the configured Redis, or None when Redis is disabled"""
+    if not config.get('redis_enabled', True):
+        return None
+    import redis.asyncio
+
+    return redis.asyncio.Redis(
+        host=config['redis_host'],
+        port=config['redis_port'],
+        decode_responses=True,
+        max_connections=config.get('redis_pool_size', 16),
+        health_check_interval=config.get('redis_health_check_interval', 30),
+        socket_keepalive=True
+    )
+
+
+class IngestionPipeline:
+    """Stream emails through lookup and prediction stages with bounded concurrency
+
+    Incoming emails (row dicts, or email ids to fetch) are grouped into
+    micro-batches of up to batch_size, waiting at most batch_timeout seconds
+    for a batch to fill. Each batch then goes through two stages:
+
+    - lookups: up to `concurrency` batches at a time fetch their rows by id
+      and prefetch their analysis-cache entries (awaited on an asyncio Redis
+      client when one is given), and keep the sender index fresh, so the
+      next stage finds everything in memory
+    - prediction: feature extraction and scoring run on a pool of
+      cpu_workers threads, where NumPy and scikit-learn release the GIL
+
+    Stages are connected by queues holding at most queue_size batches, so
+    a slow stage makes the ones before it wait instead of buffering the whole
+    stream. Results come out per email as soon as their batch is done, or in
+    input order with ordered=True.
+    """
+
+    def __init__(self, predictor, concurrency: int = 8, batch_size: int = 64, batch_timeout: float = 0.05,
+                 queue_size: int = 4, cpu_workers: int = 0, ordered: bool = False, redis_client=None,
+                 logger: Optional[logging.Logger] = None):
+        self.predictor = predictor
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.batch_timeout = batch_timeout
+        self.queue_size = max(1, queue_size)
+        self.cpu_workers = cpu_workers or min(4, os.cpu_count() or 1)
+        self.ordered = ordered
+        self.redis = redis_client
+        self.logger = logger or logging.getLogger('EmailPredictor')
+
+        metrics = predictor.metrics
+        self._stage_timer = metrics.histogram('pipeline_stage_seconds', 'Ingestion pipeline time per batch by stage',
+                                              ('stage',))
+        self._emails_counter = metrics.counter('pipeline_emails_total', 'Emails through the ingestion pipeline')
+
+    async def run(self, source: Union[Iterable, AsyncIterable], user_id: Optional[int] = None) -> AsyncIterator[Dict]:
+        """Yield one prediction per incoming email; each carries the email's email_id when known"""
+        io_pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='ingest-io')
+        cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix='ingest-cpu')
+        lookups = asyncio.Queue(self.queue_size)
+        ready = asyncio.Queue(self.queue_size)
+        done = asyncio.Queue(self.queue_size)
+
+        async def lookup_worker():
+            while True:
+                batch = await lookups.get()
+                if batch is _DONE:
+                    return
+                await ready.put(await self._lookup(batch, io_pool))
+
+        async def predict_worker():
+            while True:
+                batch = await ready.get()
+                if batch is _DONE:
+                    return
+                await done.put(await self._predict(batch, user_id, cpu_pool))
+
+        async def run_stages():
+            lookup_tasks = [asyncio.ensure_future(lookup_worker()) for _ in range(self.concurrency)]
+            predict_tasks = [asyncio.ensure_future(predict_worker()) for _ in range(self.cpu_workers)]
+            try:
+                await self._batch(source, lookups)
+                for _ in lookup_tasks:
+                    await lookups.put(_DONE)
+                await asyncio.gather(*lookup_tasks)
+                for _ in predict_tasks:
+                    await ready.put(_DONE)
+                await asyncio.gather(*predict_tasks)
+            finally:
+                for task in lookup_tasks + predict_tasks:
+                    task.cancel()
+                await done.put(_DONE)
+
+        stages = asyncio.ensure_future(run_stages())
+        pending: Dict[int, List[Dict]] = {}
+        next_sequence = 0
+        try:
+            while True:
+                batch = await done.get()
+                if batch is _DONE:
+                    break
+                if not self.ordered:
+                    for result in batch['results']:
+                        yield result
+                    continue
+                pending[batch['sequence']] = batch['results']
+                while next_sequence in pending:
+                    for result in pending.pop(next_sequence):
+                        yield result
+                    next_sequence += 1
+            await stages  # re-raise a failure of the source or a stage
+        finally:
+            stages.cancel()
+            io_pool.shutdown(wait=False)
+            cpu_pool.shutdown(wait=False)
+
+    async def _batch(self, source, lookups: asyncio.Queue):
+        """Group the source into micro-batches; blocks while the lookup queue is full
+
+        A partial batch is sent once batch_timeout passes, even while the
+        source is waiting for more input.
+        """
+        items = self._iterate(source).__aiter__()
+        batch: List[Any] = []
+        deadline = None
+        sequence = 0
+        next_item = asyncio.ensure_future(items.__anext__())
+        try:
+            while True:
+                if batch:
+                    await asyncio.wait({next_item}, timeout=max(0.0, deadline - time.monotonic()))
+                else:
+                    await asyncio.wait({next_item})
+
+                if next_item.done():
+                    try:
+                        item = next_item.result()
+                    except StopAsyncIteration:
+                        break
+                    if not batch:
+                        deadline = time.monotonic() + self.batch_timeout
+                    batch.append(item)
+                    next_item = asyncio.ensure_future(items.__anext__())
+
+                if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    await lookups.put({'sequence': sequence, 'items': batch})
+                    sequence += 1
+                    batch = []
+        finally:
+            next_item.cancel()
+        if batch:
+            await lookups.put({'sequence': sequence, 'items': batch})
+
+    @staticmethod
+    async def _iterate(source):
+        """Iterate sync or async sources; blocking sync iterators (files, stdin) are read off the loop"""
+        if hasattr(source, '__aiter__'):
+            async for item in source:
+                yield item
+        elif isinstance(source, (list, tuple)):
+            for item in source:
+                yield item
+        else:
+            loop = asyncio.get_running_loop()
+            iterator = iter(source)
+            while True:
+                item = await loop.run_in_executor(None, next, iterator, _DONE)
+                if item is _DONE:
+                    return
+                yield item
+
+    async def _lookup(self, batch: Dict, io_pool: ThreadPoolExecutor) -> Dict:
+        """Fetch rows for ids and warm the caches the prediction stage reads"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        items = batch['items']
+        try:
+            email_ids = [item for item in items if not isinstance(item, dict)]
+            sender_index = loop.run_in_executor(io_pool, self.predictor.sender_index.warm)
+            rows = await loop.run_in_executor(io_pool, self.predictor.fetch_emails, email_ids) if email_ids else {}
+
+            batch['emails'] = [item if isinstance(item, dict) else rows.get(item) for item in items]
+            await asyncio.gather(sender_index, self._prefetch_analysis(
+                [email for email in batch['emails'] if email is not None], io_pool
+            ))
+        except Exception as e:
+            # Prediction still works without the lookups, just with blocking I/O
+            self.logger.error(f"Error in pipeline lookups: {e}")
+            batch.setdefault('emails', [item if isinstance(item, dict) else None for item in items])
+        self._stage_timer.observe(time.perf_counter() - start, stage='lookup')
+        return batch
+
+    async def _prefetch_analysis(self, emails: List[Dict], io_pool: ThreadPoolExecutor):
+        cache = self.predictor.analysis_cache
+        if cache is None or not emails:
+            return
+        keys = [
+            self.predictor._analysis_key(email.get('subject') or '', email.get('body') or '')
+            for email in emails
+        ]
+        if self.redis is not None:
+            await cache.get_many_async(keys, self.redis)
+        else:
+            await asyncio.get_running_loop().run_in_executor(io_pool, cache.get_many, keys)
+
+    async def _predict(self, batch: Dict, user_id: Optional[int], cpu_pool: ThreadPoolExecutor) -> Dict:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        emails = batch['emails']
+        found = [email for email in emails if email is not None]
+        try:
+            predictions = iter(await loop.run_in_executor(
+                cpu_pool, lambda: self.predictor.predict_email_actions(found, user_id=user_id)
+            ) if found else ())
+        except Exception as e:
+            self.logger.error(f"Error in pipeline predictions: {e}")
+            predictions = iter([{'predicted_action': 'normal', 'confidence': 0.0, 'error': str(e)}] * len(found))
+
+        results = []
+        for item, email in zip(batch['items'], emails):
+            if email is None:
+                results.append({'email_id': item, 'error': 'Email not found'})
+            else:
+                result = dict(next(predictions))
+                if email.get('id') is not None:
+                    result['email_id'] = email['id']
+                results.append(result)
+
+        self._stage_timer.observe(time.perf_counter() - start, stage='predict')
+        self._emails_counter.inc(len(results))
+        return {'sequence': batch['sequence'], 'results': results}
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Lexicon Matcher
+Compiled multi-lexicon keyword scanner used by the email feature extractors
+"""
+
+import re
+from bisect import bisect_right
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton over arbitrary hashable symbols
+
+    Symbols are characters for substring matching and whole tokens for
+    phrase matching, so one implementation serves both modes.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[Sequence[Hashable], object]]):
+        self._goto: List[Dict[Hashable, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[object]] = [[]]
+
+        for symbols, payload in patterns:
+            state = 0
+            for symbol in symbols:
+                next_state = self._goto[state].get(symbol)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][symbol] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(payload)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for symbol, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and symbol not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(symbol, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, symbols: Iterable[Hashable]):
+        """Yield the payload of every pattern occurrence, overlaps included"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for symbol in symbols:
+            while state and symbol not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(symbol, 0)
+            if output[state]:
+                yield from output[state]
+
+
+class LexiconMatcher:
+    """Scans a text once and reports which terms of every lexicon occur in it
+
+    With word boundaries, text is split into word tokens: single-word terms are
+    resolved with one set intersection and multi-word phrases with a token-level
+    Aho-Corasick automaton, so cost grows with the text and not the lexicon size.
+    Phrase words may be separated by any non-word characters. Without word
+    boundaries a character-level automaton reproduces plain substring matching.
+
+    Texts are expected to be lowercased by the caller; terms are lowercased here.
+    term_presence answers the same question for many texts at once.
+    """
+
+    TOKEN_PATTERN = re.compile(r'\w+')
+
+    # Maps every ASCII byte outside \w to a space, for the ASCII tokenizer fast path
+    ASCII_WORD_TABLE = bytes(c if chr(c).isalnum() or c == ord('_') else 32 for c in range(128)) + b' ' * 128
+
+    def __init__(self, lexicons: Dict[str, Iterable[str]], word_boundaries: bool = False):
+        self.word_boundaries = word_boundaries
+        self.lexicons = {
+            name: sorted({term.strip().lower() for term in terms if term and term.strip()})
+            for name, terms in lexicons.items()
+        }
+
+        if word_boundaries:
+            self._single_terms: Dict[str, List[Tuple[str, str]]] = {}
+            phrases = []
+            for name, terms in self.lexicons.items():
+                for term in terms:
+                    tokens = self.TOKEN_PATTERN.findall(term)
+                    if len(tokens) == 1:
+                        self._single_terms.setdefault(tokens[0], []).append((name, term))
+                    elif tokens:
+                        phrases.append((tokens, (name, term)))
+            self._single_vocabulary = frozenset(self._single_terms)
+            self._phrase_starts = frozenset(tokens[0] for tokens, _ in phrases)
+            self._automaton = AhoCorasick(phrases)
+        else:
+            self._automaton = AhoCorasick(
+                (term, (name, term))
+                for name, terms in self.lexicons.items()
+                for term in terms
+            )
+
+    def scan(self, text_lower: str) -> Dict[str, Set[str]]:
+        """Return the distinct matched terms of each lexicon"""
+        hits: Dict[str, Set[str]] = {name: set() for name in self.lexicons}
+        if not text_lower:
+            return hits
+
+        if not self.word_boundaries:
+            for name, term in self._automaton.iter_matches(text_lower):
+                hits[name].add(term)
+            return hits
+
+        tokens = self.tokenize(text_lower)
+        token_set = set(tokens)
+
+        for token in token_set & self._single_vocabulary:
+            for name, term in self._single_terms[token]:
+                hits[name].add(term)
+
+        if not token_set.isdisjoint(self._phrase_starts):
+            for name, term in self._automaton.iter_matches(tokens):
+                hits[name].add(term)
+
+        return hits
+
+    def tokenize(self, text: str) -> List[str]:
+        """Split text into \\w+ word tokens"""
+        if text.isascii():
+            return text.encode('ascii').translate(self.ASCII_WORD_TABLE).decode('ascii').split()
+        return self.TOKEN_PATTERN.findall(text)
+
+    def term_presence(self, texts_lower: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Per lexicon, a (texts x terms) boolean matrix of which terms each text contains
+
+        Matches are the same as scan()'s. Without word boundaries every
+        distinct term is searched for with str.find over all texts joined into
+        one string, jumping to the next text after each hit, so the Python-level
+        work follows the number of texts containing a term, not their length.
+        """
+        presence = {name: np.zeros((len(texts_lower), len(terms)), dtype=bool)
+                    for name, terms in self.lexicons.items()}
+        if not len(texts_lower):
+            return presence
+
+        if self.word_boundaries:
+            columns = {name: {term: j for j, term in enumerate(terms)} for name, terms in self.lexicons.items()}
+            for i, text in enumerate(texts_lower):
+                for name, terms in self.scan(text).items():
+                    for term in terms:
+                        presence[name][i, columns[name][term]] = True
+            return presence
+
+        # NUL never occurs in a term, so no match spans two texts
+        joined = '\0'.join(texts_lower)
+        starts, position = [], 0
+        for text in texts_lower:
+            starts.append(position)
+            position += len(text) + 1
+
+        containing: Dict[str, List[int]] = {}
+        for term in {term for terms in self.lexicons.values() for term in terms}:
+            rows = containing[term] = []
+            found = joined.find(term)
+            while found != -1:
+                row = bisect_right(starts, found) - 1
+                rows.append(row)
+                found = joined.find(term, starts[row + 1]) if row + 1 < len(starts) else -1
+
+        for name, terms in self.lexicons.items():
+            for j, term in enumerate(terms):
+                presence[name][containing[term], j] = True
+        return presence
+
+    def count(self, text_lower: str) -> Dict[str, int]:
+        """Return the number of distinct matched terms per lexicon"""
+        return {name: len(terms) for name, terms in self.scan(text_lower).items()}
+
+    def size(self, name: str) -> int:
+        """Number of terms in a lexicon"""
+        return len(self.lexicons.get(name, ()))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Model Artifacts
+Model directories with JSON metadata, memory-mapped compiled arrays and a
+compressed estimator file that is only read when needed
+"""
+
+import json
+import os
+import threading
+from typing import Any, Callable, Dict
+
+import joblib
+import numpy as np
+
+METADATA_FILE = 'metadata.json'
+ESTIMATOR_FILE = 'estimator.joblib'
+# Fields only needed for incremental updates and uncompiled scoring
+ESTIMATOR_KEYS = ('model', 'scaler', 'label_encoder')
+FORMAT_VERSION = 1
+
+
+class ModelArtifact(dict):
+    """Model data read from an artifact directory
+
+    Metadata and compiled arrays are present from the start; the first
+    access to an estimator key reads estimator.joblib and fills in all of
+    them, so serving a compiled model never unpickles sklearn objects.
+    """
+
+    def __init__(self, fields: Dict[str, Any], load_estimator: Callable[[], Dict[str, Any]]):
+        super().__init__(fields)
+        self._load_estimator = load_estimator
+        self._lock = threading.Lock()
+
+    def __missing__(self, key: str):
+        if key not in ESTIMATOR_KEYS:
+            raise KeyError(key)
+        with self._lock:
+            if not dict.__contains__(self, key):
+                self.update(self._load_estimator())
+        return dict.__getitem__(self, key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @property
+    def estimator_loaded(self) -> bool:
+        return dict.__contains__(self, 'model')
+
+
+def write_artifact(path: str, model_data: Dict[str, Any], compress: int = 3) -> int:
+    """Write model data into the (new, empty) directory path; returns the bytes written"""
+    metadata = {key: value for key, value in model_data.items() if key not in ESTIMATOR_KEYS + ('compiled',)}
+    metadata['format'] = FORMAT_VERSION
+
+    compiled = model_data.get('compiled')
+    if compiled is not None:
+        metadata['compiled'] = dict(
+            {key: value for key, value in compiled.items() if key != 'arrays'},
+            arrays=_write_arrays(path, compiled['arrays']),
+        )
+
+    joblib.dump({key: model_data.get(key) for key in ESTIMATOR_KEYS},
+                os.path.join(path, ESTIMATOR_FILE), compress=compress)
+    with open(os.path.join(path, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, default=_json_default)
+    return artifact_size(path)
+
+
+def read_metadata(path: str) -> Dict[str, Any]:
+    """Everything but the estimator and arrays, read as plain JSON"""
+    with open(os.path.join(path, METADATA_FILE), 'r') as f:
+        return json.load(f)
+
+
+def load_artifact(path: str, mmap_mode: str = 'r') -> ModelArtifact:
+    """Model data with its compiled arrays memory-mapped and the estimator deferred"""
+    fields = read_metadata(path)
+    compiled = fields.get('compiled')
+    if compiled is not None:
+        compiled['arrays'] = _read_arrays(path, compiled['arrays'], mmap_mode)
+        compiled['class_labels'] = np.asarray(compiled['class_labels'])
+        if compiled.get('feature_importances') is not None:
+            compiled['feature_importances'] = np.asarray(compiled['feature_importances'])
+
+    estimator_path = os.path.join(path, ESTIMATOR_FILE)
+    return ModelArtifact(fields, lambda: joblib.load(estimator_path))
+
+
+def artifact_size(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def _write_arrays(path: str, arrays: Dict[str, Any]) -> Dict[str, Any]:
+    """Save each array as its own .npy file; the returned layout goes into the metadata"""
+    layout = {}
+    for name, value in arrays.items():
+        if isinstance(value, np.ndarray):
+            layout[name] = {'file': _save_array(path, name, value)}
+        elif isinstance(value, list):
+            layout[name] = {'files': [_save_array(path, f'{name}_{i}', item) for i, item in enumerate(value)]}
+        else:
+            layout[name] = {'value': value}
+    return layout
+
+
+def _save_array(path: str, name: str, array: np.ndarray) -> str:
+    filename = f'{name}.npy'
+    np.save(os.path.join(path, filename), np.ascontiguousarray(array))
+    return filename
+
+
+def _read_arrays(path: str, layout: Dict[str, Any], mmap_mode: str) -> Dict[str, Any]:
+    arrays = {}
+    for name, spec in layout.items():
+        if 'file' in spec:
+            arrays[name] = np.load(os.path.join(path, spec['file']), mmap_mode=mmap_mode)
+        elif 'files' in spec:
+            arrays[name] = [np.load(os.path.join(path, filename), mmap_mode=mmap_mode) for filename in spec['files']]
+        else:
+            arrays[name] = spec['value']
+    return arrays
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
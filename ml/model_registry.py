@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Model Registry
+Manifest-indexed model files with a memory-bounded LRU cache of loaded models
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import joblib
+
+from metrics import MetricsRegistry
+from model_artifact import METADATA_FILE, ModelArtifact, artifact_size, load_artifact, read_metadata, write_artifact
+
+
+class ModelRegistry:
+    """Index of saved models and cache of the ones loaded in memory
+
+    manifest.json maps each model key to its current file, version, size and
+    training time, so finding a model is one dictionary lookup instead of a
+    directory scan. The manifest is rewritten atomically under a file lock on
+    every save, and other processes pick up new versions when its mtime
+    changes. Loaded models are kept in an LRU bounded by a memory budget
+    (estimated from file size); keys known to have no model are remembered
+    until the manifest changes or the negative TTL expires.
+
+    Models with an estimator are saved as artifact directories (see
+    model_artifact): loading one reads a small JSON file and memory-maps the
+    compiled arrays, and the estimator is only unpickled when used. Other
+    data, such as personalization layers, stays a single joblib file, and
+    joblib files written by earlier versions still load.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, model_dir: str, memory_budget: int = 1024 ** 3, negative_ttl: int = 300,
+                 pinned: Iterable[str] = ('global',), on_evict: Optional[Callable[[str], None]] = None,
+                 artifacts: bool = True, compress: int = 3,
+                 logger: Optional[logging.Logger] = None, metrics: Optional[MetricsRegistry] = None):
+        self.model_dir = model_dir
+        self.memory_budget = memory_budget
+        self.artifacts = artifacts
+        self.compress = compress
+        self.negative_ttl = negative_ttl
+        self.pinned = set(pinned)
+        self.on_evict = on_evict
+        self.logger = logger or logging.getLogger('EmailPredictor')
+        metrics = metrics or MetricsRegistry()
+        self._hit_counter = metrics.cache_result('model', 'hit')
+        self._miss_counter = metrics.cache_result('model', 'miss')
+        self._negative_hit_counter = metrics.cache_result('model', 'negative_hit')
+        self._load_seconds = metrics.histogram('model_load_seconds', 'Time to load a model file from disk')
+        self._save_seconds = metrics.histogram('model_save_seconds', 'Time to write a model file to disk')
+
+        # key -> (version, size, model data), least recently used first
+        self._loaded: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._loaded_bytes = 0
+        self._missing: Dict[str, float] = {}
+        self._manifest: Dict[str, Dict] = {}
+        self._manifest_mtime = None
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the current model data for key, loading it if needed"""
+        with self._lock:
+            self._refresh_manifest()
+
+            entry = self._manifest.get(key)
+            if entry is None:
+                expires = self._missing.get(key)
+                if expires is not None and expires > time.monotonic():
+                    self.negative_hits += 1
+                    self._negative_hit_counter.inc()
+                else:
+                    self._missing[key] = time.monotonic() + self.negative_ttl
+                    self.misses += 1
+                    self._miss_counter.inc()
+                return None
+
+            loaded = self._loaded.get(key)
+            if loaded is not None and loaded[0] == entry['version']:
+                self._loaded.move_to_end(key)
+                self.hits += 1
+                self._hit_counter.inc()
+                return loaded[2]
+
+            self.misses += 1
+            self._miss_counter.inc()
+            return self._load(key, entry)
+
+    def save(self, key: str, model_data: Dict[str, Any], model_type: str) -> str:
+        """Write a new version of a model and point the manifest at it"""
+        with self._locked_manifest():
+            previous = self._manifest.get(key)
+            version = previous['version'] + 1 if previous else 1
+            artifact = self.artifacts and (isinstance(model_data, ModelArtifact) or 'model' in model_data)
+            filename = f"{key}_{model_type}_v{version}" + ('' if artifact else '.joblib')
+            path = os.path.join(self.model_dir, filename)
+
+            if artifact:
+                tmp_path = tempfile.mkdtemp(dir=self.model_dir, prefix=f".{filename}.")
+            else:
+                fd, tmp_path = tempfile.mkstemp(dir=self.model_dir, prefix=f".{filename}.")
+                os.close(fd)
+            try:
+                with self._save_seconds.time():
+                    if artifact:
+                        write_artifact(tmp_path, model_data, self.compress)
+                    else:
+                        joblib.dump(model_data, tmp_path)
+                os.replace(tmp_path, path)
+            except Exception:
+                self._remove_path(tmp_path)
+                raise
+
+            size = artifact_size(path) if artifact else os.path.getsize(path)
+            self._manifest[key] = {
+                'file': filename,
+                'version': version,
+                'size': size,
+                'model_type': model_type,
+                'trained_at': model_data.get('trained_at') or datetime.now().isoformat(),
+            }
+            self._write_manifest()
+
+            # Readers that resolved the old file just before the switch retry via the manifest
+            if previous and previous['file'] != filename:
+                self._remove_file(previous['file'])
+
+            self._missing.pop(key, None)
+            self._cache(key, version, size, model_data)
+
+        self.logger.info(f"Saved model {key} version {version} to {path}")
+        return path
+
+    def remove(self, key: str):
+        """Delete a model and its manifest entry"""
+        with self._locked_manifest():
+            entry = self._manifest.pop(key, None)
+            if entry is None:
+                return
+            self._write_manifest()
+            self._remove_file(entry['file'])
+            self._uncache(key)
+
+    def preload(self, keys: Iterable[str]) -> List[str]:
+        """Load models ahead of use while they fit the memory budget; returns the keys loaded"""
+        loaded = []
+        for key in keys:
+            with self._lock:
+                self._refresh_manifest()
+                entry = self._manifest.get(key)
+                if entry is None:
+                    continue
+                if self._loaded_bytes + entry['size'] > self.memory_budget and key not in self._loaded:
+                    break
+            if self.get(key) is not None:
+                loaded.append(key)
+        return loaded
+
+    def metadata(self, key: str) -> Optional[Dict[str, Any]]:
+        """Manifest entry of a model plus its artifact metadata, without loading the model"""
+        with self._lock:
+            self._refresh_manifest()
+            entry = self._manifest.get(key)
+        if entry is None:
+            return None
+        path = os.path.join(self.model_dir, entry['file'])
+        try:
+            return dict(read_metadata(path), **entry) if os.path.isdir(path) else dict(entry)
+        except FileNotFoundError:
+            return dict(entry)
+
+    def read(self, key: str) -> Optional[Dict[str, Any]]:
+        """Load the current version of a model from disk, bypassing and not filling the cache"""
+        with self._lock:
+            self._refresh_manifest()
+            entry = self._manifest.get(key)
+        if entry is None:
+            return None
+        return self._read_file(os.path.join(self.model_dir, entry['file']))
+
+    def entries(self) -> Dict[str, Dict]:
+        """Manifest entries by model key"""
+        with self._lock:
+            self._refresh_manifest()
+            return dict(self._manifest)
+
+    def stats(self) -> Dict[str, int]:
+        """Cache counters and memory use"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'negative_hits': self.negative_hits,
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'loaded_models': len(self._loaded),
+            'loaded_bytes': self._loaded_bytes,
+        }
+
+    def _load(self, key: str, entry: Dict) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.model_dir, entry['file'])
+        start = time.perf_counter()
+        try:
+            model_data = self._read_file(path)
+        except FileNotFoundError:
+            # Replaced by another process since the manifest was read
+            self._manifest_mtime = None
+            self._refresh_manifest()
+            entry = self._manifest.get(key)
+            if entry is None:
+                return None
+            path = os.path.join(self.model_dir, entry['file'])
+            model_data = self._read_file(path)
+
+        self._load_seconds.observe(time.perf_counter() - start)
+        self.loads += 1
+        self._cache(key, entry['version'], entry['size'], model_data)
+        self.logger.info(f"Loaded model {key} from {path}")
+        return model_data
+
+    @staticmethod
+    def _read_file(path: str) -> Dict[str, Any]:
+        if os.path.isdir(path):
+            return load_artifact(path)
+        return joblib.load(path)
+
+    def _cache(self, key: str, version: int, size: int, model_data: Dict[str, Any]):
+        """Insert into the LRU and evict unpinned models beyond the memory budget"""
+        self._uncache(key, notify=False)
+        self._loaded[key] = (version, size, model_data)
+        self._loaded_bytes += size
+
+        for candidate in list(self._loaded):
+            if self._loaded_bytes <= self.memory_budget:
+                break
+            if candidate == key or candidate in self.pinned:
+                continue
+            self._uncache(candidate)
+            self.evictions += 1
+
+    def _uncache(self, key: str, notify: bool = True):
+        loaded = self._loaded.pop(key, None)
+        if loaded is not None:
+            self._loaded_bytes -= loaded[1]
+            if notify and self.on_evict:
+                self.on_evict(key)
+
+    def _refresh_manifest(self):
+        """Re-read the manifest when another process has replaced it"""
+        path = os.path.join(self.model_dir, self.MANIFEST)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            if self._manifest_mtime is None:
+                # Scan the directory once; later misses stay O(1) until a save
+                self._manifest_mtime = 0
+                self._rebuild_manifest()
+            return
+
+        if mtime != self._manifest_mtime:
+            with open(path, 'r') as f:
+                self._manifest = json.load(f).get('models', {})
+            self._manifest_mtime = mtime
+            self._missing.clear()
+
+    def _rebuild_manifest(self):
+        """Index model files written before the registry existed, newest file per key"""
+        pattern = re.compile(r'^(global|user_\d+|personal_user_\d+)(?:_(.+?))?(?:_v(\d+))?(\.joblib)?$')
+        found: Dict[str, Dict] = {}
+        for filename in os.listdir(self.model_dir):
+            match = pattern.match(filename)
+            if not match:
+                continue
+            path = os.path.join(self.model_dir, filename)
+            if not match.group(4) and not os.path.isfile(os.path.join(path, METADATA_FILE)):
+                continue
+            stat = os.stat(path)
+            key = match.group(1)
+            if key in found and found[key]['ctime'] >= stat.st_ctime:
+                continue
+            found[key] = {
+                'file': filename,
+                'version': int(match.group(3) or 1),
+                'size': stat.st_size if match.group(4) else artifact_size(path),
+                'model_type': match.group(2) or 'personalized_calibration',
+                'trained_at': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                'ctime': stat.st_ctime,
+            }
+
+        if not found:
+            return
+
+        with self._locked_manifest():
+            for key, entry in found.items():
+                entry.pop('ctime')
+                self._manifest.setdefault(key, entry)
+            self._write_manifest()
+        self.logger.info(f"Indexed {len(found)} existing model files into the model manifest")
+
+    @contextmanager
+    def _locked_manifest(self):
+        """Exclusive lock across threads and processes, with the latest manifest loaded"""
+        with self._lock, open(os.path.join(self.model_dir, '.manifest.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            path = os.path.join(self.model_dir, self.MANIFEST)
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    self._manifest = json.load(f).get('models', {})
+            yield
+
+    def _write_manifest(self):
+        path = os.path.join(self.model_dir, self.MANIFEST)
+        fd, tmp_path = tempfile.mkstemp(dir=self.model_dir, prefix='.manifest.')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'models': self._manifest}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+        self._manifest_mtime = os.stat(path).st_mtime_ns
+        self._missing.clear()
+
+    def _remove_file(self, filename: str):
+        self._remove_path(os.path.join(self.model_dir, filename))
+
+    @staticmethod
+    def _remove_path(path: str):
+        # Memory-mapped arrays of a removed artifact stay readable until unmapped
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
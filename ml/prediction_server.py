@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Prediction Server
+Keeps an EmailPredictor resident and serves predictions over a Unix socket or HTTP
+"""
+
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+import numpy as np
+
+from metrics import CONTENT_TYPE
+
+
+class PredictionServer:
+    """JSON prediction service around one resident EmailPredictor
+
+    Requests are JSON objects with an "action" of "predict" (an "email_id" or
+    an inline "email"), "predict-batch" ("email_ids" or "emails"), "stats",
+    "metrics" or "ping", plus an optional "user_id". Over the Unix socket each
+    request and response is one line; over HTTP the action is taken from the
+    body or from the path (POST /predict, POST /predict-batch, GET /stats,
+    GET /health), and GET /metrics returns the Prometheus text format.
+
+    Connections are accepted on their own threads, but predictions run on a
+    fixed worker pool sharing the predictor, which fetches emails through its
+    database connection pool. Models are hot-reloaded because every
+    prediction resolves its model through the registry, which follows the
+    manifest; a reloaded model is swapped in whole, so in-flight requests
+    finish on the version they started with.
+    """
+
+    LATENCY_WINDOW = 10000
+    ACTIONS = ('predict', 'predict-batch', 'stats', 'metrics', 'ping')
+
+    def __init__(self, predictor, workers: int = 4, stats_interval: int = 60,
+                 logger: Optional[logging.Logger] = None):
+        self.predictor = predictor
+        self.workers = workers
+        self.stats_interval = stats_interval
+        self.logger = logger or logging.getLogger('EmailPredictor')
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='predict')
+        self._latencies: Dict[str, deque] = {}
+        self._requests: Dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+        self._server = None
+        self._stopped = threading.Event()
+        self._started_at = time.time()
+        self._request_seconds = predictor.metrics.histogram(
+            'server_request_seconds', 'Prediction server request latency by action', ('action',)
+        )
+
+    def handle(self, request: Dict) -> Dict:
+        """Run one request on the worker pool and record its latency"""
+        action = request.get('action', 'predict') if isinstance(request, dict) else None
+        # Client-supplied names would otherwise grow the stats and metric labels without bound
+        recorded = action if isinstance(action, str) and action in self.ACTIONS else 'invalid'
+        start = time.perf_counter()
+        try:
+            if action in ('predict', 'predict-batch'):
+                response = self._pool.submit(self._predict, action, request).result()
+            elif action == 'stats':
+                response = {'stats': self.stats()}
+            elif action == 'metrics':
+                response = {'metrics': self.predictor.metrics.render()}
+            elif action == 'ping':
+                response = {'status': 'ok'}
+            else:
+                response = {'error': f"Unknown action: {action}"}
+        except Exception as e:
+            self.logger.error(f"Error handling {action} request: {e}")
+            response = {'error': str(e)}
+
+        self._record(recorded, time.perf_counter() - start)
+        return response
+
+    def stats(self) -> Dict:
+        """Request counts and p50/p99 latency in milliseconds per action"""
+        with self._stats_lock:
+            latency = {
+                action: {
+                    'requests': self._requests[action],
+                    'p50_ms': round(float(np.percentile(samples, 50)) * 1000, 3),
+                    'p99_ms': round(float(np.percentile(samples, 99)) * 1000, 3),
+                }
+                for action, samples in self._latencies.items() if samples
+            }
+        return {
+            'uptime_seconds': round(time.time() - self._started_at, 1),
+            'workers': self.workers,
+            'latency': latency,
+            'caches': self.predictor.get_cache_stats(),
+        }
+
+    def serve_unix(self, path: str):
+        """Serve newline-delimited JSON on a Unix socket until shutdown"""
+        if os.path.exists(path):
+            os.remove(path)
+
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        request = json.loads(line)
+                    except ValueError as e:
+                        response = {'error': f"Invalid JSON: {e}"}
+                    else:
+                        response = service.handle(request)
+                    self.wfile.write(json.dumps(response, default=str).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        self._server = Server(path, Handler)
+        os.chmod(path, 0o660)
+        self.logger.info(f"Prediction server listening on unix:{path} with {self.workers} workers")
+        try:
+            self._serve()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def serve_http(self, host: str, port: int):
+        """Serve JSON over HTTP until shutdown"""
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') == '/stats':
+                    self._respond(service.handle({'action': 'stats'}))
+                elif self.path.rstrip('/') == '/metrics':
+                    body = service.predictor.metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', CONTENT_TYPE)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif self.path.rstrip('/') in ('', '/health'):
+                    self._respond(service.handle({'action': 'ping'}))
+                else:
+                    self._respond({'error': 'Not found'}, 404)
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError as e:
+                    self._respond({'error': f"Invalid JSON: {e}"}, 400)
+                    return
+                path_action = self.path.strip('/')
+                if path_action and isinstance(request, dict):
+                    request.setdefault('action', path_action)
+                response = service.handle(request)
+                self._respond(response, 400 if 'error' in response else 200)
+
+            def _respond(self, response: Dict, status: int = 200):
+                body = json.dumps(response, default=str).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.logger.info(f"Prediction server listening on http://{host}:{port} with {self.workers} workers")
+        self._serve()
+
+    def shutdown(self):
+        """Stop accepting requests; safe to call from a signal handler"""
+        if self._server:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def _serve(self):
+        reporter = threading.Thread(target=self._report_stats, daemon=True)
+        reporter.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._stopped.set()
+            self._server.server_close()
+            self._pool.shutdown(wait=True)
+            self.logger.info(f"Prediction server stopped: {json.dumps(self.stats()['latency'])}")
+
+    def _predict(self, action: str, request: Dict) -> Dict:
+        """Worker-side prediction, fetching emails on the worker's own connection"""
+        user_id = request.get('user_id')
+
+        if action == 'predict':
+            email = request.get('email')
+            if email is None:
+                if request.get('email_id') is None:
+                    return {'error': 'email_id or email is required'}
+                email = self.predictor.fetch_emails([int(request['email_id'])]).get(int(request['email_id']))
+                if email is None:
+                    return {'error': f"Email {request['email_id']} not found"}
+            return {'prediction': self.predictor.predict_email_action(email, user_id)}
+
+        if request.get('emails') is not None:
+            emails = request['emails']
+            return {'predictions': self.predictor.predict_email_actions(emails, user_id=user_id)}
+
+        email_ids = [int(email_id) for email_id in request.get('email_ids') or []]
+        emails_by_id = self.predictor.fetch_emails(email_ids)
+        found_ids = [email_id for email_id in email_ids if email_id in emails_by_id]
+        predictions = dict(zip(found_ids, self.predictor.predict_email_actions(
+            [emails_by_id[email_id] for email_id in found_ids], user_id=user_id
+        )))
+        return {'predictions': [
+            dict(predictions[email_id], email_id=email_id)
+            if email_id in predictions
+            else {'email_id': email_id, 'error': 'Email not found'}
+            for email_id in email_ids
+        ]}
+
+    def _record(self, action: str, seconds: float):
+        """Record a request's latency under one of ACTIONS or 'invalid'"""
+        self._request_seconds.observe(seconds, action=action)
+        with self._stats_lock:
+            samples = self._latencies.get(action)
+            if samples is None:
+                samples = self._latencies[action] = deque(maxlen=self.LATENCY_WINDOW)
+            samples.append(seconds)
+            self._requests[action] = self._requests.get(action, 0) + 1
+
+    def _report_stats(self):
+        """Log latency percentiles periodically while serving"""
+        while not self._stopped.wait(self.stats_interval):
+            if self._requests:
+                self.logger.info(f"Prediction latency: {json.dumps(self.stats()['latency'])}")
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Sender Frequency Index
+Sliding-window per-sender email counts kept in memory, optionally shared through Redis
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+import redis
+
+from connection_pool import DatabasePool
+from metrics import MetricsRegistry
+
+
+class SenderFrequencyIndex:
+    """In-memory sliding-window index of emails per sender
+
+    Counts are kept in daily buckets so the window slides without re-querying
+    the database. The index is loaded with one grouped query and then kept
+    current by fetching only emails with an id above the last seen id.
+    Senders evicted by the size bound start again from zero if they reappear.
+    Lookups are safe from many threads; one thread refreshes at a time while
+    the others keep answering from the current counts.
+    """
+
+    REDIS_PREFIX = 'sender_freq'
+
+    def __init__(self, db: DatabasePool, redis_client=None, window_days: int = 30,
+                 max_senders: int = 200000, refresh_interval: int = 60,
+                 logger: Optional[logging.Logger] = None, metrics: Optional[MetricsRegistry] = None):
+        self.db = db
+        self.redis = redis_client
+        self.window_days = window_days
+        self.max_senders = max_senders
+        self.refresh_interval = refresh_interval
+        self.logger = logger or logging.getLogger('EmailPredictor')
+        self.metrics = metrics or MetricsRegistry()
+
+        # sender -> [total, deque([day_ordinal, count], ...)]
+        self._senders: 'OrderedDict[str, list]' = OrderedDict()
+        self._watermark = 0
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+
+        self.evictions = 0
+
+    def get(self, sender: str) -> int:
+        """Return the number of emails from sender inside the window"""
+        self._ensure_fresh()
+
+        with self._lock:
+            entry = self._senders.get(sender)
+            if entry is None:
+                return 0
+
+            total = self._expire(entry, self._window_start())
+            if total == 0:
+                del self._senders[sender]
+                return 0
+
+            self._senders.move_to_end(sender)
+            return total
+
+    def warm(self):
+        """Load or refresh now so that the next lookups do not query the database"""
+        self._ensure_fresh()
+
+    def __len__(self) -> int:
+        return len(self._senders)
+
+    def load(self):
+        """Load the full window, from Redis when another process has already built it"""
+        with self._lock:
+            self._senders.clear()
+            self._watermark = 0
+
+            if not self._load_from_redis():
+                self._load_from_database()
+
+            self._loaded = True
+            self._last_refresh = time.monotonic()
+            self.logger.info(
+                f"Sender index loaded: {len(self._senders)} senders, watermark {self._watermark}"
+            )
+
+    def refresh(self):
+        """Fold in emails that arrived since the last load or refresh"""
+        previous_watermark = self._watermark
+        # Query outside the lock so lookups are not blocked on the database
+        rows = self.db.query(
+            """
+            SELECT sender, DATE(received_at) AS day, COUNT(*), MAX(id)
+            FROM emails
+            WHERE id > %s AND received_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            GROUP BY sender, DATE(received_at)
+            """,
+            (previous_watermark, self.window_days),
+            timer=self.metrics.db_query('sender_frequency_refresh')
+        )
+
+        with self._lock:
+            if self._watermark != previous_watermark:
+                return  # a concurrent load or refresh already covered these emails
+
+            for sender, day, count, max_id in rows:
+                self._add(sender, day, count)
+                self._watermark = max(self._watermark, max_id or 0)
+
+            self._last_refresh = time.monotonic()
+
+        if rows:
+            self._publish_increments(rows, previous_watermark)
+
+    def _ensure_fresh(self):
+        """Load on first use and refresh at most once per refresh interval"""
+        if not self._loaded:
+            with self._lock:
+                # A failed load is retried once per interval rather than on every lookup
+                if self._loaded or (self._last_refresh and
+                                    time.monotonic() - self._last_refresh < self.refresh_interval):
+                    return
+                self._last_refresh = time.monotonic()
+                self.load()
+        elif time.monotonic() - self._last_refresh >= self.refresh_interval:
+            # Another thread already refreshing means the counts are about to be current
+            if not self._refresh_lock.acquire(blocking=False):
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error(f"Error refreshing sender index: {e}")
+                self._last_refresh = time.monotonic()
+            finally:
+                self._refresh_lock.release()
+
+    def _load_from_database(self):
+        """Load per-sender daily counts for the whole window in one grouped query"""
+        rows = self.db.query(
+            """
+            SELECT sender, DATE(received_at) AS day, COUNT(*), MAX(id)
+            FROM emails
+            WHERE received_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            GROUP BY sender, DATE(received_at)
+            """,
+            (self.window_days,),
+            timer=self.metrics.db_query('sender_frequency_load')
+        )
+
+        self._bulk_add((sender, day, count) for sender, day, count, _ in rows)
+        self._watermark = max((max_id or 0 for _, _, _, max_id in rows), default=0)
+
+        self._publish_snapshot(rows)
+
+    def _load_from_redis(self) -> bool:
+        """Warm the index from the day buckets another process published"""
+        if not self.redis:
+            return False
+
+        try:
+            with self.metrics.redis_call('sender_frequency_load').time():
+                watermark = self.redis.get(f"{self.REDIS_PREFIX}:watermark")
+                if watermark is None:
+                    return False
+
+                days = self._window_days_list()
+                pipe = self.redis.pipeline(transaction=False)
+                for day in days:
+                    pipe.hgetall(f"{self.REDIS_PREFIX}:day:{day.isoformat()}")
+                buckets = pipe.execute()
+
+            self._bulk_add(
+                (sender, day, int(count))
+                for day, bucket in zip(days, buckets)
+                for sender, count in bucket.items()
+            )
+
+            self._watermark = int(watermark)
+        except Exception as e:
+            self.logger.error(f"Error loading sender index from Redis: {e}")
+            self._senders.clear()
+            self._watermark = 0
+            return False
+
+        # Catch up with anything inserted after the snapshot
+        self.refresh()
+        return True
+
+    def _publish_snapshot(self, rows):
+        """Share a freshly loaded window with other processes through Redis"""
+        if not self.redis:
+            return
+
+        try:
+            by_day: Dict[date, Dict[str, int]] = {}
+            for sender, day, count, _ in rows:
+                by_day.setdefault(self._as_date(day), {})[sender] = count
+
+            ttl = (self.window_days + 1) * 86400
+            pipe = self.redis.pipeline()
+            for day, counts in by_day.items():
+                key = f"{self.REDIS_PREFIX}:day:{day.isoformat()}"
+                pipe.delete(key)
+                pipe.hset(key, mapping=counts)
+                pipe.expire(key, ttl)
+            pipe.set(f"{self.REDIS_PREFIX}:watermark", self._watermark, ex=86400)
+            with self.metrics.redis_call('sender_frequency_publish').time():
+                pipe.execute()
+        except Exception as e:
+            self.logger.error(f"Error publishing sender index to Redis: {e}")
+
+    def _publish_increments(self, rows, previous_watermark: int):
+        """Apply a refresh to the shared buckets unless another process already did"""
+        if not self.redis:
+            return
+
+        watermark_key = f"{self.REDIS_PREFIX}:watermark"
+        ttl = (self.window_days + 1) * 86400
+        try:
+            with self.metrics.redis_call('sender_frequency_increment').time(), self.redis.pipeline() as pipe:
+                pipe.watch(watermark_key)
+                current = pipe.get(watermark_key)
+                if current is None or int(current) != previous_watermark:
+                    return
+
+                pipe.multi()
+                for sender, day, count, _ in rows:
+                    key = f"{self.REDIS_PREFIX}:day:{self._as_date(day).isoformat()}"
+                    pipe.hincrby(key, sender, count)
+                    pipe.expire(key, ttl)
+                pipe.set(watermark_key, self._watermark, ex=86400)
+                pipe.execute()
+        except redis.WatchError:
+            pass
+        except Exception as e:
+            self.logger.error(f"Error publishing sender index increments: {e}")
+
+    def _bulk_add(self, rows):
+        """Add (sender, day, count) rows, keeping only the most recently seen senders"""
+        by_sender: Dict[str, list] = {}
+        for sender, day, count in rows:
+            by_sender.setdefault(sender, []).append((self._as_date(day), count))
+
+        # Oldest last-seen first, so the LRU order matches recency
+        ranked = sorted(by_sender.items(), key=lambda item: max(day for day, _ in item[1]))
+        if len(ranked) > self.max_senders:
+            self.evictions += len(ranked) - self.max_senders
+            ranked = ranked[-self.max_senders:]
+
+        for sender, days in ranked:
+            for day, count in sorted(days):
+                self._add(sender, day, count)
+
+    def _add(self, sender: str, day, count: int):
+        """Add count emails for sender on day, evicting the least recently seen senders"""
+        day_ordinal = self._as_date(day).toordinal()
+        if day_ordinal < self._window_start():
+            return
+
+        entry = self._senders.get(sender)
+        if entry is None:
+            entry = [0, deque()]
+            self._senders[sender] = entry
+        else:
+            self._senders.move_to_end(sender)
+
+        total, buckets = entry
+        if buckets and buckets[-1][0] == day_ordinal:
+            buckets[-1][1] += count
+        elif not buckets or buckets[-1][0] < day_ordinal:
+            buckets.append([day_ordinal, count])
+        else:
+            # Out-of-order day: keep buckets sorted so expiry can pop from the left
+            ordered = sorted(list(buckets) + [[day_ordinal, count]])
+            merged = deque()
+            for bucket_day, bucket_count in ordered:
+                if merged and merged[-1][0] == bucket_day:
+                    merged[-1][1] += bucket_count
+                else:
+                    merged.append([bucket_day, bucket_count])
+            entry[1] = merged
+        entry[0] = total + count
+
+        while len(self._senders) > self.max_senders:
+            self._senders.popitem(last=False)
+            self.evictions += 1
+
+    def _expire(self, entry: list, window_start: int) -> int:
+        """Drop buckets that slid out of the window and return the remaining total"""
+        buckets = entry[1]
+        while buckets and buckets[0][0] < window_start:
+            entry[0] -= buckets.popleft()[1]
+        return entry[0]
+
+    def _window_start(self) -> int:
+        """First day ordinal still inside the window"""
+        return date.today().toordinal() - self.window_days
+
+    def _window_days_list(self):
+        today = date.today()
+        return [today - timedelta(days=offset) for offset in range(self.window_days + 1)]
+
+    @staticmethod
+    def _as_date(day) -> date:
+        if isinstance(day, datetime):
+            return day.date()
+        if isinstance(day, date):
+            return day
+        return date.fromisoformat(str(day))
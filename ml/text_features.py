@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Hashed Text Features
+Fixed-width sparse token and n-gram features for subject and body, computed
+by feature hashing so no vocabulary is ever fitted or stored
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class TextHasher:
+    """Stateless subject and body vectorizer with a fixed output width
+
+    Each field is hashed into its own block of n_features columns, so the
+    same word in a subject and in a body are separate features. Rows are
+    L2-normalized per field. Nothing is learned from the data: chunks can be
+    hashed independently while streaming, memory does not grow with the
+    vocabulary, and a model only has to remember params() to rebuild the
+    hasher it was trained with.
+    """
+
+    FIELDS = ('subject', 'body')
+
+    def __init__(self, n_features: int = 2 ** 14, ngram_range: Sequence[int] = (1, 2), max_chars: int = 10000):
+        self.n_features = int(n_features)
+        self.ngram_range = tuple(ngram_range)
+        self.max_chars = max_chars
+        self._vectorizer = None
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any]) -> 'TextHasher':
+        return cls(**params)
+
+    def params(self) -> Dict[str, Any]:
+        """What a model stores to rebuild this hasher"""
+        return {'n_features': self.n_features, 'ngram_range': list(self.ngram_range), 'max_chars': self.max_chars}
+
+    @property
+    def width(self) -> int:
+        return self.n_features * len(self.FIELDS)
+
+    def transform(self, emails: List[Dict]):
+        """CSR float32 matrix of (emails x width)"""
+        import scipy.sparse as sp
+
+        vectorizer = self._get_vectorizer()
+        blocks = [
+            vectorizer.transform([str(email.get(field) or '')[:self.max_chars] for email in emails])
+            for field in self.FIELDS
+        ]
+        return sp.hstack(blocks, format='csr', dtype=np.float32)
+
+    @staticmethod
+    def combine(dense: np.ndarray, text: Optional[Any]):
+        """Dense feature rows alongside their hashed text as one CSR matrix; dense alone when text is None"""
+        if text is None:
+            return dense
+        import scipy.sparse as sp
+
+        return sp.hstack([sp.csr_matrix(np.asarray(dense, dtype=np.float32)), text], format='csr')
+
+    def _get_vectorizer(self):
+        if self._vectorizer is None:
+            from sklearn.feature_extraction.text import HashingVectorizer
+
+            self._vectorizer = HashingVectorizer(
+                n_features=self.n_features, ngram_range=self.ngram_range,
+                alternate_sign=False, norm='l2', dtype=np.float32
+            )
+        return self._vectorizer
+
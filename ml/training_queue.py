@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Distributed Training Queue
+Per-user training jobs in Redis, claimed by any number of worker processes
+under leases kept alive by heartbeats
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+import redis
+
+from metrics import MetricsRegistry
+
+
+class LeaseLost(RuntimeError):
+    """A training run's lease lapsed, so another worker may be training the same model"""
+
+
+class TrainingQueue:
+    """Redis-backed queue of training jobs, one per model key
+
+    A job is identified by its model key ('global' or 'user_<id>'), so
+    enqueueing a user who is already waiting is a no-op, except that a
+    'train' request upgrades a waiting 'update' (never the reverse). Waiting
+    jobs sit in a sorted set scored by the time they become due (retries are
+    delayed), with their actions in a hash that claiming consumes.
+
+    Claiming a job first takes the key's lease, a Redis key set with NX and
+    a TTL: whoever holds it is the only process training that user, and a
+    job whose lease is held elsewhere is skipped until it is released. The
+    holder renews the lease with heartbeats; if its process dies the lease
+    expires, and any worker's reaper puts the job back in the queue (or
+    marks it failed after max_attempts). Lease-checked changes run in
+    WATCH/MULTI transactions, so a worker whose lease has lapsed cannot
+    complete or renew a job someone else now holds.
+    """
+
+    PREFIX = 'training'
+
+    def __init__(self, redis_client, lease_seconds: float = 300, max_attempts: int = 3, retry_delay: float = 60,
+                 logger: Optional[logging.Logger] = None, metrics: Optional[MetricsRegistry] = None):
+        self.redis = redis_client
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.logger = logger or logging.getLogger('EmailPredictor')
+        self.metrics = metrics or MetricsRegistry()
+        self._jobs_counter = self.metrics.counter(
+            'training_jobs_total', 'Training queue job outcomes', ('outcome',)
+        )
+
+        self.pending_key = f"{self.PREFIX}:pending"
+        self.active_key = f"{self.PREFIX}:active"
+        self.failed_key = f"{self.PREFIX}:failed"
+        self.actions_key = f"{self.PREFIX}:actions"
+
+    @staticmethod
+    def job_key(user_id: Optional[int]) -> str:
+        return f"user_{user_id}" if user_id else 'global'
+
+    def enqueue(self, user_id: Optional[int], action: str = 'update', delay: float = 0) -> bool:
+        """Queue a training job for a user (None for the global model); False when one is already waiting"""
+        return self.enqueue_many([user_id], action, delay) == 1
+
+    def enqueue_many(self, user_ids: Iterable[Optional[int]], action: str = 'update', delay: float = 0) -> int:
+        """Queue jobs for several users with one pipelined write; returns how many were newly queued"""
+        due = time.time() + delay
+        # One transaction, so a claim sees each job's action together with its queue entry
+        pipe = self.redis.pipeline(transaction=True)
+        for user_id in user_ids:
+            key = self.job_key(user_id)
+            pipe.hset(self._job_key(key), 'user_id', user_id or '')
+            self._queue_action(pipe, key, action)
+            pipe.zadd(self.pending_key, {key: due}, nx=True)
+            pipe.zrem(self.failed_key, key)
+        with self.metrics.redis_call('training_enqueue').time():
+            results = pipe.execute()
+        queued = sum(results[2::4])
+        self._jobs_counter.inc(queued, outcome='queued')
+        return queued
+
+    def claim(self, worker_id: str, scan: int = 16) -> Optional[Dict[str, Any]]:
+        """Take the lease of the oldest due job nobody else holds, or None when there is none"""
+        now = time.time()
+        with self.metrics.redis_call('training_claim').time():
+            candidates = self.redis.zrangebyscore(self.pending_key, '-inf', now, start=0, num=scan)
+            for key in candidates:
+                token = f"{worker_id}:{uuid.uuid4().hex}"
+                if not self.redis.set(self._lease_key(key), token, nx=True, px=self._lease_ms()):
+                    continue  # being trained elsewhere; it stays queued for afterwards
+
+                pipe = self.redis.pipeline(transaction=True)
+                pipe.zrem(self.pending_key, key)
+                pipe.zadd(self.active_key, {key: now + self.lease_seconds})
+                pipe.hincrby(self._job_key(key), 'attempts', 1)
+                pipe.hgetall(self._job_key(key))
+                pipe.hget(self.actions_key, key)
+                pipe.hdel(self.actions_key, key)
+                removed, _, attempts, fields, queued_action, _ = pipe.execute()
+                job = {
+                    'key': key,
+                    'user_id': int(fields['user_id']) if fields.get('user_id') else None,
+                    # Jobs queued before the actions hash existed keep theirs in the job hash
+                    'action': queued_action or fields.get('action') or 'update',
+                    'attempts': attempts,
+                    'token': token,
+                }
+                if removed:
+                    # Kept with the job for retries and for requeueing after a lost lease
+                    self.redis.hset(self._job_key(key), 'action', job['action'])
+                    return job
+                # Another worker claimed and finished it between the scan and the lease
+                self._release(job, lambda pipe: (
+                    pipe.zrem(self.active_key, key), pipe.hincrby(self._job_key(key), 'attempts', -1)
+                ))
+        return None
+
+    def heartbeat(self, job: Dict[str, Any]) -> bool:
+        """Renew a job's lease; False when it is no longer held by this job"""
+        return self._release(job, lambda pipe: (
+            pipe.pexpire(self._lease_key(job['key']), self._lease_ms()),
+            pipe.zadd(self.active_key, {job['key']: time.time() + self.lease_seconds}, xx=True),
+        ), keep_lease=True)
+
+    def complete(self, job: Dict[str, Any], result: Optional[Dict] = None) -> bool:
+        """Finish a job and release its lease; False when the lease had already been lost"""
+        ok = self._release(job, lambda pipe: (
+            pipe.zrem(self.active_key, job['key']),
+            pipe.hset(self._job_key(job['key']), mapping={
+                'attempts': 0, 'finished_at': time.time(), 'error': '',
+                'result': json.dumps(result or {}, default=float),
+            }),
+        ))
+        self._jobs_counter.inc(outcome='completed' if ok else 'lost')
+        return ok
+
+    def fail(self, job: Dict[str, Any], error: str) -> bool:
+        """Release a job that raised, retrying it after a backoff until max_attempts"""
+        retry = job['attempts'] < self.max_attempts
+        due = time.time() + self.retry_delay * 2 ** (job['attempts'] - 1)
+
+        ok = self._release(job, lambda pipe: (
+            pipe.zrem(self.active_key, job['key']),
+            pipe.hset(self._job_key(job['key']), 'error', error),
+            self._requeue(pipe, job['key'], job['action'], due) if retry else self._give_up(pipe, job['key']),
+        ))
+        self._jobs_counter.inc(outcome=('retried' if retry else 'failed') if ok else 'lost')
+        return ok
+
+    def requeue_expired(self) -> int:
+        """Put back jobs whose worker stopped heartbeating; returns how many were requeued or failed"""
+        requeued = 0
+        try:
+            expired = self.redis.zrangebyscore(self.active_key, '-inf', time.time())
+        except Exception as e:
+            self.logger.error(f"Error scanning training leases: {e}")
+            return 0
+
+        for key in expired:
+            lease_key = self._lease_key(key)
+            try:
+                with self.redis.pipeline() as pipe:
+                    pipe.watch(lease_key)
+                    if pipe.exists(lease_key) or pipe.zscore(self.active_key, key) is None:
+                        continue  # a heartbeat is late but the lease is valid, or the job just finished
+                    fields = pipe.hgetall(self._job_key(key))
+                    attempts = int(fields.get('attempts') or 0)
+                    pipe.multi()
+                    pipe.zrem(self.active_key, key)
+                    pipe.hset(self._job_key(key), 'error', 'worker lease expired')
+                    if attempts < self.max_attempts:
+                        self._requeue(pipe, key, fields.get('action') or 'update', time.time())
+                    else:
+                        self._give_up(pipe, key)
+                    removed = pipe.execute()[0]
+            except redis.WatchError:
+                continue
+            except Exception as e:
+                self.logger.error(f"Error requeueing training job {key}: {e}")
+                continue
+
+            if removed:
+                requeued += 1
+                self.logger.warning(f"Training job {key} lost its worker (attempt {attempts}), requeued")
+                self._jobs_counter.inc(outcome='requeued' if attempts < self.max_attempts else 'failed')
+        return requeued
+
+    @contextmanager
+    def keep_alive(self, job: Dict[str, Any]) -> Iterator[threading.Event]:
+        """Heartbeat a job's lease from a background thread; the yielded event is set if the lease is lost"""
+        stopped, lost = threading.Event(), threading.Event()
+
+        def beat():
+            while not stopped.wait(self.lease_seconds / 3):
+                try:
+                    if not self.heartbeat(job):
+                        lost.set()
+                        self.logger.error(f"Lost the lease on training job {job['key']}")
+                        return
+                except Exception as e:
+                    self.logger.error(f"Error renewing the lease on training job {job['key']}: {e}")
+
+        thread = threading.Thread(target=beat, name=f"heartbeat-{job['key']}", daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stopped.set()
+            thread.join()
+
+    @contextmanager
+    def exclusive(self, user_id: Optional[int], owner: Optional[str] = None) -> Iterator[Optional[threading.Event]]:
+        """Hold a user's lease outside the queue (a direct train run)
+
+        Yields the keep_alive event that is set if the lease is lost, or None
+        when someone else holds it.
+        """
+        key = self.job_key(user_id)
+        job = {'key': key, 'token': f"{owner or worker_name()}:{uuid.uuid4().hex}"}
+        if not self.redis.set(self._lease_key(key), job['token'], nx=True, px=self._lease_ms()):
+            yield None
+            return
+        try:
+            with self.keep_alive(job) as lost:
+                yield lost
+        finally:
+            self._release(job, lambda pipe: None)
+
+    def stats(self) -> Dict[str, int]:
+        pipe = self.redis.pipeline(transaction=False)
+        for key in (self.pending_key, self.active_key, self.failed_key):
+            pipe.zcard(key)
+        pending, active, failed = pipe.execute()
+        return {'pending': pending, 'active': active, 'failed': failed}
+
+    def _release(self, job: Dict[str, Any], commands: Callable, keep_lease: bool = False) -> bool:
+        """Run commands in a transaction if this job still holds its lease, deleting the lease unless kept"""
+        lease_key = self._lease_key(job['key'])
+        try:
+            with self.redis.pipeline() as pipe:
+                pipe.watch(lease_key)
+                if pipe.get(lease_key) != job['token']:
+                    return False
+                pipe.multi()
+                commands(pipe)
+                if not keep_lease:
+                    pipe.delete(lease_key)
+                pipe.execute()
+                return True
+        except redis.WatchError:
+            return False
+
+    def _queue_action(self, pipe, key: str, action: str):
+        """Record a waiting job's action; a queued 'train' is never turned into an 'update'"""
+        if action == 'train':
+            pipe.hset(self.actions_key, key, action)
+        else:
+            pipe.hsetnx(self.actions_key, key, action)
+
+    def _requeue(self, pipe, key: str, action: str, due: float):
+        """Put a job back in the queue with the action it was claimed with"""
+        self._queue_action(pipe, key, action)
+        pipe.zadd(self.pending_key, {key: due}, nx=True)
+
+    def _give_up(self, pipe, key: str):
+        """Mark a job failed; enqueueing the user again starts over with fresh attempts"""
+        pipe.zadd(self.failed_key, {key: time.time()})
+        pipe.hset(self._job_key(key), 'attempts', 0)
+
+    def _lease_ms(self) -> int:
+        return int(self.lease_seconds * 1000)
+
+    def _lease_key(self, key: str) -> str:
+        return f"{self.PREFIX}:lease:{key}"
+
+    def _job_key(self, key: str) -> str:
+        return f"{self.PREFIX}:job:{key}"
+
+
+class TrainingWorker:
+    """Loop claiming and running training jobs until stopped
+
+    train(user_id, action, lost) does the work, where lost is the event set
+    when the job's lease lapses; it must raise LeaseLost rather than save a
+    model once that happens. The model it saves goes through the model
+    registry, so with model_dir on shared storage every node serves it as
+    soon as its manifest changes. Workers share nothing but Redis and the
+    model directory, so adding nodes adds throughput.
+    """
+
+    def __init__(self, queue: TrainingQueue, train: Callable[[Optional[int], str, threading.Event], Any],
+                 poll_interval: float = 5,
+                 worker_id: Optional[str] = None, logger: Optional[logging.Logger] = None):
+        self.queue = queue
+        self.train = train
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or worker_name()
+        self.logger = logger or logging.getLogger('EmailPredictor')
+        self._job_seconds = queue.metrics.histogram(
+            'training_job_seconds', 'Time to run one queued training job', ('status',)
+        )
+        self._stopped = threading.Event()
+
+    def run(self, max_jobs: Optional[int] = None, stop_when_idle: bool = False) -> int:
+        """Process jobs; returns how many ran"""
+        processed = 0
+        next_reap = 0.0
+        while not self._stopped.is_set() and (max_jobs is None or processed < max_jobs):
+            try:
+                if time.monotonic() >= next_reap:
+                    self.queue.requeue_expired()
+                    next_reap = time.monotonic() + self.queue.lease_seconds / 2
+                job = self.queue.claim(self.worker_id)
+            except Exception as e:
+                self.logger.error(f"Error claiming a training job: {e}")
+                job = None
+
+            if job is None:
+                if stop_when_idle:
+                    break
+                self._stopped.wait(self.poll_interval)
+                continue
+
+            self.run_job(job)
+            processed += 1
+        return processed
+
+    def run_job(self, job: Dict[str, Any]):
+        self.logger.info(f"Worker {self.worker_id} training {job['key']} ({job['action']}, attempt {job['attempts']})")
+        started = time.monotonic()
+        status = 'ok'
+        try:
+            with self.queue.keep_alive(job) as lost:
+                result = self.train(job['user_id'], job['action'], lost)
+        except LeaseLost as e:
+            # The job is someone else's now; neither complete nor fail it
+            status = 'lost'
+            self.logger.error(f"Abandoned training job {job['key']}: {e}")
+        except Exception as e:
+            status = 'error'
+            self.logger.error(f"Error training {job['key']}: {e}")
+            self.queue.fail(job, str(e))
+        else:
+            if not self.queue.complete(job, result):
+                status = 'lost'
+                self.logger.error(f"Training job {job['key']} finished after its lease was lost")
+        self._job_seconds.observe(time.monotonic() - started, status=status)
+
+    def stop(self):
+        """Finish the current job, then return from run()"""
+        self._stopped.set()
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
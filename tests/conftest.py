@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Unit Test Fixtures
+A small seeded email corpus and a database connection stand-in that answers
+the sender-frequency query, enough to build an EmailPredictor for feature
+tests without MySQL or Redis.
+"""
+
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml'))
+
+WORDS = (
+    "meeting report invoice please review attached schedule project update team urgent asap "
+    "deadline important critical free win winner prize money cash great excellent bad terrible "
+    "thanks regards tomorrow http://example.com $ price dollar 555-123-4567 agenda budget client ops@example.org"
+).split()
+SENDERS = ['alice@example.com', 'Bob <bob@partner.example>', 'newsletter@shop.example',
+           'promo12345678901@deals.example']
+
+
+def generate_emails(count: int, seed: int = 7):
+    """Reproducible emails with varied subjects, bodies, senders and timestamps"""
+    rnd = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    emails = []
+    for i in range(count):
+        subject = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 10)))
+        if rnd.random() < 0.2:
+            subject = subject.upper() + '!!!'
+        body = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 200)))
+        emails.append({
+            'id': i + 1,
+            'subject': subject,
+            'body': body + rnd.choice(['.', '!', '?', '', ' Thanks. Bye!!!!']),
+            'sender': rnd.choice(SENDERS),
+            'recipients': ['me@example.com'] * rnd.randint(0, 3),
+            'attachments': ['file.pdf'] * rnd.randint(0, 2),
+            'received_at': now - timedelta(seconds=rnd.randint(0, 20 * 86400)),
+        })
+    return emails
+
+
+class SenderCountDatabase:
+    """Connection stand-in answering only the sender index's per-day counts query"""
+
+    def __init__(self, emails):
+        self.emails = emails
+
+    def cursor(self, dictionary: bool = False, **kwargs):
+        return SenderCountCursor(self)
+
+    def is_connected(self) -> bool:
+        return True
+
+    def ping(self, **kwargs):
+        pass
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def rows(self, query: str, params):
+        if 'GROUP BY sender, DATE(received_at)' not in query:
+            raise ValueError(f"Unsupported query in test database: {' '.join(query.split())[:80]}")
+        params = list(params)
+        watermark = params.pop(0) if 'id > %s' in query else 0
+        since = datetime.now() - timedelta(days=params[0])
+        groups = {}
+        for email in self.emails:
+            if email['id'] > watermark and email['received_at'] >= since:
+                key = (email['sender'], email['received_at'].date())
+                count, max_id = groups.get(key, (0, 0))
+                groups[key] = (count + 1, max(max_id, email['id']))
+        return [(sender, day, count, max_id) for (sender, day), (count, max_id) in groups.items()]
+
+
+class SenderCountCursor:
+    def __init__(self, db: SenderCountDatabase):
+        self.db = db
+        self.result = []
+
+    def execute(self, query, params=()):
+        self.result = self.db.rows(query, params)
+
+    def fetchall(self):
+        result, self.result = self.result, []
+        return result
+
+    def fetchone(self):
+        return self.result.pop(0) if self.result else None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope='session')
+def emails():
+    return generate_emails(300)
+
+
+@pytest.fixture
+def make_predictor(tmp_path, emails):
+    """Build an EmailPredictor on the test corpus, without Redis, from config overrides"""
+    from email_predictor import EmailPredictor
+
+    def make(**overrides):
+        config = dict({'model_dir': str(tmp_path), 'redis_enabled': False}, **overrides)
+        config_path = tmp_path / 'config.json'
+        config_path.write_text(json.dumps(config))
+        return EmailPredictor(str(config_path), db=SenderCountDatabase(emails))
+
+    return make
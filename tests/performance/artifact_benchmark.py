@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Model Artifact Benchmark
+Trains each model once, saves it as a single joblib file (the previous format)
+and as an artifact directory (exact, then compacted), and reports size on
+disk, cold-load time to the first prediction in a fresh registry, and
+held-out accuracy of what is served.
+
+Usage: python tests/performance/artifact_benchmark.py [--emails 5000] [--models random_forest gradient_boosting]
+                                                      [--loads 20]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'ml'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmark_support import InMemoryDatabase, InMemoryRedis, generate_emails, write_config  # noqa: E402
+from email_predictor import EmailPredictor  # noqa: E402
+
+VARIANTS = {
+    # No depth caps or quantization, saved as one joblib file
+    'joblib': {'model_artifacts': False, 'artifact_depth_caps': [], 'artifact_quantize': False},
+    'artifact_exact': {'model_artifacts': True, 'artifact_depth_caps': [], 'artifact_quantize': False},
+    'artifact_compacted': {'model_artifacts': True},
+}
+
+
+def cold_load(config_path: str, emails, loads: int):
+    """Median time for a new predictor to load the model and answer one email"""
+    seconds = []
+    for _ in range(loads):
+        predictor = EmailPredictor(config_path, db=InMemoryDatabase(emails), redis_client=InMemoryRedis())
+        start = time.perf_counter()
+        predictor.predict_email_action(emails[0])
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+def run(model_name: str, emails, holdout, loads: int):
+    results = {}
+    for variant, settings in VARIANTS.items():
+        with tempfile.TemporaryDirectory() as model_dir:
+            config_path = write_config(model_dir, min_training_samples=100, training_workers=1,
+                                       candidate_models=[model_name], analysis_cache_enabled=False,
+                                       feature_store_enabled=False, **settings)
+            trainer = EmailPredictor(config_path, db=InMemoryDatabase(emails), redis_client=InMemoryRedis())
+            scores = trainer.train_models()
+            entry = trainer.model_registry.entries()['global']
+
+            served = EmailPredictor(config_path, db=InMemoryDatabase(emails), redis_client=InMemoryRedis())
+            predictions = served.predict_email_actions(holdout)
+            correct = sum(result['predicted_action'] == email['action_taken']
+                          for result, email in zip(predictions, holdout))
+            compiled = served._load_model('global')['compiled']
+            results[variant] = {
+                'bytes': entry['size'],
+                'cold_load_ms': round(cold_load(config_path, emails, loads) * 1000, 2),
+                'test_accuracy': round(scores[model_name], 4),
+                'served_test_accuracy': round(compiled['accuracy'] if compiled else scores[model_name], 4),
+                'holdout_accuracy': round(correct / len(holdout), 4),
+                'compaction': compiled.get('compaction') if compiled else None,
+            }
+
+    baseline = results['joblib']
+    for variant in results.values():
+        variant['size_ratio'] = round(variant['bytes'] / baseline['bytes'], 3)
+        variant['load_speedup'] = round(baseline['cold_load_ms'] / variant['cold_load_ms'], 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Model artifact size and load-time benchmark')
+    parser.add_argument('--emails', type=int, default=5000, help='Training emails')
+    parser.add_argument('--models', nargs='+', default=['random_forest', 'gradient_boosting'])
+    parser.add_argument('--loads', type=int, default=20, help='Cold loads timed per variant')
+    args = parser.parse_args()
+
+    emails = generate_emails(args.emails)
+    holdout = generate_emails(2000, seed=11)
+    print(json.dumps({
+        'emails': args.emails,
+        'models': {name: run(name, emails, holdout, args.loads) for name in args.models},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
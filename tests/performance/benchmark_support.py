@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Benchmark Support
+Seeded synthetic email corpus and in-process stand-ins for MySQL and Redis,
+so the predictor can be benchmarked without any services running.
+"""
+
+import fnmatch
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+VOCABULARY = (
+    "the meeting report invoice please review attached schedule project update team "
+    "urgent asap deadline important priority critical free win winner prize money cash "
+    "great excellent bad terrible window credit loan thanks regards tomorrow friday "
+    "http://example.com https://rotz.example/offer $ price dollar 555-123-4567"
+).split()
+FILLER = (
+    "we you our this that with for from about next week call notes draft budget client "
+    "order shipping account password reset agenda minutes quarter results follow up"
+).split()
+URGENT_WORDS = ['urgent', 'asap', 'deadline', 'important', 'priority', 'critical']
+SPAM_WORDS = ['free', 'win', 'winner', 'prize', 'money', 'cash', 'credit', 'loan']
+
+PEOPLE = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi', 'ivan', 'judy']
+DOMAINS = ['example.com', 'partner.example', 'client.example', 'mail.example']
+BULK_SENDERS = ['newsletter@shop.example', 'digest@news.example', 'noreply@service.example']
+SPAM_SENDERS = ['promo12345678901@deals.example', 'winner@lottery.example', 'offers@cheap.example']
+
+ACTIONS = ['read', 'archived', 'deleted', 'priority', 'normal']
+
+
+def generate_emails(count: int, seed: int = 42, users: int = 4, days: int = 60):
+    """Generate a reproducible corpus with realistic shapes and action labels
+
+    Body lengths are log-normal (most emails short, a long tail of long
+    ones), senders follow a skewed distribution over people, newsletters and
+    spammers, and each email carries the action label the training query
+    would derive from its flags, driven by its content plus some noise.
+    """
+    rnd = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    people = [f"{name}@{domain}" for domain in DOMAINS for name in PEOPLE]
+    senders = people + BULK_SENDERS + SPAM_SENDERS
+    # Zipf-like weights: a few correspondents send most of the mail
+    weights = [1.0 / (rank + 1) for rank in range(len(people))] + [0.6] * len(BULK_SENDERS) + [0.3] * len(SPAM_SENDERS)
+
+    emails = []
+    for i in range(count):
+        sender = rnd.choices(senders, weights)[0]
+        spammer = sender in SPAM_SENDERS
+        bulk = sender in BULK_SENDERS
+
+        subject_words = rnd.randint(2, 12)
+        subject = ' '.join(rnd.choice(VOCABULARY if rnd.random() < 0.4 else FILLER) for _ in range(subject_words))
+        if spammer and rnd.random() < 0.3:
+            subject = subject.upper() + '!!!'
+
+        body_words = min(int(rnd.lognormvariate(math.log(80), 1.0)), 3000)
+        vocabulary_share = 0.6 if spammer else 0.2
+        body = ' '.join(
+            rnd.choice(VOCABULARY if rnd.random() < vocabulary_share else FILLER) for _ in range(body_words)
+        )
+        body += rnd.choice(['.', '!', '?', '', ' Thanks. Bye!'])
+
+        text = f"{subject} {body}".lower()
+        if spammer or sum(text.count(word) for word in SPAM_WORDS) > 6:
+            action = 'deleted'
+        elif any(word in subject.lower() for word in URGENT_WORDS):
+            action = 'priority'
+        elif bulk:
+            action = 'archived'
+        elif body_words > 120:
+            action = 'read'
+        else:
+            action = 'normal'
+        if rnd.random() < 0.15:
+            action = rnd.choice(ACTIONS)
+
+        user_id = rnd.randint(1, users)
+        emails.append({
+            'id': i + 1,
+            'email_account_id': user_id,
+            'user_id': user_id,
+            'subject': subject,
+            'body': body,
+            'sender': sender,
+            'recipients': ['me@example.com'] + [rnd.choice(people) for _ in range(min(int(rnd.expovariate(1.2)), 8))],
+            'attachments': ['file.pdf'] * (0 if rnd.random() < 0.7 else rnd.randint(1, 3)),
+            'received_at': now - timedelta(seconds=rnd.randint(0, days * 86400)),
+            'action_taken': action,
+        })
+    return emails
+
+
+class InMemoryDatabase:
+    """Stand-in for a MySQL connection that answers the predictor's queries from a list of emails
+
+    Queries are recognized by their shape; anything unrecognized raises so a
+    benchmark never silently measures an empty result. latency adds a
+    simulated network round trip (seconds) to every query.
+    """
+
+    def __init__(self, emails, latency: float = 0.0):
+        self.emails = list(emails)
+        self.latency = latency
+        self.ml_models = {}
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def add_emails(self, emails):
+        """Append emails as if they had just arrived"""
+        with self._lock:
+            self.emails.extend(emails)
+
+    def cursor(self, dictionary: bool = False, **kwargs):
+        return InMemoryCursor(self, dictionary)
+
+    def is_connected(self) -> bool:
+        return True
+
+    def ping(self, **kwargs):
+        pass
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def query(self, query: str, params, dictionary: bool):
+        """Rows for one statement, as the MySQL connector would return them"""
+        with self._lock:
+            self.queries += 1
+            emails = self.emails
+        if self.latency:
+            time.sleep(self.latency)
+        query = ' '.join(query.split())
+        params = list(params or ())
+        now = datetime.now()
+
+        if 'GROUP BY sender, DATE(received_at)' in query:
+            watermark = params.pop(0) if 'id > %s' in query else 0
+            since = now - timedelta(days=params[0])
+            groups = {}
+            for email in emails:
+                if email['id'] > watermark and email['received_at'] >= since:
+                    key = (email['sender'], email['received_at'].date())
+                    count, max_id = groups.get(key, (0, 0))
+                    groups[key] = (count + 1, max(max_id, email['id']))
+            return [(sender, day, count, max_id) for (sender, day), (count, max_id) in groups.items()]
+
+        if 'action_taken' in query:
+            since = now - timedelta(days=params.pop(0))
+            rows = [email for email in emails if email['received_at'] >= since]
+            if 'AND u.id = %s' in query:
+                user_id = params.pop(0)
+                rows = [email for email in rows if email['user_id'] == user_id]
+            if 'AND e.id > %s' in query:
+                since_id = params.pop(0)
+                rows = [email for email in rows if email['id'] > since_id]
+            if 'LIMIT %s' in query:
+                rows = sorted(rows, key=lambda email: email['received_at'], reverse=True)[:params.pop(0)]
+            columns = re.findall(r'\be\.(\w+),', query.split('CASE')[0])
+            return [dict({column: email[column] for column in columns}, action_taken=email['action_taken'])
+                    for email in rows]
+
+        if query.startswith('SELECT * FROM emails WHERE id'):
+            wanted = set(params)
+            return self._rows([email for email in emails if email['id'] in wanted], dictionary)
+
+        if 'GROUP BY ea.user_id, m.trained_at' in query:
+            # Retrain plan: per-user and global watermarks joined to new-email counts
+            lookback = now - timedelta(days=params[0])
+            since = now - timedelta(days=params[2])
+            with self._lock:
+                models = {user_id: model['trained_at'] for user_id, model in self.ml_models.items()}
+            global_trained_at = models.get(None)
+            wanted = set(params[3:]) if 'AND ea.user_id IN' in query else None
+            groups = {}
+            for email in emails:
+                if email['received_at'] >= since and (wanted is None or email['user_id'] in wanted):
+                    trained_at = models.get(email['user_id'])
+                    new, global_new = groups.get(email['user_id'], (0, 0))
+                    groups[email['user_id']] = (
+                        new + (email['received_at'] > (trained_at or lookback)),
+                        global_new + (email['received_at'] > (global_trained_at or lookback)),
+                    )
+            return [(user_id, models.get(user_id), global_trained_at, new, global_new)
+                    for user_id, (new, global_new) in groups.items()]
+
+        if 'GROUP BY ea.user_id' in query:
+            since = now - timedelta(days=params[0])
+            counts = {}
+            for email in emails:
+                if email['received_at'] >= since:
+                    counts[email['user_id']] = counts.get(email['user_id'], 0) + 1
+            ranked = sorted(counts.items(), key=lambda item: -item[1])
+            return ranked[:params[1]] if len(params) > 1 else ranked
+
+        if query.startswith('SELECT COUNT(*) FROM emails WHERE user_id'):
+            user_id, since = params
+            return [(sum(1 for email in emails if email['user_id'] == user_id and email['received_at'] > since),)]
+
+        if query.startswith('INSERT INTO ml_models'):
+            user_id, model_type, accuracy, scores = params
+            with self._lock:
+                self.ml_models[user_id] = {
+                    'model_type': model_type, 'accuracy': accuracy, 'scores': scores, 'trained_at': now,
+                }
+            return []
+
+        if query.startswith('UPDATE ml_models SET trained_at'):
+            with self._lock:
+                if params[0] in self.ml_models:
+                    self.ml_models[params[0]]['trained_at'] = now
+            return []
+
+        if 'FROM ml_models' in query:
+            model = self.ml_models.get(params[0])
+            if model is None:
+                return []
+            if query.startswith('SELECT trained_at'):
+                return [(model['trained_at'],)]
+            return self._rows([model], dictionary)
+
+        raise ValueError(f"Unsupported query in benchmark database: {query[:80]}")
+
+    @staticmethod
+    def _rows(rows, dictionary: bool):
+        return [dict(row) for row in rows] if dictionary else [tuple(row.values()) for row in rows]
+
+
+class InMemoryCursor:
+    def __init__(self, db: InMemoryDatabase, dictionary: bool):
+        self.db = db
+        self.dictionary = dictionary
+        self.rows = []
+
+    def execute(self, query, params=()):
+        self.rows = self.db.query(query, params, self.dictionary)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size: int = 1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class InMemoryRedis:
+    """Stand-in for a decode_responses Redis client covering the commands the predictor uses
+
+    latency adds a simulated round trip (seconds) to reads and to pipeline
+    executions, outside the lock as concurrent clients would see it. Keys
+    given a TTL with px or pexpire expire; ex and expire are accepted but
+    ignored. Sorted sets are dicts of member to score.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.data = {}
+        self.commands = 0
+        self.latency = latency
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _expire_stale(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            del self._expires[key]
+
+    def ping(self):
+        return True
+
+    def get(self, key):
+        self._round_trip()
+        with self._lock:
+            self.commands += 1
+            self._expire_stale(key)
+            return self.data.get(key)
+
+    def exists(self, *keys):
+        with self._lock:
+            self.commands += 1
+            for key in keys:
+                self._expire_stale(key)
+            return sum(key in self.data for key in keys)
+
+    def mget(self, keys):
+        self._round_trip()
+        with self._lock:
+            self.commands += 1
+            return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        with self._lock:
+            self.commands += 1
+            self._expire_stale(key)
+            if nx and key in self.data:
+                return None
+            self.data[key] = value if isinstance(value, str) else json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+            self._expires.pop(key, None)
+            if px is not None:
+                self._expires[key] = time.monotonic() + px / 1000
+            return True
+
+    def pexpire(self, key, milliseconds):
+        with self._lock:
+            self.commands += 1
+            self._expire_stale(key)
+            if key not in self.data:
+                return False
+            self._expires[key] = time.monotonic() + milliseconds / 1000
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            self.commands += 1
+            for key in keys:
+                self._expires.pop(key, None)
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self.commands += 1
+            value = int(self.data.get(key, 0)) + amount
+            self.data[key] = str(value)
+            return value
+
+    def expire(self, key, seconds):
+        self.commands += 1
+        return key in self.data
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            self.commands += 1
+            bucket = self.data.setdefault(key, {})
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            bucket.update({name: str(item) for name, item in items.items()})
+            return len(items)
+
+    def hsetnx(self, key, field, value):
+        with self._lock:
+            self.commands += 1
+            bucket = self.data.setdefault(key, {})
+            if field in bucket:
+                return 0
+            bucket[field] = str(value)
+            return 1
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            self.commands += 1
+            bucket = self.data.get(key, {})
+            return sum(bucket.pop(field, None) is not None for field in fields)
+
+    def hget(self, key, field):
+        with self._lock:
+            self.commands += 1
+            return self.data.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        with self._lock:
+            self.commands += 1
+            return dict(self.data.get(key, {}))
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            self.commands += 1
+            bucket = self.data.setdefault(key, {})
+            bucket[field] = str(int(bucket.get(field, 0)) + amount)
+            return int(bucket[field])
+
+    def zadd(self, key, mapping, nx=False, xx=False):
+        with self._lock:
+            self.commands += 1
+            zset = self.data.setdefault(key, {})
+            added = 0
+            for member, score in mapping.items():
+                if (nx and member in zset) or (xx and member not in zset):
+                    continue
+                added += member not in zset
+                zset[member] = float(score)
+            return added
+
+    def zrem(self, key, *members):
+        with self._lock:
+            self.commands += 1
+            zset = self.data.get(key, {})
+            return sum(zset.pop(member, None) is not None for member in members)
+
+    def zscore(self, key, member):
+        with self._lock:
+            self.commands += 1
+            return self.data.get(key, {}).get(member)
+
+    def zcard(self, key):
+        with self._lock:
+            self.commands += 1
+            return len(self.data.get(key, {}))
+
+    def zrangebyscore(self, key, min, max, start=None, num=None):
+        self._round_trip()
+        with self._lock:
+            self.commands += 1
+            low, high = float(min), float(max)
+            members = sorted(
+                (score, member) for member, score in self.data.get(key, {}).items() if low <= score <= high
+            )
+            members = [member for _, member in members]
+            if start is not None:
+                members = members[start:start + num] if num is not None else members[start:]
+            return members
+
+    def keys(self, pattern='*'):
+        with self._lock:
+            return [key for key in self.data if fnmatch.fnmatchcase(key, pattern)]
+
+    def pipeline(self, transaction: bool = True):
+        return InMemoryPipeline(self)
+
+
+class InMemoryPipeline:
+    """Queues commands until execute(); watch() makes reads immediate as in redis-py"""
+
+    def __init__(self, client: InMemoryRedis):
+        self.client = client
+        self.queued = []
+        self.immediate = False
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def call(*args, **kwargs):
+            if self.immediate:
+                return command(*args, **kwargs)
+            self.queued.append((command, args, kwargs))
+            return self
+        return call
+
+    def watch(self, *keys):
+        self.immediate = True
+
+    def multi(self):
+        self.immediate = False
+
+    def execute(self):
+        self.client._round_trip()
+        with self.client._lock:
+            results = [command(*args, **kwargs) for command, args, kwargs in self.queued]
+        self.queued = []
+        return results
+
+    def reset(self):
+        self.queued = []
+        self.immediate = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.reset()
+
+
+class AsyncInMemoryRedis:
+    """redis.asyncio-style view of an InMemoryRedis, awaiting its latency instead of blocking"""
+
+    def __init__(self, client: InMemoryRedis):
+        self.client = client
+
+    async def mget(self, keys):
+        import asyncio
+
+        if self.client.latency:
+            await asyncio.sleep(self.client.latency)
+        with self.client._lock:
+            self.client.commands += 1
+            return [self.client.data.get(key) for key in keys]
+
+    async def aclose(self):
+        pass
+
+
+def write_config(directory: str, name: str = 'config.json', **overrides) -> str:
+    """Write a predictor config rooted in directory and return its path"""
+    config = {'model_dir': directory}
+    config.update(overrides)
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        json.dump(config, f)
+    return path
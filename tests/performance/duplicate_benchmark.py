@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Near-Duplicate Benchmark
+Predicts a stream mixing bulk-mail copies with unique emails, with and without
+the duplicate index, and reports throughput, hit rate and how often a reused
+prediction differs from the one computed in full (the accuracy impact).
+
+Usage: python tests/performance/duplicate_benchmark.py [--emails 5000] [--bulk-share 0.6] [--templates 40]
+                                                       [--batch-size 256] [--max-distance 3]
+                                                       [--models random_forest] [--text-features] [--uncompiled]
+
+Only text-feature models, and uncompiled models predicting single emails, use
+the duplicate index (see _reuses_duplicates); otherwise both runs take the
+same path.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'ml'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmark_support import (  # noqa: E402
+    BULK_SENDERS, PEOPLE, InMemoryDatabase, InMemoryRedis, generate_emails, write_config
+)
+from email_predictor import EmailPredictor  # noqa: E402
+
+
+def bulk_stream(count: int, bulk_share: float, templates: int, seed: int = 7):
+    """Unique emails mixed with personalized copies of a few newsletter templates"""
+    rnd = random.Random(seed)
+    unique = generate_emails(count, seed=seed + 1)
+    bases = [dict(email, sender=rnd.choice(BULK_SENDERS)) for email in generate_emails(templates, seed=seed + 2)]
+
+    stream = []
+    for i, email in enumerate(unique):
+        if rnd.random() < bulk_share:
+            base = rnd.choice(bases)
+            # Copies differ in the greeting and order number, as mail merges do
+            email = dict(
+                base,
+                id=email['id'],
+                subject=f"{base['subject']} #{rnd.randint(10000, 99999)}",
+                body=f"Hi {rnd.choice(PEOPLE)}, {base['body']} Order {rnd.randint(100000, 999999)}.",
+                received_at=email['received_at'],
+            )
+        stream.append(email)
+    return stream
+
+
+def make_predictor(emails, model_dir: str, redis_client, **overrides) -> EmailPredictor:
+    config_path = write_config(model_dir, min_training_samples=100, training_workers=1, **overrides)
+    return EmailPredictor(config_path, db=InMemoryDatabase(emails), redis_client=redis_client)
+
+
+def predict(predictor, stream, batch_size: int):
+    # Load the model and warm its code paths on unrelated emails before timing
+    predictor.predict_email_actions(generate_emails(50, seed=99))
+    start = time.perf_counter()
+    if batch_size > 1:
+        results = []
+        for offset in range(0, len(stream), batch_size):
+            results.extend(predictor.predict_email_actions(stream[offset:offset + batch_size]))
+    else:
+        results = [predictor.predict_email_action(email) for email in stream]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Near-duplicate prediction reuse benchmark')
+    parser.add_argument('--emails', type=int, default=5000, help='Emails in the predicted stream')
+    parser.add_argument('--bulk-share', type=float, default=0.6, help='Share of the stream that is bulk-mail copies')
+    parser.add_argument('--templates', type=int, default=40, help='Distinct bulk mails')
+    parser.add_argument('--batch-size', type=int, default=256, help='1 predicts one email at a time')
+    parser.add_argument('--max-distance', type=int, default=3)
+    parser.add_argument('--models', nargs='+', default=['random_forest'], help='Candidate models to train')
+    parser.add_argument('--text-features', action='store_true', help='Train with hashed subject/body features')
+    parser.add_argument('--uncompiled', action='store_true', help='Serve the sklearn estimators, not compiled models')
+    args = parser.parse_args()
+
+    training = generate_emails(3000)
+    stream = bulk_stream(args.emails, args.bulk_share, args.templates)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        # Feature caches off in both runs, so the difference is the reuse alone
+        settings = {'analysis_cache_enabled': False, 'feature_store_enabled': False,
+                    'candidate_models': args.models, 'text_features': args.text_features,
+                    'text_feature_models': args.models, 'compiled_inference': not args.uncompiled}
+        make_predictor(training, model_dir, InMemoryRedis(), **settings).train_models()
+
+        baseline, baseline_seconds = predict(
+            make_predictor(training, model_dir, InMemoryRedis(), **settings), stream, args.batch_size
+        )
+        deduplicated = make_predictor(training, model_dir, InMemoryRedis(), duplicate_detection=True,
+                                      duplicate_max_distance=args.max_distance, **settings)
+        results, seconds = predict(deduplicated, stream, args.batch_size)
+
+        reused = [i for i, result in enumerate(results) if result.get('near_duplicate')]
+        changed = sum(results[i]['predicted_action'] != baseline[i]['predicted_action'] for i in reused)
+        correct = sum(result['predicted_action'] == email['action_taken'] for result, email in zip(results, stream))
+        baseline_correct = sum(
+            result['predicted_action'] == email['action_taken'] for result, email in zip(baseline, stream)
+        )
+        print(json.dumps({
+            'emails': len(stream),
+            'batch_size': args.batch_size,
+            'baseline_emails_per_second': round(len(stream) / baseline_seconds),
+            'emails_per_second': round(len(stream) / seconds),
+            'speedup': round(baseline_seconds / seconds, 2),
+            'hit_rate': round(len(reused) / len(stream), 4),
+            'reused_predictions_changed': round(changed / len(reused), 4) if reused else 0.0,
+            'label_accuracy': round(correct / len(stream), 4),
+            'baseline_label_accuracy': round(baseline_correct / len(stream), 4),
+            'index': deduplicated.get_cache_stats()['duplicates'],
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
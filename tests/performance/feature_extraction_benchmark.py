@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Feature Extraction Benchmark
+Checks that extract_features_batch matches the scalar extract_features path
+value for value, and measures the speedup on synthetic corpora.
+
+Usage: python tests/performance/feature_extraction_benchmark.py [--sizes 10000 100000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'ml'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import email_predictor  # noqa: E402
+from benchmark_support import InMemoryDatabase, generate_emails, write_config  # noqa: E402
+from email_predictor import EmailPredictor  # noqa: E402
+
+def make_predictor(emails, model_dir):
+    # The analysis cache would let the batch pass reuse the scalar pass results
+    config_path = write_config(model_dir, redis_enabled=False, analysis_cache_enabled=False)
+    return EmailPredictor(config_path, db=InMemoryDatabase(emails))
+
+
+def run(size: int, model_dir: str, parity_rows: int):
+    emails = generate_emails(size)
+    predictor = make_predictor(emails, model_dir)
+    columns = predictor._training_columns()
+
+    start = time.perf_counter()
+    scalar = np.array(
+        [[features[name] for name in columns]
+         for features in map(predictor.extract_features, emails)],
+        dtype=np.float64
+    )
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = predictor.extract_features_batch(emails)
+    batch_seconds = time.perf_counter() - start
+
+    mismatches = np.argwhere(scalar[:parity_rows] != batch[:parity_rows])
+    for row, column in mismatches[:10]:
+        print(f"  mismatch row {row} {columns[column]}: scalar={scalar[row, column]} batch={batch[row, column]}")
+
+    return {
+        'emails': size,
+        'nlp_features': email_predictor.NLP_AVAILABLE,
+        'scalar_seconds': round(scalar_seconds, 3),
+        'batch_seconds': round(batch_seconds, 3),
+        'speedup': round(scalar_seconds / batch_seconds, 1) if batch_seconds else None,
+        'parity_mismatches': int(len(mismatches)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Feature extraction parity and speed benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--parity-rows', type=int, default=None,
+                        help='Limit the value-for-value comparison to the first N rows')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as model_dir:
+        for size in args.sizes:
+            result = run(size, model_dir, args.parity_rows or size)
+            results.append(result)
+            print(json.dumps(result))
+
+    if any(result['parity_mismatches'] for result in results):
+        print("FAILED: batch features differ from extract_features")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Compiled Inference Benchmark
+Checks that compiled models match sklearn's probabilities within tolerance and
+measures per-email prediction latency with and without compiled inference.
+
+Usage: python tests/performance/inference_benchmark.py [--emails 5000] [--predictions 500]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'ml'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmark_support import InMemoryDatabase, generate_emails, write_config  # noqa: E402
+from email_predictor import EmailPredictor  # noqa: E402
+
+
+def make_predictor(emails, model_dir: str, compiled: bool) -> EmailPredictor:
+    config_path = write_config(model_dir, f'config_{int(compiled)}.json', redis_enabled=False,
+                               feature_store_enabled=False, compiled_inference=compiled)
+    return EmailPredictor(config_path, db=InMemoryDatabase(emails))
+
+
+def run(model_name: str, emails, features, labels, predictions: int, model_dir: str):
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    trainer = make_predictor(emails, model_dir, compiled=True)
+    columns = trainer.feature_columns
+    X = features[:, [trainer._training_columns().index(name) for name in columns]]
+    X_train, X_test, y_train, _ = train_test_split(X, labels, test_size=0.2, random_state=42)
+
+    label_encoder = LabelEncoder().fit(labels)
+    scaler = StandardScaler().fit(X_train) if model_name in EmailPredictor.SCALED_MODELS else None
+    model = trainer._candidate_models(worker_budget=1)[model_name]
+    model.fit(scaler.transform(X_train) if scaler else X_train, label_encoder.transform(y_train))
+
+    compiled = trainer._compile_model(
+        model, scaler, label_encoder, X_test, scaler.transform(X_test) if scaler else X_test
+    )
+    trainer.model_registry.save('global', {
+        'model': model,
+        'scaler': scaler,
+        'label_encoder': label_encoder,
+        'feature_columns': list(columns),
+        'model_type': model_name,
+        'accuracy': 0.0,
+        'compiled': compiled,
+    }, model_name)
+
+    sample = emails[:predictions]
+    result = {
+        'model': model_name,
+        'compiled': compiled is not None,
+        'max_probability_difference': compiled['max_difference'] if compiled else None,
+    }
+    outputs = {}
+    for mode in (False, True):
+        predictor = make_predictor(emails, model_dir, compiled=mode)
+        predictor.predict_email_action(sample[0])  # load the model outside the timing
+
+        latencies = []
+        outputs[mode] = []
+        for email in sample:
+            start = time.perf_counter()
+            outputs[mode].append(predictor.predict_email_action(email))
+            latencies.append(time.perf_counter() - start)
+
+        key = 'compiled' if mode else 'sklearn'
+        result[f'{key}_p50_ms'] = round(float(np.percentile(latencies, 50)) * 1000, 3)
+        result[f'{key}_p99_ms'] = round(float(np.percentile(latencies, 99)) * 1000, 3)
+
+    result['prediction_mismatches'] = sum(
+        a['predicted_action'] != b['predicted_action'] for a, b in zip(outputs[False], outputs[True])
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compiled inference parity and latency benchmark')
+    parser.add_argument('--emails', type=int, default=5000, help='Synthetic emails to train on')
+    parser.add_argument('--predictions', type=int, default=500, help='Single-email predictions to time')
+    parser.add_argument('--models', nargs='+', default=['random_forest', 'gradient_boosting',
+                                                        'logistic_regression', 'neural_network'])
+    args = parser.parse_args()
+
+    emails = generate_emails(args.emails)
+    results = []
+    with tempfile.TemporaryDirectory() as model_dir:
+        features = make_predictor(emails, model_dir, compiled=True).extract_features_batch(emails)
+        labels = np.array([email['action_taken'] for email in emails])
+
+        for model_name in args.models:
+            with tempfile.TemporaryDirectory(dir=model_dir) as run_dir:
+                result = run(model_name, emails, features, labels, args.predictions, run_dir)
+            results.append(result)
+            print(json.dumps(result))
+
+    if any(not result['compiled'] or result['prediction_mismatches'] for result in results):
+        print("FAILED: compiled inference is missing or disagrees with sklearn")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
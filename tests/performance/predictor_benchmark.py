@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Predictor Benchmark Suite
+Measures feature extraction, training data preparation, training per
+estimator, single-email prediction and model save/load on seeded synthetic
+corpora, with in-process MySQL and Redis stand-ins. Results are written as
+JSON and can be compared against a previous run to catch regressions.
+
+Usage: python tests/performance/predictor_benchmark.py [--sizes 2000 10000] [--output results.json]
+                                                       [--compare baseline.json] [--threshold 1.25]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'ml'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmark_support import InMemoryDatabase, InMemoryRedis, generate_emails, write_config  # noqa: E402
+from email_predictor import EmailPredictor  # noqa: E402
+from model_registry import ModelRegistry  # noqa: E402
+
+MODELS = ['random_forest', 'gradient_boosting', 'logistic_regression', 'neural_network']
+
+
+def percentiles(seconds, scale: float = 1000.0, digits: int = 3):
+    """p50/p99/mean of timings, in milliseconds by default"""
+    values = np.asarray(seconds) * scale
+    return {
+        'p50': round(float(np.percentile(values, 50)), digits),
+        'p99': round(float(np.percentile(values, 99)), digits),
+        'mean': round(float(values.mean()), digits),
+    }
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def make_predictor(db, work_dir: str, **config) -> EmailPredictor:
+    config.setdefault('min_training_samples', 100)
+    config.setdefault('training_workers', 1)
+    return EmailPredictor(write_config(work_dir, **config), db=db, redis_client=InMemoryRedis())
+
+
+def benchmark_features(emails, work_dir: str, sample: int):
+    # The analysis cache would turn repeated passes into lookups
+    predictor = make_predictor(InMemoryDatabase(emails), work_dir, analysis_cache_enabled=False,
+                               feature_store_enabled=False)
+    predictor.sender_index.warm()
+
+    latencies = []
+    for email in emails[:sample]:
+        _, seconds = timed(predictor.extract_features, email)
+        latencies.append(seconds)
+
+    _, batch_seconds = timed(predictor.extract_features_batch, emails)
+    return {
+        'extract_features_ms': percentiles(latencies),
+        'extract_features_batch_seconds': round(batch_seconds, 3),
+        'extract_features_batch_emails_per_second': round(len(emails) / batch_seconds),
+    }
+
+
+def benchmark_training_data(emails, work_dir: str):
+    predictor = make_predictor(InMemoryDatabase(emails), work_dir)
+    (X, _), cold_seconds = timed(predictor.prepare_training_data)
+    _, warm_seconds = timed(predictor.prepare_training_data)
+    return {
+        'rows': len(X),
+        'cold_seconds': round(cold_seconds, 3),
+        'feature_store_warm_seconds': round(warm_seconds, 3),
+    }
+
+
+def benchmark_model(model_name: str, emails, work_dir: str, sample: int):
+    db = InMemoryDatabase(emails)
+    predictor = make_predictor(db, work_dir, candidate_models=[model_name])
+    scores, train_seconds = timed(predictor.train_models)
+
+    predictor.predict_email_action(emails[0])
+    latencies = []
+    for email in emails[:sample]:
+        _, seconds = timed(predictor.predict_email_action, email)
+        latencies.append(seconds)
+
+    # Save and cold-load through a second registry, as another process would
+    model_data = predictor.model_registry.get('global')
+    _, save_seconds = timed(predictor.model_registry.save, 'global', model_data, model_name)
+    registry = ModelRegistry(work_dir, logger=predictor.logger)
+    _, load_seconds = timed(registry.get, 'global')
+
+    return {
+        'accuracy': round(scores.get(model_name, 0.0), 4),
+        'train_seconds': round(train_seconds, 3),
+        'predict_email_action_ms': percentiles(latencies),
+        'model_bytes': registry.entries()['global']['size'],
+        'save_seconds': round(save_seconds, 4),
+        'load_seconds': round(load_seconds, 4),
+    }
+
+
+def run(size: int, models, sample: int, seed: int):
+    emails = generate_emails(size, seed=seed)
+    result = {'emails': size}
+    with tempfile.TemporaryDirectory() as work_dir:
+        result['features'] = benchmark_features(emails, work_dir, sample)
+    with tempfile.TemporaryDirectory() as work_dir:
+        result['prepare_training_data'] = benchmark_training_data(emails, work_dir)
+    result['models'] = {}
+    for model_name in models:
+        with tempfile.TemporaryDirectory() as work_dir:
+            result['models'][model_name] = benchmark_model(model_name, emails, work_dir, sample)
+    return result
+
+
+def flatten(results, prefix: str = ''):
+    """Metric paths to values, e.g. '2000.models.random_forest.train_seconds'"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+
+def compare(current, baseline, threshold: float):
+    """Timings that got slower than threshold times the baseline"""
+    def by_size(document):
+        return {str(result['emails']): result for result in document['results']}
+
+    current_metrics = flatten(by_size(current))
+    baseline_metrics = flatten(by_size(baseline))
+    regressions = []
+    for path, value in current_metrics.items():
+        timing = path.endswith('_seconds') or '_ms.' in path
+        previous = baseline_metrics.get(path)
+        if timing and previous and value > previous * threshold:
+            regressions.append({'metric': path, 'baseline': previous, 'current': value,
+                                'ratio': round(value / previous, 2)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EmailPredictor benchmark suite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 10000], help='Corpus sizes to run')
+    parser.add_argument('--models', nargs='+', default=MODELS, choices=MODELS, help='Estimators to train')
+    parser.add_argument('--sample', type=int, default=500, help='Emails timed one at a time per measurement')
+    parser.add_argument('--seed', type=int, default=42, help='Corpus seed')
+    parser.add_argument('--output', help='Write the results document to this JSON file')
+    parser.add_argument('--compare', help='Baseline results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Slowdown ratio against the baseline that counts as a regression')
+    args = parser.parse_args()
+
+    import sklearn
+
+    document = {
+        'started_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'parameters': {'seed': args.seed, 'sample': args.sample, 'models': args.models},
+        'results': [],
+    }
+    for size in args.sizes:
+        result = run(size, args.models, min(args.sample, size), args.seed)
+        document['results'].append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(document, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']} -> "
+                  f"{regression['current']} ({regression['ratio']}x)")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
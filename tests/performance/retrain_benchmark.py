@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Retrain Planner Benchmark
+Finds the users due for retraining with the one grouped plan query and with
+two queries per user (the checks retrain_if_needed made before the planner),
+over a database with a simulated round trip, and checks both pick the same
+users. Then runs a real retrain-all over a few users with and without a time
+budget, and retrain_if_needed for one user.
+
+Usage: python tests/performance/retrain_benchmark.py [--users 200] [--emails 40000] [--db-latency-ms 1]
+                                                     [--train-users 6] [--concurrency 2]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'ml'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmark_support import InMemoryDatabase, InMemoryRedis, generate_emails, write_config  # noqa: E402
+from email_predictor import EmailPredictor  # noqa: E402
+
+
+def seed_models(db: InMemoryDatabase, users: int):
+    """Models for two thirds of the users, trained between an hour and three weeks ago"""
+    now = datetime.now()
+    for user_id in [None] + list(range(1, users + 1)):
+        if user_id is None or user_id % 3:
+            age = timedelta(hours=1 + (user_id or 0) % 500)
+            db.ml_models[user_id] = {'model_type': 'random_forest', 'accuracy': 0.9, 'scores': '{}',
+                                     'trained_at': now - age}
+
+
+def per_user_checks(predictor: EmailPredictor, users: int):
+    """The due users found one user at a time, as retrain_if_needed used to"""
+    due = set()
+    now = datetime.now()
+    for user_id in range(1, users + 1):
+        result = predictor.db.query(
+            "SELECT trained_at FROM ml_models WHERE user_id = %s ORDER BY trained_at DESC LIMIT 1",
+            (user_id,), fetch='one'
+        )
+        if result and (now - result[0]).total_seconds() < predictor.config['model_update_interval']:
+            continue
+        new_emails = predictor.db.query(
+            "SELECT COUNT(*) FROM emails WHERE user_id = %s AND received_at > %s",
+            (user_id, result[0] if result else now - timedelta(days=30)), fetch='one'
+        )[0]
+        if new_emails >= predictor.config.get('retrain_min_new_emails', 100):
+            due.add(user_id)
+    return due
+
+
+def planning(args):
+    emails = generate_emails(args.emails, users=args.users)
+    db = InMemoryDatabase(emails, latency=args.db_latency_ms / 1000)
+    seed_models(db, args.users)
+    with tempfile.TemporaryDirectory() as model_dir:
+        predictor = EmailPredictor(write_config(model_dir), db=db, redis_client=InMemoryRedis())
+
+        queries = db.queries
+        start = time.perf_counter()
+        plan = predictor.plan_retraining()
+        plan_seconds = time.perf_counter() - start
+        plan_queries = db.queries - queries
+
+        queries = db.queries
+        start = time.perf_counter()
+        due = per_user_checks(predictor, args.users)
+        check_seconds = time.perf_counter() - start
+        check_queries = db.queries - queries
+
+    planned_users = {entry['user_id'] for entry in plan if entry['user_id'] is not None}
+    return {
+        'users': args.users,
+        'plan': {'queries': plan_queries, 'seconds': round(plan_seconds, 3), 'due': len(plan),
+                 'includes_global': any(entry['user_id'] is None for entry in plan)},
+        'per_user_checks': {'queries': check_queries, 'seconds': round(check_seconds, 3), 'due': len(due)},
+        'same_users': planned_users == due,
+        'speedup': round(check_seconds / plan_seconds, 1),
+        'top_of_plan': [{key: entry[key] for key in ('user_id', 'action', 'new_emails', 'priority')}
+                        for entry in plan[:3]],
+    }
+
+
+def retraining(args, time_budget=None):
+    emails = generate_emails(args.train_users * 600, users=args.train_users)
+    with tempfile.TemporaryDirectory() as model_dir:
+        config_path = write_config(model_dir, min_training_samples=100, training_workers=1,
+                                   candidate_models=['random_forest'])
+        predictor = EmailPredictor(config_path, db=InMemoryDatabase(emails), redis_client=InMemoryRedis())
+        user_id = predictor.plan_retraining()[-1]['user_id']
+        summary = predictor.retrain_all(args.concurrency, time_budget)
+        summary['models'] = len(predictor.model_registry.entries())
+        summary['due_after'] = len(predictor.plan_retraining())
+        # The lowest-priority model is the one a budgeted run leaves behind
+        summary['retrain_if_needed_afterwards'] = predictor.retrain_if_needed(user_id)
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Retrain planner benchmark')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--emails', type=int, default=40000)
+    parser.add_argument('--db-latency-ms', type=float, default=1.0, help='Simulated database round trip')
+    parser.add_argument('--train-users', type=int, default=6, help='Users trained for real by retrain-all')
+    parser.add_argument('--concurrency', type=int, default=2)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'planning': planning(args),
+        'retrain_all': retraining(args),
+        'retrain_all_with_budget': retraining(args, time_budget=1.0),
+    }, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
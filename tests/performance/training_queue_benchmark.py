@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Training Queue Benchmark
+Runs queued per-user jobs on 1..N workers sharing one Redis and reports jobs
+per second and scaling efficiency, checks that no user is ever trained by two
+workers at once (while the same users keep being re-enqueued), measures how
+long a job whose worker died takes to be picked up again, and trains the
+global model through a worker to check that it is published, and that it is
+not when the worker loses its lease mid-run.
+
+Each worker stands for one node; a job sleeps for --job-ms, so the scaling
+shown is that of the queue, not of the CPUs this runs on.
+
+Usage: python tests/performance/training_queue_benchmark.py [--users 200] [--job-ms 50] [--redis-latency-ms 0.5]
+                                                            [--workers 1 2 4 8]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'ml'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmark_support import InMemoryDatabase, InMemoryRedis, generate_emails, write_config  # noqa: E402
+from email_predictor import EmailPredictor  # noqa: E402
+from training_queue import TrainingQueue, TrainingWorker  # noqa: E402
+
+
+class FakeTrainer:
+    """Sleeps like a training run and records users trained by two workers at once"""
+
+    def __init__(self, job_seconds: float):
+        self.job_seconds = job_seconds
+        self.running = set()
+        self.overlaps = 0
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, user_id, action, lost=None):
+        with self._lock:
+            self.overlaps += user_id in self.running
+            self.running.add(user_id)
+            self.runs += 1
+        time.sleep(self.job_seconds)
+        with self._lock:
+            self.running.discard(user_id)
+        return {'random_forest': 0.9}
+
+
+def run_workers(redis_client, trainer, workers: int, **queue_options):
+    threads = [
+        threading.Thread(target=TrainingWorker(
+            TrainingQueue(redis_client, **queue_options), trainer, poll_interval=0.01, worker_id=f"bench-{i}"
+        ).run, kwargs={'stop_when_idle': True})
+        for i in range(workers)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def scaling(args):
+    results = []
+    single_rate = None
+    for workers in args.workers:
+        redis_client = InMemoryRedis(args.redis_latency_ms / 1000)
+        TrainingQueue(redis_client).enqueue_many(range(1, args.users + 1))
+        trainer = FakeTrainer(args.job_ms / 1000)
+        seconds = run_workers(redis_client, trainer, workers)
+        rate = trainer.runs / seconds
+        single_rate = single_rate or rate / workers
+        results.append({
+            'workers': workers,
+            'jobs': trainer.runs,
+            'jobs_per_second': round(rate, 1),
+            'scaling_efficiency': round(rate / (single_rate * workers), 3),
+            'concurrent_trainings_of_one_user': trainer.overlaps,
+        })
+    return results
+
+
+def exclusivity(args):
+    """Workers drain a queue that keeps re-enqueueing a few hot users"""
+    redis_client = InMemoryRedis(args.redis_latency_ms / 1000)
+    queue = TrainingQueue(redis_client)
+    hot_users = list(range(1, 6))
+    trainer = FakeTrainer(args.job_ms / 1000)
+    stop = threading.Event()
+
+    def reenqueue():
+        rnd = random.Random(3)
+        while not stop.wait(args.job_ms / 4000):
+            queue.enqueue(rnd.choice(hot_users))
+
+    feeder = threading.Thread(target=reenqueue)
+    feeder.start()
+    workers = [TrainingWorker(TrainingQueue(redis_client), trainer, poll_interval=0.005) for _ in range(8)]
+    threads = [threading.Thread(target=worker.run) for worker in workers]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.job_ms / 1000 * 40)
+    stop.set()
+    feeder.join()
+    for worker in workers:
+        worker.stop()
+    for thread in threads:
+        thread.join()
+    return {'runs': trainer.runs, 'concurrent_trainings_of_one_user': trainer.overlaps}
+
+
+def recovery(args):
+    """A worker claims a job and dies; another worker finds it once the lease expires"""
+    lease_seconds = 0.5
+    redis_client = InMemoryRedis(args.redis_latency_ms / 1000)
+    queue = TrainingQueue(redis_client, lease_seconds=lease_seconds)
+    queue.enqueue(42)
+    dead = queue.claim('crashed-worker')
+    died_at = time.perf_counter()
+
+    trainer = FakeTrainer(0.0)
+    worker = TrainingWorker(TrainingQueue(redis_client, lease_seconds=lease_seconds), trainer, poll_interval=0.02)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    while not trainer.runs and time.perf_counter() - died_at < lease_seconds * 10:
+        time.sleep(0.01)
+    picked_up = time.perf_counter() - died_at
+    worker.stop()
+    thread.join()
+    return {
+        'lease_seconds': lease_seconds,
+        'seconds_until_rerun': round(picked_up, 3),
+        'rerun': trainer.runs == 1,
+        'late_completion_rejected': not queue.complete(dead),
+        'queue': queue.stats(),
+    }
+
+
+def publish():
+    """A worker trains the global model and the registry serves it"""
+    with tempfile.TemporaryDirectory() as model_dir:
+        config_path = write_config(model_dir, min_training_samples=100, training_workers=1,
+                                   candidate_models=['random_forest'])
+        redis_client = InMemoryRedis()
+        trainer = EmailPredictor(config_path, db=InMemoryDatabase(generate_emails(1000)), redis_client=redis_client)
+        queue = trainer.training_queue()
+        queue.enqueue(None, 'train')
+        processed = TrainingWorker(queue, trainer.run_training_job).run(stop_when_idle=True)
+
+        server = EmailPredictor(config_path, db=InMemoryDatabase([]), redis_client=redis_client)
+        model_key, _ = server._resolve_model(None)
+        return {'processed': processed, 'served_model': model_key, 'queue': queue.stats()}
+
+
+def lost_lease():
+    """A worker whose lease is taken over mid-run abandons the job instead of saving its model"""
+    with tempfile.TemporaryDirectory() as model_dir:
+        config_path = write_config(model_dir, min_training_samples=100, training_workers=1,
+                                   candidate_models=['random_forest'], training_lease_seconds=0.3)
+        redis_client = InMemoryRedis()
+        trainer = EmailPredictor(config_path, db=InMemoryDatabase(generate_emails(1000)), redis_client=redis_client)
+        queue = trainer.training_queue()
+        # A later 'update' must not turn the waiting full retrain into an incremental one
+        for action in ('update', 'train', 'update'):
+            queue.enqueue(None, action)
+        queued_action = redis_client.hget(queue.actions_key, 'global')
+
+        # Another process takes the lease over, as after a stall longer than the lease
+        takeover = threading.Timer(0.05, redis_client.set, (queue._lease_key('global'), 'other-worker'))
+        takeover.start()
+        processed = TrainingWorker(queue, trainer.run_training_job).run(max_jobs=1)
+        takeover.join()
+        return {'queued_action': queued_action, 'processed': processed,
+                'models_saved': len(trainer.model_registry.entries())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distributed training queue benchmark')
+    parser.add_argument('--users', type=int, default=200, help='Jobs queued for the scaling runs')
+    parser.add_argument('--job-ms', type=float, default=50, help='Simulated training time per job')
+    parser.add_argument('--redis-latency-ms', type=float, default=0.5, help='Simulated Redis round trip')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'scaling': scaling(args),
+        'exclusivity': exclusivity(args),
+        'recovery': recovery(args),
+        'publish': publish(),
+        'lost_lease': lost_lease(),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+ROTZ Email Butler - Feature Parity Test
+extract_features_batch must return exactly what extract_features returns for
+the same emails, column for column, including sparse and unusual ones.
+
+Usage: python -m pytest tests/test_feature_parity.py
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import email_predictor
+
+EDGE_CASES = [
+    {'id': 9001, 'subject': 'URGENT: act now!!!', 'body': 'WIN a FREE prize, click here $$$ ' * 20,
+     'sender': 'promo1234567890@deals.example', 'recipients': [], 'attachments': [],
+     'received_at': '2024-03-01 23:59:59'},
+    {'id': 9002, 'received_at': datetime(2024, 1, 1, 0, 0)},
+    {'id': 9003, 'subject': '', 'body': '', 'sender': 'Ann <ann@example.com>',
+     'recipients': ['a@example.com', 'b@example.com'], 'attachments': ['a.pdf', 'b.xlsx'],
+     'received_at': '2024-06-15T08:30:00'},
+    {'id': 9004, 'subject': 'Réunion demain — ordre du jour', 'body': 'Bonjour, voir pièce jointe. Merci !',
+     'sender': 'Zoë@exemple.fr', 'recipients': ['me@example.com'], 'attachments': [],
+     'received_at': '2024-05-05T10:00:00+02:00'},
+    {'id': 9005, 'subject': 'nonurgent asap?', 'body': 'deadline\n\nimportant\timmediately. ' * 3,
+     'sender': 'boss@example.com', 'recipients': ['me@example.com'], 'attachments': ['x'],
+     'received_at': '2024-02-29 12:00:00'},
+]
+
+
+@pytest.fixture
+def predictor(make_predictor):
+    # Without the analysis cache both paths compute every value themselves
+    return make_predictor(analysis_cache_enabled=False, feature_store_enabled=False)
+
+
+@pytest.fixture(params=[False, True], ids=['uncached', 'analysis-cache'])
+def nlp_predictor(request, monkeypatch, make_predictor):
+    """Predictor with the NLP columns enabled; their extractors need no NLP backend"""
+    monkeypatch.setattr(email_predictor, 'NLP_AVAILABLE', True)
+    return make_predictor(analysis_cache_enabled=request.param, feature_store_enabled=False)
+
+
+def scalar_matrix(predictor, emails, columns):
+    return np.array([[features[name] for name in columns] for features in map(predictor.extract_features, emails)],
+                    dtype=np.float64)
+
+
+def assert_parity(predictor, emails, columns):
+    scalar = scalar_matrix(predictor, emails, columns)
+    batch = predictor.extract_features_batch(emails, columns)
+
+    assert batch.shape == scalar.shape
+    mismatches = [(emails[row]['id'], columns[column]) for row, column in np.argwhere(batch != scalar)]
+    assert not mismatches, f"batch features differ from extract_features: {mismatches[:10]}"
+
+
+def test_batch_matches_scalar(predictor, emails):
+    assert_parity(predictor, emails[:200] + EDGE_CASES, predictor._training_columns())
+
+
+def test_batch_matches_scalar_with_nlp(nlp_predictor, emails):
+    columns = nlp_predictor._training_columns()
+    assert set(nlp_predictor.NLP_FEATURE_COLUMNS) <= set(columns)
+    assert_parity(nlp_predictor, emails[:200] + EDGE_CASES, columns)
+
+
+def test_column_subset_matches_scalar(predictor, emails):
+    columns = [name for name in predictor._training_columns()[::-1] if name != 'hour_of_day'][:5]
+    assert_parity(predictor, emails[:50] + EDGE_CASES, columns)